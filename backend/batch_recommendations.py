@@ -0,0 +1,480 @@
+"""
+Batch recommendation generation for every user with a CV analysis.
+
+Instead of one generate_hybrid_recommendations call per user (each refetching
+the whole catalog and all interactions), the catalog is loaded once, the
+keywords of all users are vectorised into one sparse user x term matrix and
+users x listings scores are computed with chunked sparse products. The top-N
+of every user is written back in a single bulk write.
+
+Scores follow the same recipe as the per-user path: field-weighted TF-IDF cosine with the
+country/platform multipliers, blended with item-based collaborative scores
+(see item_similarity.py) after per-user min-max normalisation.
+
+Between two runs, score_new_listings() merges freshly scraped listings:
+only the new listings are scored against cached user keyword vectors, and
+a listing is stored for a user when it beats their current Nth-best score.
+
+Run once from the command line:
+    python batch_recommendations.py [--top-n 20] [--alpha 0.6]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from db import get_db_pool, close_db_pool
+from database_schema import get_scoring_listings, upsert_recommendations
+from item_similarity import fetch_saved_interactions, get_item_neighbor_index
+from listing_catalog import get_listing_catalog, refresh_listing_catalog
+from listing_vectors import field_weights, get_listing_store, init_listing_store, refresh_listing_store, weighted_queries
+
+logger = logging.getLogger("batch_recommendations")
+
+# Users scored per sparse product; bounds the dense (chunk x listings) score block
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "256"))
+BATCH_TOP_N = int(os.getenv("BATCH_TOP_N", "20"))
+BATCH_ALPHA = float(os.getenv("BATCH_ALPHA", "0.6"))
+# Seconds between two runs of the scheduled job (0 disables the job)
+BATCH_RECOMMENDATIONS_INTERVAL_SECONDS = float(os.getenv("BATCH_RECOMMENDATIONS_INTERVAL_SECONDS", "86400"))
+# Seconds the user profiles of incremental scoring are reused before being rebuilt
+INCREMENTAL_PROFILES_TTL_SECONDS = float(os.getenv("INCREMENTAL_PROFILES_TTL_SECONDS", "3600"))
+
+
+def _keywords_text(raw_keywords) -> str:
+    """Keywords of a cv_analysis row (JSON list, possibly as a string) as one string."""
+    if isinstance(raw_keywords, str):
+        try:
+            raw_keywords = json.loads(raw_keywords)
+        except json.JSONDecodeError:
+            return ""
+    if not isinstance(raw_keywords, list):
+        return ""
+    return " ".join(str(k) for k in raw_keywords)
+
+
+def _weights_dict(raw_weights) -> dict:
+    if isinstance(raw_weights, str):
+        try:
+            raw_weights = json.loads(raw_weights)
+        except json.JSONDecodeError:
+            return {}
+    return raw_weights if isinstance(raw_weights, dict) else {}
+
+
+def _multiplier_matrix(user_ids: Sequence[int], prefs: Dict[int, dict], field: str, categories: pd.Index) -> np.ndarray:
+    """(users x categories) multipliers from each user's `field` weights, 1.0 by default."""
+    multipliers = np.ones((len(user_ids), len(categories) + 1), dtype=np.float32)  # last column: missing value
+    positions = {c: i for i, c in enumerate(categories)}
+    for row, user_id in enumerate(user_ids):
+        for category, weight in _weights_dict((prefs.get(user_id) or {}).get(field)).items():
+            col = positions.get(category)
+            if col is not None and weight is not None:
+                multipliers[row, col] = weight
+    return multipliers
+
+
+def _category_codes(values: pd.Series):
+    """(codes, categories) of a listing column; missing values get the extra last code."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Catalog columns are already encoded
+        codes, categories = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, categories = pd.factorize(values)
+    return np.where(codes < 0, len(categories), codes), categories
+
+
+def _content_block(user_vectors, chunk_users, prefs, field_matrix_t, countries, platforms) -> np.ndarray:
+    """Dense (users x listings) field-weighted TF-IDF cosine with the country/platform multipliers, capped at 1."""
+    country_codes, country_index = countries
+    platform_codes, platform_index = platforms
+    weights = np.vstack([field_weights(prefs.get(user_id)) for user_id in chunk_users])
+    content = (weighted_queries(user_vectors, weights) @ field_matrix_t).toarray()
+    country_mult = _multiplier_matrix(chunk_users, prefs, "country_weights", country_index)[:, country_codes]
+    platform_mult = _multiplier_matrix(chunk_users, prefs, "platform_weights", platform_index)[:, platform_codes]
+    return np.minimum(content * country_mult * platform_mult, 1.0)
+
+
+def _normalize_rows(scores: np.ndarray) -> np.ndarray:
+    """Row-wise equivalent of recommendation.normalize_scores, skipped for rows without positive score."""
+    lo = scores.min(axis=1, keepdims=True)
+    hi = scores.max(axis=1, keepdims=True)
+    span = hi - lo
+    flat = span == 0
+    normalized = np.divide(scores - lo, span, out=np.zeros_like(scores), where=~flat)
+    normalized = np.where(flat, np.where(lo != 0, 0.5, 0.0), normalized)
+    has_positive = (scores > 0).any(axis=1, keepdims=True)
+    return np.where(has_positive, normalized, scores)
+
+
+def score_users_batch(
+    store,
+    listings_df: pd.DataFrame,
+    user_ids: Sequence[int],
+    keyword_texts: Sequence[str],
+    prefs: Dict[int, dict],
+    saves: Optional[sp.csr_matrix] = None,
+    item_similarity: Optional[sp.csr_matrix] = None,
+    alpha: float = BATCH_ALPHA,
+    top_n: int = BATCH_TOP_N,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+) -> List[tuple]:
+    """
+    Top-N (user_id, listing_id, score) rows for every user.
+
+    `listings_df` is aligned on `store.listing_ids`; `saves` is the binary
+    (users x listings) matrix in the same orders, `item_similarity` the
+    (listings x listings) neighbour matrix. Saved listings are never
+    recommended again.
+    """
+    listing_ids = store.listing_ids
+    field_matrix_t = store.field_matrix.T.tocsr()
+    user_vectors = store.vectorizer.transform(keyword_texts).astype(np.float32)
+
+    countries = _category_codes(listings_df["country"])
+    platforms = _category_codes(listings_df["platform"])
+
+    use_collab = saves is not None and item_similarity is not None and saves.nnz > 0
+    has_saves = saves is not None and saves.nnz > 0
+    results = []
+    for start in range(0, len(user_ids), chunk_size):
+        stop = min(start + chunk_size, len(user_ids))
+        chunk_users = user_ids[start:stop]
+
+        content = _content_block(user_vectors[start:stop], chunk_users, prefs, field_matrix_t, countries, platforms)
+        hybrid = alpha * _normalize_rows(content)
+
+        if use_collab:
+            collab = (saves[start:stop] @ item_similarity).toarray()
+            hybrid += (1 - alpha) * _normalize_rows(collab)
+        if has_saves:
+            # Already saved listings are not recommended again, with or without a neighbour table
+            saved_rows, saved_cols = saves[start:stop].nonzero()
+            hybrid[saved_rows, saved_cols] = -np.inf
+
+        n = min(top_n, hybrid.shape[1])
+        if n == 0:
+            continue
+        top = np.argpartition(-hybrid, n - 1, axis=1)[:, :n]
+        top_scores = np.take_along_axis(hybrid, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        for row, user_id in enumerate(chunk_users):
+            for col, score in zip(top[row], top_scores[row]):
+                if score > 1e-6:
+                    results.append((int(user_id), int(listing_ids[col]), float(score)))
+    return results
+
+
+async def fetch_user_profiles():
+    """(user_ids, keyword texts) of every user with a non-empty CV analysis, plus all preferences by user."""
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        cv_rows = await conn.fetch("SELECT user_id, keywords FROM cv_analysis")
+        pref_rows = await conn.fetch("""
+            SELECT user_id, domain_weight, skills_weight, title_weight, description_weight,
+                   country_weights, platform_weights
+            FROM user_preferences
+        """)
+    user_ids, texts = [], []
+    for row in cv_rows:
+        text = _keywords_text(row["keywords"])
+        if text.strip():
+            user_ids.append(row["user_id"])
+            texts.append(text)
+    prefs = {row["user_id"]: dict(row) for row in pref_rows}
+    return user_ids, texts, prefs
+
+
+async def save_batch_recommendations(rows: List[tuple]) -> int:
+    """Write all (user_id, listing_id, score) rows at once (COPY + merge, in one transaction)."""
+    if not rows:
+        return 0
+    recommended_at = datetime.datetime.now(datetime.timezone.utc)
+    # Rows already stored keep their viewed/saved status
+    return await upsert_recommendations([(u, i, s, recommended_at) for u, i, s in rows], keep_flags=True)
+
+
+async def run_batch_recommendations(alpha: float = BATCH_ALPHA, top_n: int = BATCH_TOP_N, chunk_size: int = BATCH_CHUNK_SIZE) -> int:
+    """Recompute and store the top-N recommendations of every user. Returns the number of rows written."""
+    start = time.perf_counter()
+    catalog = await refresh_listing_catalog()
+    if not len(catalog):
+        logger.warning("No active listings: batch recommendations skipped.")
+        return 0
+    store = await refresh_listing_store()
+    listings_df = await _listing_frame(store.listing_ids)
+
+    user_ids, texts, prefs = await fetch_user_profiles()
+    if not user_ids:
+        logger.warning("No user with a CV analysis: batch recommendations skipped.")
+        return 0
+
+    # Saves are needed even without a neighbour table: saved listings are excluded
+    saves, item_similarity = None, None
+    interactions = await fetch_saved_interactions()
+    user_rows = {u: r for r, u in enumerate(user_ids)}
+    listing_cols = store.rows_for([i for _, i in interactions])
+    pairs = [(user_rows[u], c) for (u, _), c in zip(interactions, listing_cols) if u in user_rows and c >= 0]
+    if pairs:
+        rows, cols = np.array(pairs).T
+        saves = sp.csr_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (rows, cols)),
+            shape=(len(user_ids), len(store)),
+        )
+        saves.data[:] = 1.0
+    index = get_item_neighbor_index()
+    if index is not None:
+        item_similarity = index.to_matrix(store.listing_ids)
+    else:
+        logger.warning("Item neighbour table not built: batch scores are content-based only.")
+
+    results = await asyncio.to_thread(
+        score_users_batch, store, listings_df, user_ids, texts, prefs,
+        saves, item_similarity, alpha, top_n, chunk_size,
+    )
+    scored_at = time.perf_counter()
+    written = await save_batch_recommendations(results)
+    logger.info(
+        f"Batch recommendations: {len(user_ids)} users x {len(store)} listings, {written} rows written, "
+        f"scoring {scored_at - start:.2f}s, writing {time.perf_counter() - scored_at:.2f}s"
+    )
+    return written
+
+
+# --- Incremental scoring of newly scraped listings ---
+
+@dataclass
+class UserProfiles:
+    """
+    Keyword vectors of every user in the vocabulary of one listing store.
+
+    `content_lo` / `content_hi` are each user's min and max content score
+    over the catalog, i.e. the range the batch min-max normalisation used,
+    so that new listings can be scored on the same scale as stored rows.
+    """
+    user_ids: List[int]
+    vectors: sp.csr_matrix
+    prefs: Dict[int, dict]
+    content_lo: np.ndarray
+    content_hi: np.ndarray
+    vectorizer: Any
+    built_at: float
+
+
+_profiles: Optional[UserProfiles] = None
+_incremental_lock = asyncio.Lock()
+
+
+def build_user_profiles(
+    store,
+    listings_df: pd.DataFrame,
+    user_ids: Sequence[int],
+    keyword_texts: Sequence[str],
+    prefs: Dict[int, dict],
+    chunk_size: int = BATCH_CHUNK_SIZE,
+) -> UserProfiles:
+    """Vectorise every user and record their content-score range over the catalog (`listings_df` aligned on the store)."""
+    user_vectors = store.vectorizer.transform(keyword_texts).astype(np.float32).tocsr()
+    field_matrix_t = store.field_matrix.T.tocsr()
+    countries = _category_codes(listings_df["country"])
+    platforms = _category_codes(listings_df["platform"])
+    lo = np.zeros(len(user_ids), dtype=np.float32)
+    hi = np.zeros(len(user_ids), dtype=np.float32)
+    for start in range(0, len(user_ids), chunk_size):
+        stop = min(start + chunk_size, len(user_ids))
+        content = _content_block(user_vectors[start:stop], user_ids[start:stop], prefs, field_matrix_t, countries, platforms)
+        if content.shape[1]:
+            lo[start:stop] = content.min(axis=1)
+            hi[start:stop] = content.max(axis=1)
+    return UserProfiles(list(user_ids), user_vectors, prefs, lo, hi, store.vectorizer, time.time())
+
+
+def _normalize_against(scores: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """_normalize_rows of new columns, using the (users x 1) score range of the existing catalog."""
+    span = hi - lo
+    normalized = np.divide(scores - lo, span, out=np.zeros_like(scores), where=span > 0)
+    normalized = np.where(span > 0, np.clip(normalized, 0.0, 1.0), np.where(lo != 0, 0.5, 0.0))
+    return np.where(hi > 0, normalized, scores)
+
+
+def score_new_listings_batch(
+    profiles: UserProfiles,
+    new_field_matrix: sp.csr_matrix,
+    new_listings_df: pd.DataFrame,
+    thresholds: np.ndarray,
+    alpha: float = BATCH_ALPHA,
+    top_n: int = BATCH_TOP_N,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+) -> List[tuple]:
+    """
+    (user_id, listing_id, score) rows of the new listings that enter a user's top-N.
+
+    `new_field_matrix` holds the per-field TF-IDF rows of the new listings, in the order of
+    `new_listings_df`; `thresholds` is each user's current Nth-best stored
+    score (0 when they have fewer than N). New listings have no collaborative
+    signal yet, so their hybrid score is the normalised content part only.
+    The profiles' score ranges are widened with the new listings.
+    """
+    listing_ids = new_listings_df.index.to_numpy()
+    new_field_matrix_t = new_field_matrix.T.tocsr()
+    countries = _category_codes(new_listings_df["country"])
+    platforms = _category_codes(new_listings_df["platform"])
+    results = []
+    for start in range(0, len(profiles.user_ids), chunk_size):
+        stop = min(start + chunk_size, len(profiles.user_ids))
+        chunk_users = profiles.user_ids[start:stop]
+        content = _content_block(profiles.vectors[start:stop], chunk_users, profiles.prefs, new_field_matrix_t, countries, platforms)
+        lo = profiles.content_lo[start:stop, None]
+        hi = profiles.content_hi[start:stop, None]
+        hybrid = alpha * _normalize_against(content, lo, hi)
+        profiles.content_lo[start:stop] = np.minimum(lo[:, 0], content.min(axis=1))
+        profiles.content_hi[start:stop] = np.maximum(hi[:, 0], content.max(axis=1))
+
+        beats = hybrid > np.maximum(thresholds[start:stop, None], 1e-6)
+        for row in np.flatnonzero(beats.any(axis=1)):
+            cols = np.flatnonzero(beats[row])
+            cols = cols[np.argsort(-hybrid[row, cols], kind="stable")[:top_n]]
+            results.extend((int(chunk_users[row]), int(listing_ids[c]), float(hybrid[row, c])) for c in cols)
+    return results
+
+
+async def fetch_nth_best_scores(top_n: int = BATCH_TOP_N) -> Dict[int, float]:
+    """Each user's Nth-best stored recommendation score (0.0 for users with fewer than N)."""
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT user_id, COUNT(*) AS stored, MIN(similarity_score) AS nth_score
+            FROM (
+                SELECT user_id, similarity_score,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY similarity_score DESC) AS rank
+                FROM user_recommendations
+                WHERE similarity_score IS NOT NULL
+            ) ranked
+            WHERE rank <= $1
+            GROUP BY user_id
+        """, top_n)
+    return {row["user_id"]: (row["nth_score"] if row["stored"] >= top_n else 0.0) for row in rows}
+
+
+async def _listing_frame(listing_ids: np.ndarray) -> pd.DataFrame:
+    """Country and platform of `listing_ids`, in that order: from the listing catalog once loaded, else Postgres."""
+    catalog = get_listing_catalog()
+    if catalog is not None:
+        listings_df = catalog.scoring_frame(catalog.rows(listing_ids))
+    else:
+        listings_df = pd.DataFrame(await get_scoring_listings(listing_ids=listing_ids.tolist())).set_index("id")
+    return listings_df.reindex(listing_ids)
+
+
+async def get_user_profiles(store) -> Optional[UserProfiles]:
+    """Cached profiles for `store`, rebuilt when its vocabulary changed or after INCREMENTAL_PROFILES_TTL_SECONDS."""
+    global _profiles
+    profiles = _profiles
+    if (profiles is not None and profiles.vectorizer is store.vectorizer
+            and time.time() - profiles.built_at < INCREMENTAL_PROFILES_TTL_SECONDS):
+        return profiles
+    user_ids, texts, prefs = await fetch_user_profiles()
+    if not user_ids:
+        return None
+    listings_df = await _listing_frame(store.listing_ids)
+    start = time.perf_counter()
+    _profiles = await asyncio.to_thread(build_user_profiles, store, listings_df, user_ids, texts, prefs)
+    logger.info(f"User profiles built: {len(user_ids)} users, {time.perf_counter() - start:.2f}s")
+    return _profiles
+
+
+async def score_new_listings(listing_ids: Sequence[int], alpha: float = BATCH_ALPHA, top_n: int = BATCH_TOP_N) -> int:
+    """
+    Merge newly scraped listings into the stored recommendations of every user.
+
+    Call after an ingest batch, once the listing store has been refreshed.
+    Only the new listings are scored (O(new listings x users)); a listing is
+    written for a user when it beats their current Nth-best score. Returns
+    the number of rows written.
+    """
+    if not listing_ids:
+        return 0
+    store = get_listing_store()
+    if store is None:
+        logger.warning("Listing vector store not loaded: incremental scoring skipped.")
+        return 0
+    rows = store.rows_for(listing_ids)
+    found = rows >= 0
+    if not found.any():
+        return 0
+    new_ids = np.asarray(listing_ids, dtype=np.int64)[found]
+    async with _incremental_lock:
+        start = time.perf_counter()
+        profiles = await get_user_profiles(store)
+        if profiles is None:
+            return 0
+        new_listings_df = await _listing_frame(new_ids)
+        nth_best = await fetch_nth_best_scores(top_n)
+        thresholds = np.array([nth_best.get(u, 0.0) for u in profiles.user_ids], dtype=np.float32)
+        results = await asyncio.to_thread(
+            score_new_listings_batch, profiles, store.field_matrix[rows[found]], new_listings_df,
+            thresholds, alpha, top_n,
+        )
+        written = await save_batch_recommendations(results)
+    logger.info(
+        f"Incremental recommendations: {len(new_ids)} new listings x {len(profiles.user_ids)} users, "
+        f"{written} rows written, {time.perf_counter() - start:.2f}s"
+    )
+    return written
+
+
+async def ingest_new_listings(listing_ids: Sequence[int]) -> int:
+    """
+    Post-ingest hook of every scraper run (API background task or standalone).
+
+    Brings the listing catalog and the listing vector store in line with the
+    database, then merges `listing_ids` into the stored recommendations with
+    score_new_listings. Returns the number of rows written.
+    """
+    await refresh_listing_catalog()
+    if get_listing_store() is None:
+        # Outside the API nothing has loaded the store yet: start from the copy on disk
+        await init_listing_store()
+    else:
+        await refresh_listing_store()
+    return await score_new_listings(listing_ids)
+
+
+async def run_batch_recommendations_loop(interval: float = BATCH_RECOMMENDATIONS_INTERVAL_SECONDS):
+    """Scheduled job: run the batch every `interval` seconds (first run after one interval)."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_batch_recommendations()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Batch recommendations failed: {e}")
+
+
+async def _main(args):
+    try:
+        await run_batch_recommendations(alpha=args.alpha, top_n=args.top_n, chunk_size=args.chunk_size)
+    finally:
+        await close_db_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute the recommendations of every user.")
+    parser.add_argument("--top-n", type=int, default=BATCH_TOP_N)
+    parser.add_argument("--alpha", type=float, default=BATCH_ALPHA)
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(_main(parser.parse_args()))
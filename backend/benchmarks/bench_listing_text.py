@@ -0,0 +1,98 @@
+"""
+Per-request cost of preparing listing texts for content scoring.
+
+Compares, on a synthetic catalog (default 5000 listings with ~5 KB
+descriptions):
+  - the former DataFrame.apply(axis=1) + safe_get text assembly,
+  - the column-wise listing_texts(),
+  - the deep copy previously made for each scorer,
+  - scoring against a prebuilt ListingVectorStore (texts assembled once at ingest).
+
+Run from the backend directory:
+    python benchmarks/bench_listing_text.py [n_listings] [repeats]
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd
+
+from listing_vectors import ListingVectorStore, listing_texts
+from recommendation import safe_get
+
+WORDS = (
+    "python data machine learning stage internship analyse modèle réseau cloud "
+    "docker api web react finance marketing vision deep traitement image sql "
+    "équipe projet développement logiciel sécurité embarqué statistiques"
+).split()
+
+
+def make_listings(n, description_bytes=5000, seed=42):
+    rng = random.Random(seed)
+
+    def text(n_chars):
+        out, size = [], 0
+        while size < n_chars:
+            w = rng.choice(WORDS)
+            out.append(w)
+            size += len(w) + 1
+        return " ".join(out)
+
+    return [
+        {
+            "id": i,
+            "title": text(40),
+            "company": "Company",
+            "country": rng.choice(["Morocco", "France", "Canada"]),
+            "platform": rng.choice(["LinkedIn", "Indeed", "Glassdoor"]),
+            "description": text(description_bytes) if rng.random() > 0.1 else None,
+            "skills": text(60),
+            "domain": rng.choice(["Data", "Web", "Finance"]),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def timeit(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    listings = make_listings(n)
+    df = pd.DataFrame(listings).set_index("id", drop=False)
+    store = ListingVectorStore.build(listings)
+    ids = df.index.values
+
+    def apply_rows():
+        df.apply(
+            lambda row: f"{safe_get(row, 'title')} {safe_get(row, 'description')} {safe_get(row, 'skills')} {safe_get(row, 'domain')}",
+            axis=1,
+        ).fillna("")
+
+    results = {
+        "apply(axis=1) text assembly": timeit(apply_rows, repeats),
+        "listing_texts() column-wise": timeit(lambda: listing_texts(df), repeats),
+        "DataFrame.copy() x2 (old scorer inputs)": timeit(lambda: (df.copy(), df.copy()), repeats),
+        "store.score() (texts prebuilt at ingest)": timeit(lambda: store.score("python machine learning data", ids), repeats),
+    }
+
+    print(f"{n} listings, median of {repeats} runs")
+    for name, ms in results.items():
+        print(f"  {name:<45} {ms:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Latency percentiles and peak memory of the recommendation paths, without Postgres.
+
+For each catalog size (default 1k, 10k and 100k listings) of seeded
+synthetic data (see synthetic.py), measures per call:
+  - content: compute_content_scores over the whole catalog (TF-IDF store,
+    field weights and country/platform multipliers),
+  - cf_user: compute_collaborative_scores (user-based, sparse),
+  - cf_item: compute_item_collaborative_scores against a neighbour table
+    built from the synthetic saves,
+  - hybrid: generate_hybrid_recommendations end to end (candidate
+    retrieval, scoring pool, ranking, hydration), reading listings from the
+    in-memory listing catalog (from Postgres stand-ins with --no-catalog),
+    with its other database reads and writes served from memory.
+
+Latencies are wall-clock times of --requests calls for distinct sampled
+users (p50/p90/p95/p99/mean/max, ms). Peak memory is the tracemalloc peak
+above the resident baseline over --memory-samples further calls, measured
+separately because tracing slows the calls down. Results are written as
+JSON; --baseline prints the change against an earlier results file.
+
+Run from the backend directory:
+    python benchmarks/bench_recommendations.py [--sizes 1000,10000,100000] [--requests 50]
+        [--output results.json] [--baseline benchmarks/results/<earlier run>.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+import pandas as pd
+import scipy
+import sklearn
+
+import recommendation
+from database_schema import CATALOG_COLUMNS, SCORING_COLUMNS, SCORING_TEXT_COLUMNS
+from item_similarity import build_item_neighbors
+from listing_catalog import ListingCatalog
+from listing_vectors import ListingVectorStore
+from scoring_pool import shutdown_scoring_pool
+from synthetic import make_interactions, make_listings, make_users
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PATHS = ("content", "cf_user", "cf_item", "hybrid")
+PERCENTILES = (50, 90, 95, 99)
+
+
+class InMemoryData:
+    """The database reads and writes of generate_hybrid_recommendations, served from the synthetic data."""
+
+    def __init__(self, listings, users, interactions):
+        self.listings = {l["id"]: l for l in listings}
+        self.positions = {l["id"]: p for p, l in enumerate(listings)}
+        self.columns = {c: [l[c] for l in listings] for c in SCORING_COLUMNS + SCORING_TEXT_COLUMNS}
+        self.users = {u["user_id"]: u for u in users}
+        self.interactions = interactions
+        self.saved = {}
+        for user_id, listing_id in interactions:
+            self.saved.setdefault(user_id, []).append(listing_id)
+
+    async def get_cv_analysis(self, user_id):
+        return self.users[user_id]["profile"]
+
+    async def get_user_preferences(self, user_id):
+        return self.users[user_id]["prefs"]
+
+    async def get_all_user_interactions(self):
+        return list(self.interactions)
+
+    async def get_interactions_version(self, user_id=None):
+        return (len(self.interactions), None)
+
+    async def get_user_saved_items(self, user_id):
+        return list(self.saved.get(user_id, []))
+
+    async def get_user_recommendations(self, user_id, limit=10, scored_only=False):
+        return []
+
+    async def get_scoring_listings(self, listing_ids=None, limit=None, with_text=False, chunk_size=None):
+        if listing_ids is not None:
+            rows = [self.positions[i] for i in listing_ids if i in self.positions]
+        else:
+            rows = range(len(self.positions) if limit is None else min(limit, len(self.positions)))
+        columns = SCORING_COLUMNS + (SCORING_TEXT_COLUMNS if with_text else ())
+        return {c: [self.columns[c][r] for r in rows] for c in columns}
+
+    async def get_internship_listings_by_ids(self, listing_ids):
+        return [self.listings[i] for i in listing_ids if i in self.listings]
+
+    async def upsert_recommendations(self, rows):
+        return len(rows)
+
+    @contextlib.contextmanager
+    def installed(self, store, item_index, catalog=None):
+        """Route recommendation's database helpers and process-wide models (and catalog) to this data."""
+        replaced = {
+            name: getattr(self, name) for name in (
+                "get_cv_analysis", "get_user_preferences", "get_all_user_interactions",
+                "get_interactions_version", "get_user_saved_items", "get_user_recommendations",
+                "get_scoring_listings", "get_internship_listings_by_ids", "upsert_recommendations",
+            )
+        }
+        replaced["get_listing_store"] = lambda: store
+        replaced["get_item_neighbor_index"] = lambda: item_index
+        replaced["get_listing_catalog"] = lambda: catalog
+        saved = {name: getattr(recommendation, name) for name in replaced}
+        for name, value in replaced.items():
+            setattr(recommendation, name, value)
+        try:
+            yield self
+        finally:
+            for name, value in saved.items():
+                setattr(recommendation, name, value)
+
+
+def summarize(samples_ms):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    summary = {f"p{p}_ms": float(np.percentile(samples, p)) for p in PERCENTILES}
+    summary.update({
+        "mean_ms": float(samples.mean()),
+        "min_ms": float(samples.min()),
+        "max_ms": float(samples.max()),
+        "calls": int(len(samples)),
+    })
+    return summary
+
+
+def time_calls(call, user_ids):
+    samples = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        call(user_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def peak_memory(call, user_ids):
+    """Largest tracemalloc peak above the pre-call allocation, in MB."""
+    tracemalloc.start()
+    try:
+        peak = 0
+        for user_id in user_ids:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            call(user_id)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return peak / 1e6
+
+
+def bench_size(n_listings, args, loop):
+    setup_start = time.perf_counter()
+    listings = make_listings(n_listings, seed=args.seed)
+    users = make_users(args.users, seed=args.seed)
+    interactions = make_interactions(users, listings, mean_saves=args.mean_saves, seed=args.seed)
+    generated_at = time.perf_counter()
+    store = ListingVectorStore.build(listings)
+    store_built_at = time.perf_counter()
+    item_index = build_item_neighbors(interactions)
+    index_built_at = time.perf_counter()
+    catalog = ListingCatalog.empty().merged({c: [l.get(c) for l in listings] for c in CATALOG_COLUMNS})
+    catalog_built_at = time.perf_counter()
+
+    data = InMemoryData(listings, users, interactions)
+    # Scoring columns only, as the scoring path reads them
+    listings_df = pd.DataFrame(loop.run_until_complete(data.get_scoring_listings())).set_index("id")
+    user_by_id = data.users
+
+    calls = {
+        "content": lambda u: recommendation.compute_content_scores(
+            u, user_by_id[u]["profile"], listings_df, user_by_id[u]["prefs"], "tfidf", None, store, None,
+        ),
+        "cf_user": lambda u: recommendation.compute_collaborative_scores(u, listings_df, interactions),
+        "cf_item": lambda u: recommendation.compute_item_collaborative_scores(
+            u, listings_df, data.saved.get(u, []), item_index,
+        ),
+        "hybrid": lambda u: loop.run_until_complete(recommendation.generate_hybrid_recommendations(
+            u, top_n=args.top_n, cf_mode=args.cf_mode, use_cache=False, content_mode="tfidf",
+        )),
+    }
+
+    rng = random.Random(args.seed + n_listings)
+    user_ids = rng.sample(sorted(user_by_id), min(args.requests + args.memory_samples, len(user_by_id)))
+    timed_users, memory_users = user_ids[:args.requests], user_ids[args.requests:] or user_ids[:1]
+
+    results = {
+        "setup": {
+            "listings": n_listings,
+            "users": len(users),
+            "interactions": len(interactions),
+            "generate_s": generated_at - setup_start,
+            "store_build_s": store_built_at - generated_at,
+            "item_index_build_s": index_built_at - store_built_at,
+            "catalog_build_s": catalog_built_at - index_built_at,
+            "catalog_mb": catalog.memory_usage()["total"] / 1e6,
+            "store_vocabulary": len(store.vectorizer.vocabulary_),
+            "store_matrix_mb": (store.matrix.data.nbytes + store.matrix.indices.nbytes + store.matrix.indptr.nbytes) / 1e6,
+            "store_field_matrix_mb": (store.field_matrix.data.nbytes + store.field_matrix.indices.nbytes
+                                      + store.field_matrix.indptr.nbytes) / 1e6,
+        },
+        "paths": {},
+    }
+    with data.installed(store, item_index, None if args.no_catalog else catalog):
+        for path in args.paths:
+            call = calls[path]
+            call(timed_users[0])  # warm-up (lazy imports, executor start, caches)
+            summary = summarize(time_calls(call, timed_users))
+            summary["peak_memory_mb"] = peak_memory(call, memory_users)
+            results["paths"][path] = summary
+            print(
+                f"  {path:<8} p50 {summary['p50_ms']:9.2f} ms  p95 {summary['p95_ms']:9.2f} ms  "
+                f"p99 {summary['p99_ms']:9.2f} ms  peak {summary['peak_memory_mb']:8.1f} MB"
+            )
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the relative change of p50, p95 and peak memory against an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange against {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    for size, size_results in results["sizes"].items():
+        old_paths = baseline["sizes"].get(size, {}).get("paths", {})
+        for path, summary in size_results["paths"].items():
+            old = old_paths.get(path)
+            if old is None:
+                continue
+            changes = []
+            for metric in ("p50_ms", "p95_ms", "peak_memory_mb"):
+                if old.get(metric):
+                    changes.append(f"{metric} {100 * (summary[metric] - old[metric]) / old[metric]:+7.1f}%")
+            print(f"  {size:>7} {path:<8} " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation paths on synthetic data.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated catalog sizes")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--mean-saves", type=float, default=5.0, help="Mean saves per user")
+    parser.add_argument("--requests", type=int, default=50, help="Timed calls per path and size")
+    parser.add_argument("--memory-samples", type=int, default=3, help="Calls traced for peak memory")
+    parser.add_argument("--paths", default=",".join(PATHS), help=f"Comma-separated subset of {','.join(PATHS)}")
+    parser.add_argument("--top-n", type=int, default=20)
+    parser.add_argument("--cf-mode", choices=("user", "item"), default="user", help="CF flavour of the hybrid path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-catalog", action="store_true", help="Hybrid path reads listings from the database stand-ins")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/recommendations-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare with")
+    args = parser.parse_args()
+    args.paths = [p for p in args.paths.split(",") if p]
+    unknown = set(args.paths) - set(PATHS)
+    if unknown:
+        parser.error(f"unknown paths: {', '.join(sorted(unknown))}")
+
+    # Per-call logging would dominate the small catalogs; keep errors only
+    logging.getLogger().setLevel(logging.ERROR)
+
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    results = {
+        "meta": {
+            "started_at": started_at.isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        },
+        "sizes": {},
+    }
+    loop = asyncio.new_event_loop()
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            print(f"{size} listings, {args.users} users, {args.requests} calls per path")
+            results["sizes"][str(size)] = bench_size(size, args, loop)
+    finally:
+        shutdown_scoring_pool()
+        loop.close()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"recommendations-{started_at:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
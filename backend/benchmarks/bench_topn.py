@@ -0,0 +1,94 @@
+"""
+Per-request cost of blending, ranking and formatting recommendations.
+
+Compares, on a synthetic catalog (default 5000 listings, top 20, 50
+excluded IDs):
+  - the former pandas path: Series blend, drop() of interacted IDs,
+    nlargest() and a .loc[id].to_dict() per result,
+  - the array path: NumPy blend, select_top_n() (argpartition) and one
+    .loc gather of the final N rows.
+
+Run from the backend directory:
+    python benchmarks/bench_topn.py [n_listings] [repeats]
+"""
+
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+import pandas as pd
+
+from bench_listing_text import make_listings, timeit
+from recommendation import DISPLAY_FIELDS, normalize_scores, select_top_n
+
+TOP_N = 20
+ALPHA = 0.6
+
+
+def pandas_path(df, content, collab, excluded):
+    content_series = pd.Series(content, index=df.index)
+    collab_series = pd.Series(collab, index=df.index)
+    hybrid = ALPHA * pd.Series(normalize_scores(content_series.values), index=df.index) \
+        + (1 - ALPHA) * pd.Series(normalize_scores(collab_series.values), index=df.index)
+    hybrid = hybrid.drop(index=excluded.intersection(hybrid.index), errors="ignore")
+    out = []
+    for listing_id, score in hybrid.nlargest(TOP_N).items():
+        if pd.isna(score) or score <= 1e-6:
+            continue
+        info = df.loc[int(listing_id)].to_dict()
+        rec = {"id": int(listing_id)}
+        for field_name in DISPLAY_FIELDS:
+            rec[field_name] = info.get(field_name, "")
+        rec.update({
+            "similarity_score": float(score),
+            "recommended_at": datetime.datetime.now(datetime.timezone.utc),
+        })
+        out.append(rec)
+    return out
+
+
+def array_path(df, content, collab, excluded):
+    ids = df.index.to_numpy()
+    hybrid = ALPHA * normalize_scores(content) + (1 - ALPHA) * normalize_scores(collab)
+    top_ids, top_scores = select_top_n(ids, hybrid, TOP_N, excluded)
+    recommended_at = datetime.datetime.now(datetime.timezone.utc)
+    rows = df.loc[top_ids]
+    columns = {f: (rows[f].tolist() if f in rows.columns else [""] * len(top_ids)) for f in DISPLAY_FIELDS}
+    out = []
+    for position, (listing_id, score) in enumerate(zip(top_ids.tolist(), top_scores.tolist())):
+        rec = {"id": listing_id}
+        for field_name, values in columns.items():
+            rec[field_name] = values[position]
+        rec.update({"similarity_score": score, "recommended_at": recommended_at})
+        out.append(rec)
+    return out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    df = pd.DataFrame(make_listings(n, description_bytes=500)).set_index("id", drop=False)
+    rng = np.random.default_rng(0)
+    content = rng.random(n)
+    collab = np.where(rng.random(n) < 0.05, rng.random(n), 0.0)
+    excluded = set(rng.choice(df.index.to_numpy(), 50, replace=False).tolist())
+
+    expected = [r["id"] for r in pandas_path(df, content, collab, excluded)]
+    assert [r["id"] for r in array_path(df, content, collab, excluded)] == expected
+
+    results = {
+        "pandas drop/nlargest + .loc per result": timeit(lambda: pandas_path(df, content, collab, excluded), repeats),
+        "arrays + argpartition + one gather": timeit(lambda: array_path(df, content, collab, excluded), repeats),
+    }
+
+    print(f"{n} listings, top {TOP_N}, median of {repeats} runs")
+    for name, ms in results.items():
+        print(f"  {name:<45} {ms:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Seeded synthetic data for the recommendation benchmarks.
+
+Generates, without a database:
+  - listings shaped like the scraper's output, half in French and half in
+    English, with log-normally distributed description lengths truncated
+    like save_internship_listing does (5000 characters),
+  - users with CV keyword profiles (as stored in cv_analysis) and
+    preferences (as stored in user_preferences),
+  - save interactions, skewed towards popular listings and each user's
+    domain.
+
+The same seed always gives the same data.
+"""
+
+import itertools
+import math
+import random
+from typing import Dict, List, Tuple
+
+DOMAINS = {
+    "Data": {
+        "fr": ("Data Analyst", "Data Scientist", "Data Engineer", "Analyste BI"),
+        "en": ("Data Analyst", "Data Scientist", "Data Engineer", "BI Analyst"),
+        "skills": ("python", "sql", "pandas", "machine learning", "power bi", "spark", "statistics", "tableau", "scikit-learn"),
+    },
+    "Web": {
+        "fr": ("Développeur Web", "Développeur Full Stack", "Développeur Front-end", "Développeur Back-end"),
+        "en": ("Web Developer", "Full Stack Developer", "Front-end Developer", "Back-end Developer"),
+        "skills": ("javascript", "react", "node.js", "html", "css", "typescript", "django", "rest api", "docker"),
+    },
+    "Finance": {
+        "fr": ("Analyste Financier", "Contrôleur de Gestion", "Auditeur", "Analyste Crédit"),
+        "en": ("Financial Analyst", "Business Controller", "Auditor", "Credit Analyst"),
+        "skills": ("excel", "financial modeling", "accounting", "sap", "vba", "reporting", "ifrs", "risk analysis"),
+    },
+    "Marketing": {
+        "fr": ("Chargé de Marketing Digital", "Community Manager", "Chef de Produit", "Chargé de Communication"),
+        "en": ("Digital Marketing Intern", "Community Manager", "Product Marketing Intern", "Communications Intern"),
+        "skills": ("seo", "google analytics", "content marketing", "social media", "crm", "adobe", "copywriting", "hubspot"),
+    },
+    "Cybersecurity": {
+        "fr": ("Analyste SOC", "Consultant Cybersécurité", "Pentesteur", "Ingénieur Sécurité"),
+        "en": ("SOC Analyst", "Cybersecurity Consultant", "Penetration Tester", "Security Engineer"),
+        "skills": ("linux", "siem", "network security", "python", "iso 27001", "firewall", "incident response", "wireshark"),
+    },
+    "Embedded Systems": {
+        "fr": ("Ingénieur Systèmes Embarqués", "Développeur C/C++", "Ingénieur Électronique", "Ingénieur IoT"),
+        "en": ("Embedded Systems Engineer", "C/C++ Developer", "Electronics Engineer", "IoT Engineer"),
+        "skills": ("c", "c++", "rtos", "stm32", "arm", "matlab", "vhdl", "iot", "linux embarqué"),
+    },
+}
+
+COUNTRIES = ("Morocco", "France", "Canada")
+CITIES = {
+    "Morocco": ("Casablanca", "Rabat", "Tanger", "Marrakech"),
+    "France": ("Paris", "Lyon", "Toulouse", "Nantes"),
+    "Canada": ("Montréal", "Toronto", "Québec", "Vancouver"),
+}
+PLATFORMS = ("LinkedIn", "Indeed", "Glassdoor")
+COMPANIES = ("Capgemini", "OCP", "Société Générale", "Orange", "Atos", "Inwi", "Desjardins", "Thales", "CGI", "Deloitte")
+
+SENTENCES = {
+    "fr": (
+        "Au sein de l'équipe {domain}, vous participerez à des projets à fort impact.",
+        "Vous serez amené à travailler sur {skill} et {skill2} dans un environnement agile.",
+        "Nous recherchons un stagiaire motivé, curieux et autonome.",
+        "Vous contribuerez à l'analyse des besoins et à la rédaction de la documentation technique.",
+        "Une première expérience avec {skill} serait un plus.",
+        "Le stage d'une durée de six mois débutera en février.",
+        "Vous serez encadré par un tuteur expérimenté et intégré à une équipe pluridisciplinaire.",
+        "Vous participerez aux rituels de l'équipe et présenterez vos travaux aux parties prenantes.",
+    ),
+    "en": (
+        "As part of the {domain} team, you will work on high-impact projects.",
+        "You will use {skill} and {skill2} in an agile environment.",
+        "We are looking for a motivated, curious and autonomous intern.",
+        "You will help gather requirements and write technical documentation.",
+        "Prior experience with {skill} is a plus.",
+        "The six-month internship starts in February.",
+        "You will be mentored by a senior engineer and join a cross-functional team.",
+        "You will take part in team ceremonies and present your work to stakeholders.",
+    ),
+}
+
+# Long tail of tool, product and project names: real catalogs have tens of
+# thousands of distinct terms, most of them rare
+SYLLABLES = ("ka", "ro", "vi", "tek", "lu", "mo", "zen", "da", "flo", "pi", "nex", "or", "sa", "qui", "bel", "tra")
+TAIL_TERMS = 20000
+TAIL_TEMPLATES = {
+    "fr": "Environnement technique : {terms}.",
+    "en": "Tech stack: {terms}.",
+}
+
+# Same truncation as save_internship_listing
+MAX_DESCRIPTION_CHARS = 5000
+# Median description length in characters (log-normal around it)
+MEDIAN_DESCRIPTION_CHARS = 1800
+
+
+def _tail_terms(rng: random.Random) -> List[str]:
+    terms = set()
+    while len(terms) < TAIL_TERMS:
+        terms.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))))
+    terms = sorted(terms)
+    rng.shuffle(terms)
+    return terms
+
+
+def _description(rng: random.Random, language: str, domain: str, skills: Tuple[str, ...],
+                 tail: List[str], tail_weights: List[float]) -> str:
+    target = min(int(rng.lognormvariate(math.log(MEDIAN_DESCRIPTION_CHARS), 0.6)), MAX_DESCRIPTION_CHARS)
+    stack = ", ".join(rng.choices(tail, cum_weights=tail_weights, k=rng.randint(3, 12)))
+    parts, size = [TAIL_TEMPLATES[language].format(terms=stack)], len(stack)
+    while size < target:
+        sentence = rng.choice(SENTENCES[language]).format(
+            domain=domain, skill=rng.choice(skills), skill2=rng.choice(skills),
+        )
+        parts.append(sentence)
+        size += len(sentence) + 1
+    return " ".join(parts)[:MAX_DESCRIPTION_CHARS]
+
+
+def make_listings(n: int, seed: int = 0) -> List[Dict]:
+    """`n` active listings with the columns of internship_listings (IDs 1..n)."""
+    rng = random.Random(seed)
+    domains = list(DOMAINS)
+    tail = _tail_terms(rng)
+    # Zipf: the r-th term is drawn with a probability proportional to 1/r
+    tail_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, len(tail) + 1)))
+    listings = []
+    for listing_id in range(1, n + 1):
+        domain = rng.choice(domains)
+        spec = DOMAINS[domain]
+        language = "fr" if rng.random() < 0.5 else "en"
+        country = rng.choice(COUNTRIES)
+        skills = tuple(rng.sample(spec["skills"], k=rng.randint(3, 6)))
+        title = rng.choice(spec[language])
+        title = f"Stage - {title}" if language == "fr" else f"{title} Intern"
+        listings.append({
+            "id": listing_id,
+            "title": title,
+            "company": rng.choice(COMPANIES),
+            "location": rng.choice(CITIES[country]),
+            "country": country,
+            "platform": rng.choice(PLATFORMS),
+            # Some listings never got their description scraped
+            "description": _description(rng, language, domain, spec["skills"], tail, tail_weights) if rng.random() > 0.05 else "",
+            "skills": ", ".join(skills),
+            "domain": domain,
+            "link": f"https://example.com/jobs/{listing_id}",
+        })
+    return listings
+
+
+def make_users(n: int, seed: int = 0) -> List[Dict]:
+    """
+    `n` users with a CV profile and preferences (IDs 1..n).
+
+    Each dict holds "user_id", "profile" (cv_analysis: keywords, domain) and
+    "prefs" (user_preferences: field weights, country and platform weights).
+    """
+    rng = random.Random(seed + 1)
+    domains = list(DOMAINS)
+    users = []
+    for user_id in range(1, n + 1):
+        domain = rng.choice(domains)
+        spec = DOMAINS[domain]
+        keywords = rng.sample(spec["skills"], k=rng.randint(3, 7))
+        # A few keywords from another domain, as real CVs are rarely single-topic
+        other = DOMAINS[rng.choice(domains)]["skills"]
+        keywords += rng.sample(other, k=rng.randint(0, 2))
+        keywords.append(rng.choice(spec["fr"] + spec["en"]).lower())
+        weights = [rng.random() for _ in range(4)]
+        total = sum(weights)
+        users.append({
+            "user_id": user_id,
+            "profile": {"keywords": keywords, "domain": domain},
+            "prefs": {
+                "domain_weight": weights[0] / total,
+                "skills_weight": weights[1] / total,
+                "title_weight": weights[2] / total,
+                "description_weight": weights[3] / total,
+                "country_weights": {c: round(rng.uniform(0.5, 1.5), 2) for c in COUNTRIES},
+                "platform_weights": {p: 1.0 for p in PLATFORMS},
+            },
+        })
+    return users
+
+
+def make_interactions(users: List[Dict], listings: List[Dict], mean_saves: float = 5.0, seed: int = 0) -> List[Tuple[int, int]]:
+    """
+    (user_id, listing_id) saves: Poisson(mean_saves) per user, 70% within the
+    user's domain, listings drawn with a Zipf-like popularity skew.
+    """
+    rng = random.Random(seed + 2)
+    by_domain: Dict[str, List[int]] = {}
+    for listing in listings:
+        by_domain.setdefault(listing["domain"], []).append(listing["id"])
+    all_ids = [listing["id"] for listing in listings]
+
+    def popular(ids: List[int]) -> int:
+        # Zipf-like: low ranks (the first listings of the pool) are saved far more often
+        return ids[min(int(rng.paretovariate(1.2)) - 1, len(ids) - 1)]
+
+    interactions = set()
+    for user in users:
+        n_saves = _poisson(rng, mean_saves)
+        pool = by_domain.get(user["profile"]["domain"]) or all_ids
+        for _ in range(n_saves):
+            ids = pool if rng.random() < 0.7 else all_ids
+            interactions.add((user["user_id"], popular(ids) if rng.random() < 0.5 else rng.choice(ids)))
+    return sorted(interactions)
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    limit, k, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        k += 1
+        product *= rng.random()
+    return k
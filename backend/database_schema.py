@@ -2,40 +2,106 @@
 import asyncio
 import asyncpg
 import datetime
+import os
 from typing import List, Dict, Any, Optional
+from fastapi import HTTPException
 
-# Database connection parameters
-DB_CONFIG = {
-    "user": "postgres",
-    "password": "Oumaima123",
-    "database": "postgres",
-    "host": "localhost",
-    "port": 5432,
-}
+from db import (
+    DB_ACQUIRE_TIMEOUT,
+    close_db_pool,
+    get_db_pool,
+    register_prepared_statement,
+)
+from cache import TTLCache
 
-# For create_pool ONLY
-POOL_CONFIG = {
-    "min_size": 1,
-    "max_size": 20,
-}
+# Authenticated user records keyed by username (get_current_user hits this on every request).
+# Invalidated by create_user / update_last_login; the TTL bounds staleness for out-of-process writes.
+# Only the profile fields are cached: password hashes are always read from the database.
+_user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "300")),
+    name="users",
+)
 
-async def get_db_pool():
-    return await asyncpg.create_pool(**DB_CONFIG, **POOL_CONFIG)
+# Fields of a user record kept in _user_cache (everything but the password hash)
+USER_CACHE_FIELDS = ("id", "username", "email", "created_at", "last_login")
+
+def get_user_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the user lookup cache."""
+    return _user_cache.stats()
+
+# Hot queries, prepared once per pooled connection
+register_prepared_statement("user_by_username", """
+    SELECT id, username, email, password_hash, created_at, last_login
+    FROM users
+    WHERE username = $1
+""")
+register_prepared_statement("active_listings", """
+    SELECT id, title, company, location, country, platform,
+           description, skills, domain, link, scraped_at
+    FROM internship_listings
+    WHERE is_active = TRUE
+    ORDER BY scraped_at DESC
+    LIMIT $1
+""")
+
+register_prepared_statement("listings_by_ids", """
+    SELECT id, title, company, location, country, platform,
+           description, skills, domain, link, scraped_at
+    FROM internship_listings
+    WHERE id = ANY($1::int[]) AND is_active = TRUE
+""")
+
+# Hot write of every recommendation run (small saves; large ones go through COPY)
+register_prepared_statement("upsert_recommendation", """
+    INSERT INTO user_recommendations (user_id, internship_id, similarity_score, recommended_at, is_viewed, is_saved)
+    VALUES ($1, $2, $3, $4, FALSE, FALSE)
+    ON CONFLICT (user_id, internship_id) DO UPDATE SET
+        similarity_score = EXCLUDED.similarity_score,
+        recommended_at = EXCLUDED.recommended_at,
+        is_viewed = FALSE, -- Reset viewed/saved status on new recommendation
+        is_saved = FALSE
+""")
+
+# Same write for the batch merges, which leave the viewed/saved status of existing rows alone
+register_prepared_statement("upsert_recommendation_keep_flags", """
+    INSERT INTO user_recommendations (user_id, internship_id, similarity_score, recommended_at, is_viewed, is_saved)
+    VALUES ($1, $2, $3, $4, FALSE, FALSE)
+    ON CONFLICT (user_id, internship_id) DO UPDATE SET
+        similarity_score = EXCLUDED.similarity_score,
+        recommended_at = EXCLUDED.recommended_at
+""")
 
 # Initialize DB schema
 async def init_db():
     pool = await get_db_pool()
     async with pool.acquire() as conn:
         await conn.execute(CREATE_TABLES_SQL)
-    await pool.close()
     print("Database schema initialized successfully")
+async def _acquire_for_request(pool: asyncpg.Pool) -> asyncpg.Connection:
+    """Borrow a pooled connection, failing fast with 503 when the pool is exhausted."""
+    try:
+        return await pool.acquire(timeout=DB_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail="Database is busy, please retry",
+        )
+
 # Dependency to get a connection (for FastAPI endpoint)
 async def get_db_connection():
-    conn = await asyncpg.connect(**DB_CONFIG)
+    """
+    Borrow a connection from the shared pool for the duration of the request.
+
+    Statements run in autocommit mode, so a single-statement endpoint costs
+    exactly one round-trip.
+    """
+    pool = await get_db_pool()
+    conn = await _acquire_for_request(pool)
     try:
         yield conn
     finally:
-        await conn.close()
+        await pool.release(conn)
 
 # SQL Statements for database setup
 CREATE_TABLES_SQL = """
@@ -123,6 +189,7 @@ CREATE INDEX IF NOT EXISTS idx_phase_2_complete ON internship_listings(phase_2_c
 CREATE INDEX IF NOT EXISTS idx_description_scraped_at ON internship_listings(description_scraped_at);
 CREATE INDEX IF NOT EXISTS idx_user_recommendations_user_id ON user_recommendations(user_id);
 CREATE INDEX IF NOT EXISTS idx_user_recommendations_similarity_score ON user_recommendations(similarity_score);
+CREATE INDEX IF NOT EXISTS idx_user_recommendations_saved ON user_recommendations(user_id, saved_at) WHERE is_saved = TRUE;
 """
 
 
@@ -174,8 +241,6 @@ async def cleanup_expired_listings(days=30):
         """, expiry_date)
         
         print(f"Marked {result.split()[1]} listings as inactive (older than {days} days)")
-    
-    await pool.close()
 
 # User management functions
 async def create_user(username: str, email: str, password_hash: str):
@@ -199,6 +264,7 @@ async def create_user(username: str, email: str, password_hash: str):
                 VALUES ($1, $2, $3)
                 RETURNING id
             """, username, email, password_hash)
+            _user_cache.invalidate(username)
             return user_id
     except asyncpg.UniqueViolationError:
         print(f"User with username '{username}' or email '{email}' already exists")
@@ -206,37 +272,40 @@ async def create_user(username: str, email: str, password_hash: str):
     except Exception as e:
         print(f"Error creating user: {str(e)}")
         return None
-    finally:
-        await pool.close()
 
-async def get_user_by_username(username: str):
+async def get_user_by_username(username: str, use_cache: bool = True):
     """
     Get user by username.
     
     Args:
         username (str): Username
+        use_cache (bool, optional): Serve from the in-process user cache when possible.
+            Cached records hold USER_CACHE_FIELDS only; pass False when the
+            password hash is needed (login).
         
     Returns:
         dict: User data if found, None otherwise
     """
+    if use_cache:
+        cached = _user_cache.get(username)
+        if cached is not None:
+            return dict(cached)
+
     pool = await get_db_pool()
     
     try:
         async with pool.acquire() as conn:
-            user = await conn.fetchrow("""
-                SELECT id, username, email, password_hash, created_at, last_login
-                FROM users
-                WHERE username = $1
-            """, username)
+            stmt = await conn.prepared("user_by_username")
+            user = await stmt.fetchrow(username)
             
             if user:
-                return dict(user)
+                profile = {field: user[field] for field in USER_CACHE_FIELDS}
+                _user_cache.set(username, profile)
+                return dict(profile) if use_cache else dict(user)
             return None
     except Exception as e:
         print(f"Error getting user: {str(e)}")
         return None
-    finally:
-        await pool.close()
 
 async def update_last_login(user_id: int):
     """
@@ -249,15 +318,16 @@ async def update_last_login(user_id: int):
     
     try:
         async with pool.acquire() as conn:
-            await conn.execute("""
+            username = await conn.fetchval("""
                 UPDATE users
                 SET last_login = CURRENT_TIMESTAMP
                 WHERE id = $1
+                RETURNING username
             """, user_id)
+            if username is not None:
+                _user_cache.invalidate(username)
     except Exception as e:
         print(f"Error updating last login: {str(e)}")
-    finally:
-        await pool.close()
 
 # CV Analysis functions
 async def save_cv_analysis(user_id: int, domain: str, keywords: List[str], raw_text: str = None):
@@ -277,33 +347,53 @@ async def save_cv_analysis(user_id: int, domain: str, keywords: List[str], raw_t
     
     try:
         async with pool.acquire() as conn:
-            # Check if user already has CV analysis
-            existing = await conn.fetchval("""
-                SELECT id FROM cv_analysis WHERE user_id = $1
-            """, user_id)
-            
-            if existing:
-                # Update existing analysis
-                cv_id = await conn.fetchval("""
-                    UPDATE cv_analysis
-                    SET domain = $2, keywords = $3, raw_text = $4, updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = $1
-                    RETURNING id
-                """, user_id, domain, keywords, raw_text)
-            else:
-                # Create new analysis
-                cv_id = await conn.fetchval("""
-                    INSERT INTO cv_analysis (user_id, domain, keywords, raw_text)
-                    VALUES ($1, $2, $3, $4)
-                    RETURNING id
-                """, user_id, domain, keywords, raw_text)
+            cv_id = await conn.fetchval("""
+                INSERT INTO cv_analysis (user_id, domain, keywords, raw_text)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    domain = EXCLUDED.domain,
+                    keywords = EXCLUDED.keywords,
+                    raw_text = EXCLUDED.raw_text,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING id
+            """, user_id, domain, keywords, raw_text)
             
             return cv_id
     except Exception as e:
         print(f"Error saving CV analysis: {str(e)}")
         return None
-    finally:
-        await pool.close()
+
+async def upsert_cv_keywords(user_id: int, domain: str, keywords: List[str]):
+    """
+    Insert or update the domain and keywords of a user's CV analysis,
+    leaving the stored raw text untouched.
+    
+    Args:
+        user_id (int): User ID
+        domain (str): Domain extracted from CV
+        keywords (List[str]): Keywords extracted from CV
+        
+    Returns:
+        int: CV analysis ID if successful, None if error
+    """
+    pool = await get_db_pool()
+    
+    try:
+        async with pool.acquire() as conn:
+            cv_id = await conn.fetchval("""
+                INSERT INTO cv_analysis (user_id, domain, keywords, created_at, updated_at)
+                VALUES ($1, $2, $3, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    domain = EXCLUDED.domain,
+                    keywords = EXCLUDED.keywords,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING id
+            """, user_id, domain, keywords)
+            
+            return cv_id
+    except Exception as e:
+        print(f"Error saving CV keywords: {str(e)}")
+        return None
 
 async def get_cv_analysis(user_id: int):
     """
@@ -331,8 +421,6 @@ async def get_cv_analysis(user_id: int):
     except Exception as e:
         print(f"Error getting CV analysis: {str(e)}")
         return None
-    finally:
-        await pool.close()
 
 # Internship listing functions
 async def save_internship_listing(
@@ -412,8 +500,6 @@ async def save_internship_listing(
     except Exception as e:
         print(f"Error saving internship listing: {str(e)}")
         return None
-    finally:
-        await pool.close()
 
 async def get_active_internship_listings(
     domain: str = None,
@@ -437,6 +523,13 @@ async def get_active_internship_listings(
     
     try:
         async with pool.acquire() as conn:
+            if not (domain or country or platform):
+                # Unfiltered catalog read (recommendation path): use the prepared statement.
+                # LIMIT NULL means no limit.
+                stmt = await conn.prepared("active_listings")
+                rows = await stmt.fetch(limit or None)
+                return [dict(row) for row in rows]
+
             # Build query based on filters
             query = """
                 SELECT id, title, company, location, country, platform,
@@ -474,8 +567,134 @@ async def get_active_internship_listings(
     except Exception as e:
         print(f"Error getting internship listings: {str(e)}")
         return []
-    finally:
-        await pool.close()
+
+# Columns read for scoring; display fields are only fetched for the final top-N
+SCORING_COLUMNS = ("id", "country", "platform")
+SCORING_TEXT_COLUMNS = ("title", "description", "skills", "domain")
+SCORING_FETCH_CHUNK_SIZE = int(os.getenv("SCORING_FETCH_CHUNK_SIZE", "2000"))
+
+async def get_scoring_listings(
+    listing_ids: List[int] = None,
+    limit: int = None,
+    with_text: bool = False,
+    chunk_size: int = SCORING_FETCH_CHUNK_SIZE
+):
+    """
+    Get the active listings as columns, reading only what scoring needs.
+    
+    Rows are streamed through a server-side cursor, `chunk_size` at a time,
+    straight into per-column lists, so no per-row dict is ever built.
+    
+    Args:
+        listing_ids (List[int], optional): Restrict to these IDs (candidates)
+        limit (int, optional): Most recently scraped listings only
+        with_text (bool, optional): Also read the text columns (cold start without listing vectors)
+        chunk_size (int, optional): Rows fetched per round-trip
+        
+    Returns:
+        Dict[str, list]: Column name -> values, in the same row order
+    """
+    columns = SCORING_COLUMNS + (SCORING_TEXT_COLUMNS if with_text else ())
+    query = f"SELECT {', '.join(columns)} FROM internship_listings WHERE is_active = TRUE"
+    params = []
+    if listing_ids is not None:
+        params.append([int(i) for i in listing_ids])
+        query += f" AND id = ANY(${len(params)}::int[])"
+    if limit:
+        params.append(limit)
+        query += f" ORDER BY scraped_at DESC LIMIT ${len(params)}"
+    
+    try:
+        return await _fetch_columns(query, params, columns, chunk_size)
+    except Exception as e:
+        print(f"Error getting scoring listings: {str(e)}")
+        return {column: [] for column in columns}
+
+async def _fetch_columns(query: str, params: list, columns: tuple, chunk_size: int):
+    """Stream `query` through a server-side cursor into one list per column."""
+    result = {column: [] for column in columns}
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        # Server-side cursors only exist inside a transaction
+        async with conn.transaction():
+            cursor = await conn.cursor(query, *params)
+            while True:
+                rows = await cursor.fetch(chunk_size)
+                if not rows:
+                    break
+                for position, column in enumerate(columns):
+                    result[column].extend(row[position] for row in rows)
+    return result
+
+# Columns kept by the in-memory listing catalog (listing_catalog.py)
+CATALOG_COLUMNS = (
+    "id", "country", "platform", "scraped_at",
+    "title", "company", "location", "description", "skills", "domain", "link",
+)
+
+async def get_catalog_listings(
+    scraped_since: datetime.datetime = None,
+    listing_ids: List[int] = None,
+    chunk_size: int = SCORING_FETCH_CHUNK_SIZE
+):
+    """
+    Get the active listings (every catalog column) scraped since a watermark.
+    
+    Raises on database errors, so a failed refresh leaves the catalog as it was.
+    
+    Args:
+        scraped_since (datetime, optional): Only listings with scraped_at >= this (all when None)
+        listing_ids (List[int], optional): Restrict to these IDs
+        chunk_size (int, optional): Rows fetched per round-trip
+        
+    Returns:
+        Dict[str, list]: Column name -> values, ordered by (scraped_at, id)
+    """
+    query = f"SELECT {', '.join(CATALOG_COLUMNS)} FROM internship_listings WHERE is_active = TRUE"
+    params = []
+    if scraped_since is not None:
+        params.append(scraped_since)
+        query += f" AND scraped_at >= ${len(params)}"
+    if listing_ids is not None:
+        params.append([int(i) for i in listing_ids])
+        query += f" AND id = ANY(${len(params)}::int[])"
+    query += " ORDER BY scraped_at, id"
+    return await _fetch_columns(query, params, CATALOG_COLUMNS, chunk_size)
+
+async def get_active_listing_ids():
+    """
+    Get the IDs of every active listing (catalog deactivation check).
+    
+    Returns:
+        List[int]: Active listing IDs; raises on database errors
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT id FROM internship_listings WHERE is_active = TRUE")
+    return [row[0] for row in rows]
+
+async def get_internship_listings_by_ids(listing_ids: List[int]):
+    """
+    Get the active listings among the given IDs (candidate hydration).
+    
+    Args:
+        listing_ids (List[int]): Listing IDs
+        
+    Returns:
+        List[dict]: Active listings, in no particular order
+    """
+    if not listing_ids:
+        return []
+    pool = await get_db_pool()
+    
+    try:
+        async with pool.acquire() as conn:
+            stmt = await conn.prepared("listings_by_ids")
+            rows = await stmt.fetch([int(i) for i in listing_ids])
+            return [dict(row) for row in rows]
+    except Exception as e:
+        print(f"Error getting internship listings by IDs: {str(e)}")
+        return []
 
 async def get_internship_listing(listing_id: int):
     """
@@ -504,11 +723,8 @@ async def get_internship_listing(listing_id: int):
     except Exception as e:
         print(f"Error getting internship listing: {str(e)}")
         return None
-    finally:
-        await pool.close()
 
 # User preferences functions
-import json
 async def save_user_preferences(
     user_id: int,
     domain_weight: float = 0.4,
@@ -529,10 +745,6 @@ async def save_user_preferences(
     if platform_weights is None:
         platform_weights = {"LinkedIn": 1.0, "Indeed": 1.0, "Glassdoor": 1.0}
 
-    # Serialize dicts to JSON strings
-    country_weights_json = json.dumps(country_weights)
-    platform_weights_json = json.dumps(platform_weights)
-
     try:
         async with pool.acquire() as conn:
             existing = await conn.fetchval("SELECT id FROM user_preferences WHERE user_id = $1", user_id)
@@ -542,13 +754,13 @@ async def save_user_preferences(
                     """
                     UPDATE user_preferences
                     SET domain_weight = $2, skills_weight = $3, title_weight = $4,
-                        description_weight = $5, country_weights = $6::jsonb, platform_weights = $7::jsonb,
+                        description_weight = $5, country_weights = $6, platform_weights = $7,
                         updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = $1
                     RETURNING id
                     """,
                     user_id, domain_weight, skills_weight, title_weight,
-                    description_weight, country_weights_json, platform_weights_json
+                    description_weight, country_weights, platform_weights
                 )
             else:
                 pref_id = await conn.fetchval(
@@ -557,11 +769,11 @@ async def save_user_preferences(
                         user_id, domain_weight, skills_weight, title_weight,
                         description_weight, country_weights, platform_weights
                     )
-                    VALUES ($1, $2, $3, $4, $5, $6::jsonb, $7::jsonb)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7)
                     RETURNING id
                     """,
                     user_id, domain_weight, skills_weight, title_weight,
-                    description_weight, country_weights_json, platform_weights_json
+                    description_weight, country_weights, platform_weights
                 )
 
             return pref_id
@@ -570,9 +782,6 @@ async def save_user_preferences(
         print(f"Error saving user preferences: {str(e)}")
         return None
 
-    finally:
-        await pool.close()
-
 async def get_user_preferences(user_id: int):
     pool = await get_db_pool()
     
@@ -586,13 +795,8 @@ async def get_user_preferences(user_id: int):
             """, user_id)
             
             if preferences:
-                prefs_dict = dict(preferences)
-                
-                # Deserialize JSON strings to dicts
-                prefs_dict['country_weights'] = json.loads(prefs_dict['country_weights'])
-                prefs_dict['platform_weights'] = json.loads(prefs_dict['platform_weights'])
-                
-                return prefs_dict
+                # JSONB weights are decoded to dicts by the pool's type codecs
+                return dict(preferences)
             
             # Default preferences
             return {
@@ -606,8 +810,6 @@ async def get_user_preferences(user_id: int):
     except Exception as e:
         print(f"Error getting user preferences: {str(e)}")
         return None
-    finally:
-        await pool.close()
 
 # Recommendation functions
 async def save_user_recommendation(
@@ -656,11 +858,79 @@ async def save_user_recommendation(
     except Exception as e:
         print(f"Error saving user recommendation: {str(e)}")
         return None
-    finally:
-        await pool.close()
 
-async def get_user_recommendations(user_id: int, limit: int = 10):
+# Below this many rows the prepared upsert is cheaper than creating a staging table
+RECOMMENDATION_COPY_MIN_ROWS = int(os.getenv("RECOMMENDATION_COPY_MIN_ROWS", "200"))
+
+async def upsert_recommendations(rows: List[tuple], copy_min_rows: int = RECOMMENDATION_COPY_MIN_ROWS,
+                                 keep_flags: bool = False):
+    """
+    Save many recommendations at once, in one transaction.
+    
+    Large writes are COPYed into a temporary staging table and merged into
+    user_recommendations with a single INSERT ... SELECT ... ON CONFLICT;
+    small ones use the prepared upsert. Either way, a rewritten
+    recommendation gets its new score and timestamp and is marked unviewed
+    and unsaved, unless `keep_flags` is set. When a (user_id, internship_id)
+    pair appears several times, the last row wins.
     
+    Args:
+        rows (List[tuple]): (user_id, internship_id, similarity_score, recommended_at) tuples
+        copy_min_rows (int): Row count from which the COPY path is used
+        keep_flags (bool): Keep is_viewed/is_saved of existing rows (batch merges)
+        
+    Returns:
+        int: Number of rows written
+    """
+    if not rows:
+        return 0
+    # ON CONFLICT cannot update the same row twice in one statement
+    rows = list({(r[0], r[1]): r for r in rows}.values())
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if len(rows) < copy_min_rows:
+                stmt = await conn.prepared("upsert_recommendation_keep_flags" if keep_flags else "upsert_recommendation")
+                await stmt.executemany(rows)
+                return len(rows)
+            await conn.execute("""
+                CREATE TEMP TABLE recommendation_staging (
+                    user_id INTEGER,
+                    internship_id INTEGER,
+                    similarity_score FLOAT,
+                    recommended_at TIMESTAMP WITH TIME ZONE
+                ) ON COMMIT DROP
+            """)
+            await conn.copy_records_to_table(
+                "recommendation_staging",
+                records=rows,
+                columns=["user_id", "internship_id", "similarity_score", "recommended_at"],
+            )
+            reset_flags = "" if keep_flags else """,
+                    is_viewed = FALSE,
+                    is_saved = FALSE"""
+            await conn.execute(f"""
+                INSERT INTO user_recommendations (user_id, internship_id, similarity_score, recommended_at, is_viewed, is_saved)
+                SELECT user_id, internship_id, similarity_score, recommended_at, FALSE, FALSE
+                FROM recommendation_staging
+                ON CONFLICT (user_id, internship_id) DO UPDATE SET
+                    similarity_score = EXCLUDED.similarity_score,
+                    recommended_at = EXCLUDED.recommended_at{reset_flags}
+            """)
+    return len(rows)
+
+async def get_user_recommendations(user_id: int, limit: int = 10, scored_only: bool = False):
+    """
+    Get the stored recommendations of a user, best score first.
+    
+    Args:
+        user_id (int): User ID
+        limit (int, optional): Maximum number of recommendations to return
+        scored_only (bool, optional): Skip rows created only by a view/save mark (no score)
+        
+    Returns:
+        List[dict]: Recommendations joined with their listing
+    """
     pool = await get_db_pool()
     
     try:
@@ -672,9 +942,10 @@ async def get_user_recommendations(user_id: int, limit: int = 10):
                 FROM user_recommendations r
                 JOIN internship_listings l ON r.internship_id = l.id
                 WHERE r.user_id = $1 AND l.is_active = TRUE
-                ORDER BY r.similarity_score DESC
+                  AND (NOT $3::boolean OR r.similarity_score IS NOT NULL)
+                ORDER BY r.similarity_score DESC NULLS LAST
                 LIMIT $2
-            """, user_id, limit)
+            """, user_id, limit, scored_only)
             
             # Convert to list of dicts
             recommendations = []
@@ -686,8 +957,33 @@ async def get_user_recommendations(user_id: int, limit: int = 10):
     except Exception as e:
         print(f"Error getting user recommendations: {str(e)}")
         return []
-    finally:
-        await pool.close()
+
+async def get_recommendation_state(user_id: int):
+    """
+    Timestamps deciding whether a user's stored recommendations are stale.
+    
+    Args:
+        user_id (int): User ID
+        
+    Returns:
+        dict: computed_at (last scoring run, None if never scored),
+              cv_updated_at and preferences_updated_at (None if absent)
+    """
+    pool = await get_db_pool()
+    
+    try:
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT
+                    (SELECT MAX(recommended_at) FROM user_recommendations
+                     WHERE user_id = $1 AND similarity_score IS NOT NULL) AS computed_at,
+                    (SELECT updated_at FROM cv_analysis WHERE user_id = $1) AS cv_updated_at,
+                    (SELECT updated_at FROM user_preferences WHERE user_id = $1) AS preferences_updated_at
+            """, user_id)
+            return dict(row)
+    except Exception as e:
+        print(f"Error getting recommendation state: {str(e)}")
+        return {"computed_at": None, "cv_updated_at": None, "preferences_updated_at": None}
 
 async def mark_recommendation_viewed(user_id: int, internship_id: int):
     """
@@ -714,8 +1010,6 @@ async def mark_recommendation_viewed(user_id: int, internship_id: int):
     except Exception as e:
         print(f"Error marking recommendation as viewed: {str(e)}")
         return False
-    finally:
-        await pool.close()
 
 async def save_recommendation(user_id: int, internship_id: int, save: bool = True):
     """
@@ -743,8 +1037,6 @@ async def save_recommendation(user_id: int, internship_id: int, save: bool = Tru
     except Exception as e:
         print(f"Error saving/unsaving recommendation: {str(e)}")
         return False
-    finally:
-        await pool.close()
 
 # Admin functions
 async def get_stats():
@@ -802,13 +1094,12 @@ async def get_stats():
     except Exception as e:
         print(f"Error getting stats: {str(e)}")
         return {}
-    finally:
-        await pool.close()
 
 # Main function to test the module
 async def main():
     """Test the database module."""
     await init_db()
+    await close_db_pool()
     
   
 if __name__ == "__main__":
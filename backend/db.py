@@ -0,0 +1,176 @@
+"""
+Shared PostgreSQL access layer.
+
+Owns the single asyncpg pool of the process (API, scraper and CLI utilities
+alike): connection parameters, pool sizing, the per-process connection cap,
+the hooks run on every new connection (JSON/JSONB codecs) and the registry
+of named prepared statements for hot queries.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import asyncpg
+
+log = logging.getLogger("db")
+
+# Database connection parameters
+DB_CONFIG = {
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", "Oumaima123"),
+    "database": os.getenv("DB_NAME", "postgres"),
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "5432")),
+    "ssl": False,
+}
+
+# Hard cap on the connections one process may hold, whatever the pool settings.
+# Keep (number of processes x this cap) below the server's max_connections.
+MAX_CONNECTIONS_PER_PROCESS = int(os.getenv("DB_MAX_CONNECTIONS_PER_PROCESS", "20"))
+
+# For create_pool ONLY
+POOL_CONFIG = {
+    "min_size": min(int(os.getenv("DB_POOL_MIN_SIZE", "2")), MAX_CONNECTIONS_PER_PROCESS),
+    "max_size": min(int(os.getenv("DB_POOL_MAX_SIZE", "20")), MAX_CONNECTIONS_PER_PROCESS),
+    # Idle connections above min_size are closed after this many seconds
+    "max_inactive_connection_lifetime": float(os.getenv("DB_POOL_MAX_IDLE_SECONDS", "300")),
+}
+
+# Max seconds a caller waits for a free pooled connection
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT_SECONDS", "5"))
+
+# Coroutines run on every new connection before it is handed out
+_init_hooks: List[Callable[[asyncpg.Connection], Awaitable[None]]] = []
+
+# Named SQL of the hottest queries, prepared once per connection (see AppConnection.prepared)
+PREPARED_STATEMENTS: Dict[str, str] = {}
+
+# The one pool of this process, created by init_db_pool() and closed by close_db_pool()
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+
+
+def register_init_hook(hook: Callable[[asyncpg.Connection], Awaitable[None]]) -> None:
+    """
+    Register a coroutine run on every new pooled connection.
+
+    Hooks must be registered before the pool is created; connections that
+    already exist are not re-initialised.
+    """
+    if _pool is not None:
+        raise RuntimeError("Init hooks must be registered before the pool is created")
+    if hook not in _init_hooks:
+        _init_hooks.append(hook)
+
+
+def register_prepared_statement(name: str, sql: str) -> None:
+    """
+    Register a hot query under a name.
+
+    Pooled connections prepare it on first use and keep the server-side
+    statement for their whole lifetime, so the query is parsed and planned
+    once per connection instead of once per call.
+    """
+    existing = PREPARED_STATEMENTS.get(name)
+    if existing is not None and existing != sql:
+        raise ValueError(f"Prepared statement '{name}' is already registered with a different query")
+    PREPARED_STATEMENTS[name] = sql
+
+
+class AppConnection(asyncpg.Connection):
+    """asyncpg connection class of the shared pool, with the prepared-statement registry."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._registry_statements: Dict[str, asyncpg.prepared_stmt.PreparedStatement] = {}
+
+    async def prepared(self, name: str) -> asyncpg.prepared_stmt.PreparedStatement:
+        """Return the registered statement `name`, preparing it on first use."""
+        stmt = self._registry_statements.get(name)
+        if stmt is None:
+            stmt = await self.prepare(PREPARED_STATEMENTS[name])
+            self._registry_statements[name] = stmt
+        return stmt
+
+
+async def _register_json_codecs(conn: asyncpg.Connection) -> None:
+    """Encode/decode json and jsonb columns as Python objects instead of strings."""
+    for typename in ("json", "jsonb"):
+        await conn.set_type_codec(
+            typename,
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema="pg_catalog",
+        )
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    await _register_json_codecs(conn)
+    for hook in _init_hooks:
+        await hook(conn)
+
+
+async def init_db_pool() -> asyncpg.Pool:
+    """Create the shared connection pool if it does not exist yet."""
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                **DB_CONFIG,
+                **POOL_CONFIG,
+                init=_init_connection,
+                connection_class=AppConnection,
+            )
+            log.info(
+                "Database pool created (min_size=%d, max_size=%d)",
+                POOL_CONFIG["min_size"], POOL_CONFIG["max_size"],
+            )
+    return _pool
+
+
+async def close_db_pool() -> None:
+    """Close the shared connection pool (application shutdown / end of a CLI run)."""
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+
+async def get_db_pool() -> asyncpg.Pool:
+    """
+    Return the shared connection pool, creating it on first use.
+
+    The pool is long-lived: callers acquire/release connections from it
+    but must never close it themselves.
+    """
+    if _pool is None:
+        return await init_db_pool()
+    return _pool
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Health statistics of the shared connection pool."""
+    if _pool is None:
+        return {
+            "initialized": False,
+            "min_size": POOL_CONFIG["min_size"],
+            "max_size": POOL_CONFIG["max_size"],
+            "max_connections_per_process": MAX_CONNECTIONS_PER_PROCESS,
+        }
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    return {
+        "initialized": True,
+        "closing": _pool.is_closing(),
+        "min_size": _pool.get_min_size(),
+        "max_size": _pool.get_max_size(),
+        "max_connections_per_process": MAX_CONNECTIONS_PER_PROCESS,
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "prepared_statements": sorted(PREPARED_STATEMENTS),
+    }
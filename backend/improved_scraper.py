@@ -18,6 +18,9 @@ from selenium.common.exceptions import NoSuchElementException, TimeoutException
 
 import asyncpg
 
+from db import get_db_pool
+from batch_recommendations import ingest_new_listings
+
 # ─────────────────────── logging ───────────────────────
 logging.basicConfig(
     level=logging.INFO,
@@ -26,26 +29,18 @@ logging.basicConfig(
 )
 log = logging.getLogger("enhanced_scraper")
 
-# ─────────────────────── DB CONFIG ───────────────────────
-DB_CONFIG = {
-    "user": "postgres",
-    "password": "Oumaima123",
-    "database": "postgres",
-    "host": "localhost",
-    "port": 5432,
-    "ssl": False,
-    "max_size": 20 ,
-}
-
-_pool: Optional[asyncpg.Pool] = None 
+# ─────────────────────── DB ───────────────────────
+# Connection settings and the pool itself live in db.py (shared with the API)
+_schema_ready = False
 
 async def get_pool() -> asyncpg.Pool:
-    global _pool
-    if _pool is None:
-        _pool = await asyncpg.create_pool(**DB_CONFIG)
-        async with _pool.acquire() as conn:
+    global _schema_ready
+    pool = await get_db_pool()
+    if not _schema_ready:
+        async with pool.acquire() as conn:
             await conn.execute(CREATE_TABLE_SQL)
-    return _pool
+        _schema_ready = True
+    return pool
 
 async def get_user_domains(conn: asyncpg.Connection, user_id: int) -> List[str]:
     r = await conn.fetchrow("SELECT domain FROM cv_analysis WHERE user_id=$1", user_id)
@@ -53,7 +48,8 @@ async def get_user_domains(conn: asyncpg.Connection, user_id: int) -> List[str]:
         return [d.strip() for d in r["domain"].split(",") if d.strip()]
     return []
 
-async def save_internship_listing(conn: asyncpg.Connection, row: Dict) -> None:
+async def save_internship_listing(conn: asyncpg.Connection, row: Dict) -> Optional[int]:
+    """Insert or refresh a listing; returns its ID when it was newly inserted, None otherwise."""
     sql = """
     INSERT INTO internship_listings (
         title, company, location, country, platform, description,
@@ -64,7 +60,8 @@ async def save_internship_listing(conn: asyncpg.Connection, row: Dict) -> None:
     ON CONFLICT (hash_id) DO UPDATE SET
         title=$1, company=$2, location=$3, country=$4, platform=$5,
         description=$6, skills=$7, domain=$8, link=$9, scraped_at=NOW(), is_active=TRUE,
-        phase_1_complete=$11, phase_2_complete=$12;
+        phase_1_complete=$11, phase_2_complete=$12
+    RETURNING id, (xmax = 0) AS inserted;
     """
     
     try:
@@ -87,16 +84,18 @@ async def save_internship_listing(conn: asyncpg.Connection, row: Dict) -> None:
         # Skip if essential fields are missing
         if not title or not hash_id:
             log.warning(f"Skipping job with missing title or hash_id")
-            return
+            return None
             
-        await conn.execute(sql,
+        saved = await conn.fetchrow(sql,
             title, company, location, country, platform,
             description, skills, domain, link, hash_id,
             phase_1_complete, phase_2_complete
         )
+        return saved["id"] if saved and saved["inserted"] else None
         
     except Exception as e:
         log.error(f"Error saving job listing ")
+        return None
 
 CREATE_TABLE_SQL = """
 CREATE TABLE IF NOT EXISTS internship_listings (
@@ -239,6 +238,8 @@ class EnhancedInternshipScraper:
         self.wait: Optional[WebDriverWait] = None
         self.storage = LocalStorage()
         self.cleaner = DataCleaner()
+        # IDs of the listings this scraper inserted (not re-scraped ones), for incremental scoring
+        self.new_listing_ids: List[int] = []
         
         # Glassdoor country mapping
         self.country_slug = {
@@ -574,12 +575,13 @@ class EnhancedInternshipScraper:
         
         return jobs_to_process # Return the list with updated descriptions
     
-    async def phase3_clean_and_save(self, pool: asyncpg.Pool, all_jobs: List[Dict]) -> None:
-        """Phase 3: Clean data and save to database"""
+    async def phase3_clean_and_save(self, pool: asyncpg.Pool, all_jobs: List[Dict]) -> List[int]:
+        """Phase 3: Clean data and save to database. Returns the IDs of newly inserted listings."""
         log.info("=== PHASE 3: Cleaning and saving to database ===")
         
         # all_jobs is now passed directly, no need to load from storage again
         
+        new_ids = []
         async with pool.acquire() as conn:
             saved_count = 0
             
@@ -612,14 +614,24 @@ class EnhancedInternshipScraper:
                         continue
                     
                     # Save to database
-                    await save_internship_listing(conn, cleaned_job)
+                    new_id = await save_internship_listing(conn, cleaned_job)
+                    if new_id is not None:
+                        new_ids.append(new_id)
                     saved_count += 1
                     
                 except Exception as e:
                     log.error(f"Error processing job {job.get('Title', 'Unknown')}: {e}")
                     continue
             
-            log.info(f"Successfully saved {saved_count} cleaned job listings to database")
+            log.info(f"Successfully saved {saved_count} cleaned job listings to database ({len(new_ids)} new)")
+        self.new_listing_ids.extend(new_ids)
+
+        # New listings reach every user's stored recommendations without a full recompute
+        try:
+            await ingest_new_listings(new_ids)
+        except Exception as e:
+            log.error(f"Post-ingest refresh failed: {e}")
+        return new_ids
     
     async def scrape_for_user(self, user_id: int) -> None:
         """Scrape internships for a specific user based on their domains"""
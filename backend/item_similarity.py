@@ -0,0 +1,240 @@
+"""
+Offline item-item collaborative filtering.
+
+Periodically computes, from the saves in user_recommendations, the top-K
+most similar listings of every listing (cosine similarity of their co-save
+vectors) and stores them as a compact neighbour table. At request time the
+item-CF score of a listing is the sum of its similarities to the listings
+the user saved: a lookup-and-sum instead of a model fit.
+
+Run once from the command line:
+    python item_similarity.py
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+import scipy.sparse as sp
+
+from db import get_db_pool, close_db_pool
+
+logger = logging.getLogger("item_similarity")
+
+ITEM_NEIGHBORS_PATH = os.getenv("ITEM_NEIGHBORS_PATH", "item_neighbors.npz")
+ITEM_NEIGHBORS_TOP_K = int(os.getenv("ITEM_NEIGHBORS_TOP_K", "50"))
+# Seconds between two rebuilds by the background job (0 disables the job)
+ITEM_NEIGHBORS_REFRESH_SECONDS = float(os.getenv("ITEM_NEIGHBORS_REFRESH_SECONDS", "3600"))
+# Item rows processed per block when computing co-save counts (bounds peak memory)
+_BLOCK_SIZE = 2048
+
+
+class ItemNeighborIndex:
+    """
+    Top-K neighbour table: row r holds the neighbours of listing item_ids[r].
+
+    neighbor_ids is int32 (padded with -1) and similarities float32, both of
+    shape (n_items, K), sorted by decreasing similarity.
+    """
+
+    def __init__(self, item_ids: np.ndarray, neighbor_ids: np.ndarray, similarities: np.ndarray, built_at: Optional[float] = None):
+        self.item_ids = np.asarray(item_ids, dtype=np.int32)
+        self.neighbor_ids = np.asarray(neighbor_ids, dtype=np.int32)
+        self.similarities = np.asarray(similarities, dtype=np.float32)
+        self.built_at = built_at if built_at is not None else time.time()
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    @property
+    def top_k(self) -> int:
+        return self.neighbor_ids.shape[1]
+
+    def score(self, saved_item_ids: Sequence[int], listing_ids: Sequence[int]) -> np.ndarray:
+        """
+        Item-CF score of each of `listing_ids` for a user who saved `saved_item_ids`:
+        the sum of the listing's similarities to the saved listings.
+        """
+        listing_ids = np.asarray(listing_ids, dtype=np.int64)
+        scores = np.zeros(len(listing_ids), dtype=np.float32)
+        if len(self.item_ids) == 0 or len(saved_item_ids) == 0 or len(listing_ids) == 0:
+            return scores
+        saved = np.unique(np.asarray(saved_item_ids, dtype=np.int64))
+        saved = saved[np.isin(saved, self.item_ids)]
+        if len(saved) == 0:
+            return scores
+        rows = np.searchsorted(self.item_ids, saved)
+        neighbors = self.neighbor_ids[rows].ravel()
+        sims = self.similarities[rows].ravel()
+        valid = neighbors >= 0
+        neighbors, sims = neighbors[valid], sims[valid]
+        if len(neighbors) == 0:
+            # Saved listings that no other user saved have no neighbours
+            return scores
+        # Sum similarities per neighbour, then align on listing_ids
+        uniq, inverse = np.unique(neighbors, return_inverse=True)
+        totals = np.bincount(inverse, weights=sims).astype(np.float32)
+        pos = np.searchsorted(uniq, listing_ids)
+        pos = np.minimum(pos, len(uniq) - 1)
+        hit = uniq[pos] == listing_ids
+        scores[hit] = totals[pos[hit]]
+        return scores
+
+    def to_matrix(self, listing_ids: Sequence[int]) -> sp.csr_matrix:
+        """
+        Neighbour table as a sparse (n x n) matrix over `listing_ids`:
+        entry (i, j) is the similarity of listing j in the neighbour list of
+        listing i. A saves matrix multiplied by it gives the same scores as
+        `score`, for many users at once.
+        """
+        listing_ids = np.asarray(listing_ids, dtype=np.int64)
+        n = len(listing_ids)
+        order = np.argsort(listing_ids)
+        sorted_ids = listing_ids[order]
+
+        def positions(ids):
+            pos = np.minimum(np.searchsorted(sorted_ids, ids), max(n - 1, 0))
+            found = (sorted_ids[pos] == ids) if n else np.zeros(len(ids), dtype=bool)
+            return order[pos], found
+
+        src, src_found = positions(np.repeat(self.item_ids.astype(np.int64), self.top_k))
+        dst, dst_found = positions(self.neighbor_ids.ravel().astype(np.int64))
+        keep = src_found & dst_found & (self.neighbor_ids.ravel() >= 0)
+        return sp.csr_matrix(
+            (self.similarities.ravel()[keep], (src[keep], dst[keep])),
+            shape=(n, n),
+            dtype=np.float32,
+        )
+
+    def save(self, path: str = ITEM_NEIGHBORS_PATH) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            item_ids=self.item_ids,
+            neighbor_ids=self.neighbor_ids,
+            similarities=self.similarities,
+            built_at=np.array([self.built_at]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = ITEM_NEIGHBORS_PATH) -> "ItemNeighborIndex":
+        with np.load(path) as data:
+            return cls(data["item_ids"], data["neighbor_ids"], data["similarities"], float(data["built_at"][0]))
+
+
+def build_item_neighbors(interactions: Sequence[tuple], top_k: int = ITEM_NEIGHBORS_TOP_K) -> ItemNeighborIndex:
+    """
+    Build the neighbour table from (user_id, internship_id) save pairs.
+
+    Co-save counts come from the sparse product items x users x items,
+    computed block by block; similarity is count / sqrt(saves_i * saves_j).
+    """
+    pairs = np.asarray(interactions, dtype=np.int64).reshape(-1, 2)
+    user_ids, user_idx = np.unique(pairs[:, 0], return_inverse=True)
+    item_ids, item_idx = np.unique(pairs[:, 1], return_inverse=True)
+    n_items = len(item_ids)
+    neighbor_ids = np.full((n_items, top_k), -1, dtype=np.int32)
+    similarities = np.zeros((n_items, top_k), dtype=np.float32)
+    if n_items == 0:
+        return ItemNeighborIndex(item_ids, neighbor_ids, similarities)
+
+    user_item = sp.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (user_idx, item_idx)),
+        shape=(len(user_ids), n_items),
+    )
+    user_item.data[:] = 1.0  # duplicates count once
+    item_user = user_item.T.tocsr()
+    item_norms = np.sqrt(np.diff(item_user.indptr)).astype(np.float32)
+
+    for start in range(0, n_items, _BLOCK_SIZE):
+        stop = min(start + _BLOCK_SIZE, n_items)
+        co_counts = (item_user[start:stop] @ user_item).tocsr()
+        for local_row in range(stop - start):
+            row = start + local_row
+            lo, hi = co_counts.indptr[local_row], co_counts.indptr[local_row + 1]
+            cols = co_counts.indices[lo:hi]
+            counts = co_counts.data[lo:hi]
+            keep = cols != row
+            cols, counts = cols[keep], counts[keep]
+            if len(cols) == 0:
+                continue
+            sims = counts / (item_norms[row] * item_norms[cols])
+            if len(cols) > top_k:
+                top = np.argpartition(-sims, top_k - 1)[:top_k]
+                cols, sims = cols[top], sims[top]
+            order = np.argsort(-sims)
+            neighbor_ids[row, :len(order)] = item_ids[cols[order]]
+            similarities[row, :len(order)] = sims[order]
+
+    return ItemNeighborIndex(item_ids, neighbor_ids, similarities)
+
+
+# --- Process-wide index ---
+
+_index: Optional[ItemNeighborIndex] = None
+
+
+def get_item_neighbor_index() -> Optional[ItemNeighborIndex]:
+    """The loaded neighbour table, loading it from disk on first use if present."""
+    global _index
+    if _index is None and os.path.exists(ITEM_NEIGHBORS_PATH):
+        try:
+            _index = ItemNeighborIndex.load(ITEM_NEIGHBORS_PATH)
+        except Exception as e:
+            logger.error(f"Could not load item neighbour table from {ITEM_NEIGHBORS_PATH}: {e}")
+    return _index
+
+
+async def fetch_saved_interactions():
+    """All (user_id, internship_id) save pairs."""
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT user_id, internship_id
+            FROM user_recommendations
+            WHERE is_saved = TRUE
+        """)
+    return [(row["user_id"], row["internship_id"]) for row in rows]
+
+
+async def refresh_item_neighbors(top_k: int = ITEM_NEIGHBORS_TOP_K, path: str = ITEM_NEIGHBORS_PATH) -> ItemNeighborIndex:
+    """Rebuild the neighbour table from the current saves, persist it and swap it in."""
+    global _index
+    start = time.perf_counter()
+    interactions = await fetch_saved_interactions()
+    index = await asyncio.to_thread(build_item_neighbors, interactions, top_k)
+    await asyncio.to_thread(index.save, path)
+    _index = index
+    logger.info(
+        f"Item neighbour table rebuilt: {len(index)} listings, {len(interactions)} saves, "
+        f"{time.perf_counter() - start:.2f}s"
+    )
+    return index
+
+
+async def run_item_neighbor_refresh_loop(interval: float = ITEM_NEIGHBORS_REFRESH_SECONDS):
+    """Background job rebuilding the neighbour table every `interval` seconds."""
+    while True:
+        try:
+            await refresh_item_neighbors()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Item neighbour table refresh failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def _main():
+    try:
+        await refresh_item_neighbors()
+    finally:
+        await close_db_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(_main())
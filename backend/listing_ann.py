@@ -0,0 +1,128 @@
+"""
+Approximate nearest-neighbour index over the listing embeddings.
+
+Lets a recommendation request retrieve its few hundred best content
+candidates without scoring the whole catalog. Small catalogs use an exact
+inner-product index; past ANN_IVF_MIN_LISTINGS listings an IVF index is
+trained instead. Both support adding and removing listings by ID, so the
+index follows the embedding store as the scraper inserts listings and
+listings become inactive.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from listing_embeddings import get_embedding_store
+
+logger = logging.getLogger("listing_ann")
+
+# Catalog size from which an IVF index is trained instead of an exact flat index
+ANN_IVF_MIN_LISTINGS = int(os.getenv("ANN_IVF_MIN_LISTINGS", "20000"))
+# Inverted lists probed per search (recall / latency trade-off of the IVF index)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+
+
+class ListingAnnIndex:
+    """FAISS inner-product index keyed by listing ID (vectors are L2-normalised, so scores are cosines)."""
+
+    def __init__(self, index, dimension: int):
+        self.index = index
+        self.dimension = dimension
+        self.listing_ids = set()
+        self.version = None  # embedding store version the index was synced with
+        self._lock = threading.Lock()  # FAISS indexes are not safe for concurrent add/search
+
+    @classmethod
+    def build(cls, listing_ids: Sequence[int], vectors: np.ndarray) -> "ListingAnnIndex":
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        dimension = vectors.shape[1]
+        if len(listing_ids) >= ANN_IVF_MIN_LISTINGS:
+            nlist = int(4 * np.sqrt(len(listing_ids)))
+            quantizer = faiss.IndexFlatIP(dimension)
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+            index.nprobe = ANN_NPROBE
+        else:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        ann = cls(index, dimension)
+        ann.add(listing_ids, vectors)
+        return ann
+
+    def __len__(self) -> int:
+        return len(self.listing_ids)
+
+    def add(self, listing_ids: Sequence[int], vectors: np.ndarray) -> int:
+        """Index `vectors` under `listing_ids`, replacing known IDs."""
+        if len(listing_ids) == 0:
+            return 0
+        ids = np.asarray(listing_ids, dtype=np.int64)
+        self.remove([int(i) for i in ids if int(i) in self.listing_ids])
+        with self._lock:
+            self.index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+            self.listing_ids.update(int(i) for i in ids)
+        return len(ids)
+
+    def remove(self, listing_ids: Sequence[int]) -> int:
+        drop = np.array([int(i) for i in listing_ids if int(i) in self.listing_ids], dtype=np.int64)
+        if len(drop) == 0:
+            return 0
+        with self._lock:
+            self.index.remove_ids(drop)
+            self.listing_ids.difference_update(int(i) for i in drop)
+        return len(drop)
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(listing_ids, similarities) of the `k` nearest listings, best first."""
+        if not self.listing_ids or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.ascontiguousarray(np.asarray(query, dtype=np.float32).reshape(1, -1))
+        with self._lock:
+            scores, ids = self.index.search(query, min(k, len(self.listing_ids)))
+        found = ids[0] >= 0
+        return ids[0][found], scores[0][found]
+
+
+# --- Process-wide index ---
+
+_ann: Optional[ListingAnnIndex] = None
+
+
+def get_ann_index() -> Optional[ListingAnnIndex]:
+    """The index, or None until the listing embeddings are available."""
+    return _ann
+
+
+def _synced_ann(current: Optional[ListingAnnIndex], store) -> ListingAnnIndex:
+    """Index matching the embedding store: incremental adds/removes once built."""
+    needs_ivf = len(store) >= ANN_IVF_MIN_LISTINGS and not isinstance(getattr(current, "index", None), faiss.IndexIVF)
+    if current is None or current.dimension != store.dimension or needs_ivf:
+        ann = ListingAnnIndex.build(store.listing_ids, store.embeddings)
+    else:
+        ann = current
+        store_ids = {int(i) for i in store.listing_ids}
+        ann.remove([i for i in ann.listing_ids if i not in store_ids])
+        missing = [i for i in store_ids if i not in ann.listing_ids]
+        if missing:
+            rows = store.rows_for(missing)
+            ann.add(missing, store.embeddings[rows])
+    ann.version = store.version
+    return ann
+
+
+async def refresh_ann_index() -> Optional[ListingAnnIndex]:
+    """Bring the index in line with the listing embeddings (startup and after each embedding refresh)."""
+    global _ann
+    store = get_embedding_store()
+    if store is None or len(store) == 0:
+        return _ann
+    if _ann is not None and _ann.version == store.version:
+        return _ann
+    _ann = await asyncio.to_thread(_synced_ann, _ann, store)
+    logger.info(f"Listing ANN index synced: {len(_ann)} listings ({type(_ann.index).__name__})")
+    return _ann
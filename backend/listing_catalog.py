@@ -0,0 +1,339 @@
+"""
+In-memory catalog of the active listings, shared across requests.
+
+Each recommendation run used to read its listings from Postgres and build a
+DataFrame from the returned records. The catalog keeps the active listings
+in process, column by column:
+  - IDs (sorted, int64), country/platform category codes (int16) and
+    scraped_at timestamps (datetime64) as NumPy arrays,
+  - display strings (title, company, description...) as one UTF-8 buffer
+    plus an offset array per column, instead of one Python object per value,
+  - the row of each listing in the TF-IDF listing vector store
+    (listing_vectors.py), resolved once per store version.
+
+Scoring frames, texts of listings missing from the vector store and the
+hydration of the final top-N are all served from these arrays.
+
+The catalog is refreshed incrementally: only listings whose scraped_at is
+past the watermark (the latest scraped_at seen, minus an overlap for rows
+committed late) are read again, plus the list of active IDs to drop
+deactivated listings. The refreshed catalog is built off the event loop and
+swapped in, so requests keep reading the previous one meanwhile.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from database_schema import CATALOG_COLUMNS, get_active_listing_ids, get_catalog_listings
+
+logger = logging.getLogger("listing_catalog")
+
+# Seconds between two incremental refreshes by the background job (0 disables the job)
+LISTING_CATALOG_REFRESH_SECONDS = float(os.getenv("LISTING_CATALOG_REFRESH_SECONDS", "60"))
+# Listings scraped up to this many seconds before the watermark are read again, so rows
+# committed by a transaction that started before the last refresh are not missed
+LISTING_CATALOG_OVERLAP_SECONDS = float(os.getenv("LISTING_CATALOG_OVERLAP_SECONDS", "300"))
+
+CATEGORY_COLUMNS = ("country", "platform")
+STRING_COLUMNS = tuple(c for c in CATALOG_COLUMNS if c not in ("id", "scraped_at") + CATEGORY_COLUMNS)
+
+
+class StringColumn:
+    """Strings stored as one UTF-8 buffer; value i is data[offsets[i]:offsets[i + 1]] (None where nulls[i])."""
+
+    def __init__(self, data: bytes, offsets: np.ndarray, nulls: Optional[np.ndarray] = None):
+        self.data = data
+        self.offsets = offsets
+        # Only kept when the column has NULLs
+        self.nulls = nulls if nulls is not None and nulls.any() else None
+
+    @classmethod
+    def from_values(cls, values: Sequence[Optional[str]]) -> "StringColumn":
+        encoded = [v.encode("utf-8") if v is not None else b"" for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        return cls(b"".join(encoded), offsets, nulls)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def take(self, rows: np.ndarray) -> "StringColumn":
+        """Column holding the values at `rows`, in that order."""
+        starts, ends = self.offsets[rows].tolist(), self.offsets[rows + 1].tolist()
+        view = memoryview(self.data)
+        data = b"".join(view[s:e] for s, e in zip(starts, ends))
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(self.offsets[rows + 1] - self.offsets[rows], out=offsets[1:])
+        return StringColumn(data, offsets, self.nulls[rows] if self.nulls is not None else None)
+
+    def concat(self, other: "StringColumn") -> "StringColumn":
+        nulls = None
+        if self.nulls is not None or other.nulls is not None:
+            nulls = np.concatenate([
+                self.nulls if self.nulls is not None else np.zeros(len(self), dtype=bool),
+                other.nulls if other.nulls is not None else np.zeros(len(other), dtype=bool),
+            ])
+        offsets = np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]])
+        return StringColumn(self.data + other.data, offsets, nulls)
+
+    def values(self, rows: Sequence[int]) -> List[Optional[str]]:
+        data, offsets, nulls = self.data, self.offsets, self.nulls
+        return [
+            None if nulls is not None and nulls[r] else data[offsets[r]:offsets[r + 1]].decode("utf-8")
+            for r in rows
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.nbytes + (self.nulls.nbytes if self.nulls is not None else 0)
+
+
+def _encode_categories(values: Sequence[Optional[str]], categories: List[str]):
+    """Codes of `values` in `categories` (-1 for NULL), appending unseen values to a copy of the list."""
+    categories = list(categories)
+    index = {c: code for code, c in enumerate(categories)}
+    codes = np.empty(len(values), dtype=np.int32)
+    for position, value in enumerate(values):
+        if value is None:
+            codes[position] = -1
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(categories)
+            categories.append(value)
+        codes[position] = code
+    # A few dozen countries and platforms: int16 unless that ever overflows
+    dtype = np.int16 if len(categories) < np.iinfo(np.int16).max else np.int32
+    return codes.astype(dtype), categories
+
+
+def _timestamps(values: Sequence[Optional[datetime.datetime]]) -> np.ndarray:
+    """scraped_at values as naive UTC datetime64[us] (NaT for NULL)."""
+    return pd.to_datetime(pd.Series(values, dtype=object), utc=True).dt.tz_convert(None).to_numpy("datetime64[us]")
+
+
+class ListingCatalog:
+    """Active listings as parallel arrays, one row per listing, sorted by ID."""
+
+    def __init__(self, ids: np.ndarray, category_codes: Dict[str, np.ndarray], categories: Dict[str, List[str]],
+                 scraped_at: np.ndarray, strings: Dict[str, StringColumn]):
+        self.ids = ids
+        self.category_codes = category_codes
+        self.categories = categories
+        self.scraped_at = scraped_at
+        self.strings = strings
+        # Bumped on every refresh that changed something
+        self.version = 0
+        self.refreshed_at = time.time()
+        # (store identity, store version, rows) of the last vector_rows() lookup
+        self._vector_rows = None
+
+    @classmethod
+    def empty(cls) -> "ListingCatalog":
+        return cls(
+            np.empty(0, dtype=np.int64),
+            {c: np.empty(0, dtype=np.int16) for c in CATEGORY_COLUMNS},
+            {c: [] for c in CATEGORY_COLUMNS},
+            np.empty(0, dtype="datetime64[us]"),
+            {c: StringColumn.from_values([]) for c in STRING_COLUMNS},
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def watermark(self) -> Optional[datetime.datetime]:
+        """Latest scraped_at in the catalog (timezone-aware), None when empty."""
+        scraped_at = self.scraped_at[~np.isnat(self.scraped_at)]
+        if not len(scraped_at):
+            return None
+        return pd.Timestamp(scraped_at.max()).tz_localize("UTC").to_pydatetime()
+
+    def merged(self, columns: Dict[str, list], active_ids: Optional[Sequence[int]] = None) -> "ListingCatalog":
+        """
+        Catalog with the rows of `columns` (as returned by get_catalog_listings)
+        added or replaced, and without the listings missing from `active_ids`.
+        Rows already held with the same scraped_at (re-read in the watermark
+        overlap) are skipped; returns this catalog when nothing changed.
+        """
+        new_ids = np.asarray(columns["id"], dtype=np.int64)
+        new_scraped_at = _timestamps(columns["scraped_at"])
+        rows = self.rows(new_ids)
+        held = np.isin(new_ids, self.ids[rows])
+        unchanged = np.zeros(len(new_ids), dtype=bool)
+        unchanged[held] = self.scraped_at[rows] == new_scraped_at[held]
+        if unchanged.any():
+            fresh = np.flatnonzero(~unchanged)
+            columns = {c: [values[r] for r in fresh] for c, values in columns.items()}
+            new_ids, new_scraped_at = new_ids[fresh], new_scraped_at[fresh]
+        keep = ~np.isin(self.ids, new_ids)
+        if active_ids is not None:
+            keep &= np.isin(self.ids, np.asarray(active_ids, dtype=np.int64))
+        if not len(new_ids) and keep.all():
+            return self
+
+        kept = np.flatnonzero(keep)
+        category_codes, categories = {}, {}
+        for column in CATEGORY_COLUMNS:
+            codes, categories[column] = _encode_categories(columns[column], self.categories[column])
+            category_codes[column] = np.concatenate([self.category_codes[column][kept], codes]).astype(codes.dtype)
+        ids = np.concatenate([self.ids[kept], new_ids])
+        scraped_at = np.concatenate([self.scraped_at[kept], new_scraped_at])
+        strings = {}
+        for column, values in self.strings.items():
+            old = values if keep.all() else values.take(kept)
+            strings[column] = old.concat(StringColumn.from_values(columns[column]))
+
+        # New IDs are usually past every kept one (serial IDs): the order is then already right
+        order = np.argsort(ids, kind="stable")
+        if not np.array_equal(order, np.arange(len(ids))):
+            ids, scraped_at = ids[order], scraped_at[order]
+            category_codes = {c: codes[order] for c, codes in category_codes.items()}
+            strings = {c: values.take(order) for c, values in strings.items()}
+
+        catalog = ListingCatalog(ids, category_codes, categories, scraped_at, strings)
+        catalog.version = self.version + 1
+        return catalog
+
+    def rows(self, listing_ids: Optional[Sequence[int]] = None, limit: Optional[int] = None) -> np.ndarray:
+        """
+        Rows of the listings of `listing_ids` that are in the catalog, in that
+        order (every row when None). With `limit`, only the most recently scraped ones.
+        """
+        if listing_ids is None:
+            rows = np.arange(len(self.ids))
+        else:
+            wanted = np.asarray(listing_ids, dtype=np.int64)
+            rows = np.minimum(np.searchsorted(self.ids, wanted), max(len(self.ids) - 1, 0))
+            rows = rows[self.ids[rows] == wanted] if len(self.ids) else np.empty(0, dtype=np.int64)
+        if limit is not None and len(rows) > limit:
+            rows = rows[np.argsort(self.scraped_at[rows], kind="stable")[-limit:]]
+        return rows
+
+    def scoring_frame(self, rows: np.ndarray, with_text: bool = False) -> pd.DataFrame:
+        """
+        DataFrame of `rows` indexed by listing ID, with categorical country and
+        platform columns built on the codes; the scoring text columns too with `with_text`.
+        """
+        data = {
+            column: pd.Categorical.from_codes(self.category_codes[column][rows], self.categories[column])
+            for column in CATEGORY_COLUMNS
+        }
+        if with_text:
+            for column in ("title", "description", "skills", "domain"):
+                data[column] = self.strings[column].values(rows)
+        return pd.DataFrame(data, index=pd.Index(self.ids[rows], name="id"))
+
+    def records(self, rows: np.ndarray) -> List[dict]:
+        """Listings of `rows` as dicts with every catalog column (hydration)."""
+        columns = {"id": self.ids[rows].tolist()}
+        for column in CATEGORY_COLUMNS:
+            lookup = self.categories[column] + [None]
+            columns[column] = [lookup[code] for code in self.category_codes[column][rows].tolist()]
+        for column, values in self.strings.items():
+            columns[column] = values.values(rows)
+        scraped_at = pd.to_datetime(self.scraped_at[rows]).tz_localize("UTC")
+        columns["scraped_at"] = [None if pd.isna(t) else t.to_pydatetime() for t in scraped_at]
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*(columns[n] for n in names))]
+
+    def vector_rows(self, store) -> np.ndarray:
+        """Row of every catalog listing in the listing vector store `store` (-1 when not vectorised yet)."""
+        cached = self._vector_rows
+        if cached is not None and cached[0] is store and cached[1] == store.version:
+            return cached[2]
+        rows = store.rows_for(self.ids).astype(np.int32)
+        self._vector_rows = (store, store.version, rows)
+        return rows
+
+    def memory_usage(self) -> dict:
+        """Bytes held by each array and string column, and their total."""
+        usage = {"ids": self.ids.nbytes, "scraped_at": self.scraped_at.nbytes}
+        for column, codes in self.category_codes.items():
+            usage[column] = codes.nbytes
+        for column, values in self.strings.items():
+            usage[column] = values.nbytes
+        if self._vector_rows is not None:
+            usage["vector_rows"] = self._vector_rows[2].nbytes
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def stats(self) -> dict:
+        watermark = self.watermark
+        return {
+            "listings": len(self),
+            "version": self.version,
+            "watermark": watermark.isoformat() if watermark else None,
+            "refreshed_at": self.refreshed_at,
+            "categories": {c: len(v) for c, v in self.categories.items()},
+            "memory_bytes": self.memory_usage(),
+        }
+
+
+# --- Process-wide catalog ---
+
+_catalog: Optional[ListingCatalog] = None
+_refresh_lock = asyncio.Lock()
+
+
+def get_listing_catalog() -> Optional[ListingCatalog]:
+    """The loaded catalog, or None before the first successful refresh."""
+    return _catalog
+
+
+def get_catalog_stats() -> dict:
+    return _catalog.stats() if _catalog is not None else {"listings": 0, "loaded": False}
+
+
+async def refresh_listing_catalog() -> Optional[ListingCatalog]:
+    """
+    Bring the catalog in line with the active listings.
+
+    The first call loads every active listing; later ones only read the
+    listings scraped since the watermark (minus LISTING_CATALOG_OVERLAP_SECONDS),
+    those active but still missing, and the active IDs.
+    """
+    global _catalog
+    async with _refresh_lock:
+        start = time.perf_counter()
+        current = _catalog or ListingCatalog.empty()
+        watermark = current.watermark
+        since = watermark - datetime.timedelta(seconds=LISTING_CATALOG_OVERLAP_SECONDS) if watermark else None
+        active_ids = await get_active_listing_ids()
+        changed = await get_catalog_listings(scraped_since=since)
+        # Active listings neither in the catalog nor past the watermark (e.g. committed late)
+        known = np.concatenate([current.ids, np.asarray(changed["id"], dtype=np.int64)])
+        missing = np.setdiff1d(np.asarray(active_ids, dtype=np.int64), known)
+        if len(missing):
+            late = await get_catalog_listings(listing_ids=missing.tolist())
+            changed = {c: changed[c] + late[c] for c in CATALOG_COLUMNS}
+        catalog = await asyncio.to_thread(current.merged, changed, active_ids)
+        catalog.refreshed_at = time.time()
+        if catalog is not current or _catalog is None:
+            memory = catalog.memory_usage()["total"]
+            logger.info(
+                f"Listing catalog refreshed: {len(catalog)} listings ({len(changed['id'])} read), "
+                f"{memory / 1e6:.1f} MB, {time.perf_counter() - start:.2f}s"
+            )
+        _catalog = catalog
+        return _catalog
+
+
+async def run_listing_catalog_refresh_loop(interval: float = LISTING_CATALOG_REFRESH_SECONDS):
+    """Background job refreshing the catalog every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_listing_catalog()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Listing catalog refresh failed: {e}")
@@ -0,0 +1,239 @@
+"""
+Precomputed sentence embeddings of the internship catalog.
+
+Semantic alternative to the TF-IDF vectors of listing_vectors.py: every
+listing is embedded once, when it enters the catalog, with the multilingual
+SentenceTransformer already loaded by the API (it handles our French and
+English listings alike). Vectors are L2-normalised, saved to disk as a
+compact float16 matrix and held in float32 for scoring. Scoring a user is a
+single embedding of their CV keywords and domain followed by one
+matrix-vector product.
+
+The encoder is injected with set_embedding_encoder() so this module does not
+load a second copy of the model.
+"""
+
+import asyncio
+import copy
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from database_schema import get_active_internship_listings
+from listing_catalog import get_listing_catalog
+from listing_vectors import listing_text
+
+logger = logging.getLogger("listing_embeddings")
+
+LISTING_EMBEDDINGS_PATH = os.getenv("LISTING_EMBEDDINGS_PATH", "listing_embeddings.npz")
+# On-disk dtype of the embedding matrix: float16 halves the file for a negligible loss.
+# In memory the matrix is always float32: numpy has no BLAS matrix-vector product for float16
+LISTING_EMBEDDINGS_DTYPE = np.dtype(os.getenv("LISTING_EMBEDDINGS_DTYPE", "float16"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+_encoder = None
+
+
+def set_embedding_encoder(encoder) -> None:
+    """Register the SentenceTransformer (or any object with a compatible `encode`) used for embeddings."""
+    global _encoder
+    _encoder = encoder
+
+
+def get_embedding_encoder():
+    return _encoder
+
+
+def _encoder_name(encoder) -> str:
+    return str(getattr(encoder, "model_name_or_path", None) or type(encoder).__name__)
+
+
+def encode_texts(texts: Sequence[str], encoder=None) -> np.ndarray:
+    """L2-normalised float32 embeddings of `texts` (blocking: run it off the event loop)."""
+    encoder = encoder or _encoder
+    if encoder is None:
+        raise RuntimeError("No embedding encoder registered")
+    vectors = encoder.encode(list(texts), batch_size=EMBEDDING_BATCH_SIZE, show_progress_bar=False)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class ListingEmbeddingStore:
+    """L2-normalised float32 listing embeddings, one row per listing, saved as LISTING_EMBEDDINGS_DTYPE."""
+
+    def __init__(self, embeddings: np.ndarray, listing_ids: Sequence[int], model_name: str):
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.listing_ids = np.asarray(listing_ids, dtype=np.int64)
+        self.model_name = model_name
+        self._rows: Dict[int, int] = {int(i): r for r, i in enumerate(self.listing_ids)}
+        # Bumped on every change so callers can tell when the catalog vectors moved
+        self.version = 0
+        self.updated_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.listing_ids)
+
+    def __contains__(self, listing_id) -> bool:
+        return int(listing_id) in self._rows
+
+    @property
+    def dimension(self) -> int:
+        return self.embeddings.shape[1]
+
+    def clone(self) -> "ListingEmbeddingStore":
+        """Copy that can be modified off the event loop while this one keeps serving."""
+        other = copy.copy(self)
+        other._rows = dict(self._rows)
+        return other
+
+    def _touch(self):
+        self._rows = {int(i): r for r, i in enumerate(self.listing_ids)}
+        self.version += 1
+        self.updated_at = time.time()
+
+    def add(self, listing_ids: Sequence[int], vectors: np.ndarray) -> int:
+        """Append embeddings, replacing rows of known IDs."""
+        if len(listing_ids) == 0:
+            return 0
+        ids = np.asarray(listing_ids, dtype=np.int64)
+        self.remove([int(i) for i in ids if int(i) in self._rows])
+        self.embeddings = np.vstack([self.embeddings, np.asarray(vectors, dtype=np.float32)])
+        self.listing_ids = np.concatenate([self.listing_ids, ids])
+        self._touch()
+        return len(ids)
+
+    def remove(self, listing_ids: Iterable[int]) -> int:
+        """Drop the rows of `listing_ids` (e.g. listings that became inactive)."""
+        drop = {int(i) for i in listing_ids if int(i) in self._rows}
+        if not drop:
+            return 0
+        keep = ~np.isin(self.listing_ids, np.fromiter(drop, dtype=np.int64))
+        self.embeddings = self.embeddings[keep]
+        self.listing_ids = self.listing_ids[keep]
+        self._touch()
+        return len(drop)
+
+    def rows_for(self, listing_ids: Sequence[int]) -> np.ndarray:
+        """Matrix row of each listing ID, -1 for IDs not in the store."""
+        rows = self._rows
+        return np.fromiter((rows.get(int(i), -1) for i in listing_ids), dtype=np.int64, count=len(listing_ids))
+
+    def score_vector(self, query: np.ndarray, listing_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Cosine similarity between a normalised query embedding and each listing.
+
+        Scores follow the order of `listing_ids` (0 for unknown IDs), and only
+        those rows are computed; the whole store when `listing_ids` is None.
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if listing_ids is None:
+            return self.embeddings @ query
+        rows = self.rows_for(listing_ids)
+        out = np.zeros(len(rows), dtype=np.float32)
+        found = rows >= 0
+        # Only the requested rows are multiplied, not the whole catalog
+        out[found] = self.embeddings[rows[found]] @ query
+        return out
+
+    def save(self, path: str = LISTING_EMBEDDINGS_PATH) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            embeddings=self.embeddings.astype(LISTING_EMBEDDINGS_DTYPE, copy=False),
+            listing_ids=self.listing_ids,
+            model_name=np.array(self.model_name),
+            version=np.array(self.version),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = LISTING_EMBEDDINGS_PATH) -> "ListingEmbeddingStore":
+        with np.load(path) as data:
+            store = cls(data["embeddings"], data["listing_ids"], str(data["model_name"]))
+            store.version = int(data["version"])
+        return store
+
+
+# --- Process-wide store ---
+
+_store: Optional[ListingEmbeddingStore] = None
+_refresh_lock = asyncio.Lock()
+
+
+def get_embedding_store() -> Optional[ListingEmbeddingStore]:
+    """The loaded store, or None if it has not been initialised."""
+    return _store
+
+
+def _synced_store(current: Optional[ListingEmbeddingStore], listings: List[dict], encoder) -> ListingEmbeddingStore:
+    """Store matching `listings`: only listings without an embedding are encoded."""
+    model_name = _encoder_name(encoder)
+    if current is None or current.model_name != model_name:
+        store = ListingEmbeddingStore(np.empty((0, 0)), [], model_name)
+        if current is not None:
+            store.version = current.version + 1
+    else:
+        store = current.clone()
+    active_ids = {int(l["id"]) for l in listings}
+    store.remove([i for i in store.listing_ids if int(i) not in active_ids])
+    missing = [l for l in listings if int(l["id"]) not in store]
+    if missing:
+        vectors = encode_texts([listing_text(l) for l in missing], encoder)
+        if len(store) == 0:
+            store.embeddings = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        store.add([int(l["id"]) for l in missing], vectors)
+    return store
+
+
+async def refresh_embedding_store(listings: Optional[List[dict]] = None, path: str = LISTING_EMBEDDINGS_PATH) -> Optional[ListingEmbeddingStore]:
+    """
+    Embed the listings that entered the catalog, drop inactive ones and persist.
+
+    Call after the scraper inserted listings. Encoding runs in a thread on a
+    copy of the store, which is swapped in once complete.
+    """
+    global _store
+    encoder = _encoder
+    if encoder is None:
+        logger.warning("No embedding encoder registered: listing embeddings left unchanged.")
+        return _store
+    async with _refresh_lock:
+        if listings is None:
+            # The in-memory catalog holds every active listing; Postgres until it is loaded
+            catalog = get_listing_catalog()
+            if catalog is not None:
+                listings = await asyncio.to_thread(catalog.records, catalog.rows())
+            else:
+                listings = await get_active_internship_listings(limit=None)
+        if not listings:
+            logger.warning("No active listings: listing embeddings left unchanged.")
+            return _store
+        start = time.perf_counter()
+        store = await asyncio.to_thread(_synced_store, _store, listings, encoder)
+        await asyncio.to_thread(store.save, path)
+        _store = store
+        logger.info(
+            f"Listing embeddings refreshed: {len(store)} listings, version {store.version}, "
+            f"{time.perf_counter() - start:.2f}s"
+        )
+        return _store
+
+
+async def init_embedding_store(path: str = LISTING_EMBEDDINGS_PATH) -> Optional[ListingEmbeddingStore]:
+    """Load the embeddings saved on disk (if any), then embed the listings still missing (startup)."""
+    global _store
+    if _store is None and os.path.exists(path):
+        try:
+            _store = await asyncio.to_thread(ListingEmbeddingStore.load, path)
+            logger.info(f"Loaded listing embeddings from {path} ({len(_store)} listings)")
+        except Exception as e:
+            logger.error(f"Could not load listing embeddings from {path}: {e}")
+    try:
+        return await refresh_embedding_store(path=path)
+    except Exception as e:
+        logger.error(f"Could not refresh listing embeddings: {e}")
+        return _store
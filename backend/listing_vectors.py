@@ -0,0 +1,349 @@
+"""
+Persistent TF-IDF vectors of the internship catalog.
+
+Fitting a TfidfVectorizer over every active listing on each recommendation
+request dominated its cost. The store fits the vocabulary once, keeps the
+listing vectors as a sparse CSR matrix, saves both to disk, reloads them at
+startup and is updated when the scraper adds listings. Per request only the
+user's keywords are transformed and multiplied against the matrix.
+
+Besides the vector of the whole listing text, every listing keeps one vector
+per field (title, skills, domain, description) in the same vocabulary, so the
+field weights stored in a user's preferences apply at query time: the score
+is the weighted sum of the four per-field cosines, and a weight change
+re-ranks without refitting anything.
+"""
+
+import asyncio
+import copy
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import joblib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from database_schema import get_active_internship_listings
+from listing_catalog import get_listing_catalog
+
+logger = logging.getLogger("listing_vectors")
+
+LISTING_VECTORS_PATH = os.getenv("LISTING_VECTORS_PATH", "listing_vectors.pkl")
+# Refit the vocabulary once this fraction of the catalog was added with the old one
+REFIT_RATIO = float(os.getenv("LISTING_VECTORS_REFIT_RATIO", "0.2"))
+
+TEXT_FIELDS = ("title", "description", "skills", "domain")
+# Fields scored separately, with the user_preferences column holding each weight
+FIELD_WEIGHT_COLUMNS = (
+    ("title", "title_weight"),
+    ("skills", "skills_weight"),
+    ("domain", "domain_weight"),
+    ("description", "description_weight"),
+)
+# user_preferences defaults, used for users without stored preferences
+DEFAULT_FIELD_WEIGHTS = {"title_weight": 0.2, "skills_weight": 0.3, "domain_weight": 0.4, "description_weight": 0.1}
+
+
+def listing_text(listing) -> str:
+    """Text of a listing used for content matching (title, description, skills, domain)."""
+    return " ".join((listing.get(field) or "") for field in TEXT_FIELDS)
+
+
+def listing_text_hash(listing) -> int:
+    """Stable 64-bit hash of the text fields of a listing, to spot listings edited in place."""
+    text = "\x1f".join((listing.get(field) or "") for field in TEXT_FIELDS)
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def listing_texts(listings_df: pd.DataFrame) -> pd.Series:
+    """listing_text for every row of a DataFrame, with column-wise string ops instead of apply(axis=1)."""
+    texts = None
+    for field in TEXT_FIELDS:
+        if field in listings_df.columns:
+            column = listings_df[field].fillna("").astype(str)
+        else:
+            column = pd.Series("", index=listings_df.index)
+        texts = column if texts is None else texts + " " + column
+    return texts
+
+
+def field_weights(user_prefs: Optional[dict]) -> np.ndarray:
+    """Title/skills/domain/description weights of a user (FIELD_WEIGHT_COLUMNS order), normalised to sum to 1."""
+    prefs = user_prefs or DEFAULT_FIELD_WEIGHTS
+    weights = np.array(
+        [max(float(prefs.get(column) if prefs.get(column) is not None else DEFAULT_FIELD_WEIGHTS[column]), 0.0)
+         for _, column in FIELD_WEIGHT_COLUMNS],
+        dtype=np.float32,
+    )
+    total = weights.sum()
+    return weights / total if total > 0 else np.full(len(weights), 1.0 / len(weights), dtype=np.float32)
+
+
+def field_texts(listings: Sequence[dict], field: str) -> List[str]:
+    return [(l.get(field) or "") for l in listings]
+
+
+def weighted_queries(queries: sp.csr_matrix, weights: np.ndarray) -> sp.csr_matrix:
+    """
+    Query vectors laid out like ListingVectorStore.field_matrix: one block per field, scaled by its weight.
+
+    `weights` holds one row of field weights per query; the product with the
+    field matrix is then the weighted sum of the per-field cosines in a
+    single sparse product.
+    """
+    weights = np.asarray(weights, dtype=np.float32).reshape(queries.shape[0], -1)
+    return sp.hstack(
+        [queries.multiply(weights[:, f:f + 1]) for f in range(weights.shape[1])], format="csr"
+    ).astype(np.float32)
+
+
+def _rows_product(matrix, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """matrix[rows] @ query, multiplying only those rows unless they are most of the matrix."""
+    if 2 * len(rows) > matrix.shape[0]:
+        # Gathering most rows costs more than the full product
+        return (matrix @ query)[rows]
+    return matrix[rows] @ query
+
+
+class ListingVectorStore:
+    """Fitted TF-IDF vocabulary plus the L2-normalised vectors of the listings, one CSR row each (and one per field)."""
+
+    def __init__(self, vectorizer: TfidfVectorizer, matrix: sp.csr_matrix, listing_ids: Sequence[int],
+                 field_matrix: Optional[sp.csr_matrix] = None, text_hashes: Optional[np.ndarray] = None):
+        self.vectorizer = vectorizer
+        self.matrix = sp.csr_matrix(matrix, dtype=np.float32)
+        # Per-field vectors side by side, one vocabulary-wide block per FIELD_WEIGHT_COLUMNS field;
+        # rows aligned with `matrix`
+        self.field_matrix = sp.csr_matrix(field_matrix, dtype=np.float32) if field_matrix is not None else None
+        self.listing_ids = np.asarray(listing_ids, dtype=np.int64)
+        # listing_text_hash of each row, compared on refresh to re-vectorise edited listings
+        self.text_hashes = np.asarray(text_hashes, dtype=np.int64) if text_hashes is not None else None
+        self._rows: Dict[int, int] = {int(i): r for r, i in enumerate(self.listing_ids)}
+        self.fitted_count = len(self.listing_ids)
+        self.added_since_fit = 0
+        # Bumped on every change so callers can tell when the catalog vectors moved
+        self.version = 0
+        self.updated_at = time.time()
+
+    @classmethod
+    def build(cls, listings: Sequence[dict]) -> "ListingVectorStore":
+        """Fit the vocabulary on `listings` and vectorise them."""
+        vectorizer = TfidfVectorizer(stop_words="english", dtype=np.float32)
+        matrix = vectorizer.fit_transform([listing_text(l) for l in listings])
+        store = cls(vectorizer, matrix, [int(l["id"]) for l in listings],
+                    text_hashes=[listing_text_hash(l) for l in listings])
+        store.field_matrix = store.transform_fields(listings)
+        return store
+
+    def __setstate__(self, state):
+        # Stores pickled before per-field vectors or text hashes existed load without them (and get refitted)
+        state.setdefault("field_matrix", None)
+        state.setdefault("text_hashes", None)
+        self.__dict__.update(state)
+
+    def __len__(self) -> int:
+        return len(self.listing_ids)
+
+    def __contains__(self, listing_id) -> bool:
+        return int(listing_id) in self._rows
+
+    def clone(self) -> "ListingVectorStore":
+        """Copy that can be modified off the event loop while this one keeps serving."""
+        other = copy.copy(self)
+        other._rows = dict(self._rows)
+        return other
+
+    def needs_refit(self) -> bool:
+        if self.field_matrix is None or self.text_hashes is None:
+            return True
+        return self.added_since_fit > REFIT_RATIO * max(self.fitted_count, 1)
+
+    def _touch(self):
+        self._rows = {int(i): r for r, i in enumerate(self.listing_ids)}
+        self.version += 1
+        self.updated_at = time.time()
+
+    def add(self, listings: Sequence[dict]) -> int:
+        """Vectorise `listings` with the fitted vocabulary, replacing rows of known IDs."""
+        if not listings:
+            return 0
+        ids = np.array([int(l["id"]) for l in listings], dtype=np.int64)
+        known = [int(i) for i in ids if int(i) in self._rows]
+        if known:
+            self.remove(known)
+        vectors = self.vectorizer.transform([listing_text(l) for l in listings]).astype(np.float32)
+        self.matrix = sp.vstack([self.matrix, vectors], format="csr")
+        if self.field_matrix is not None:
+            self.field_matrix = sp.vstack([self.field_matrix, self.transform_fields(listings)], format="csr")
+        self.listing_ids = np.concatenate([self.listing_ids, ids])
+        if self.text_hashes is not None:
+            hashes = np.array([listing_text_hash(l) for l in listings], dtype=np.int64)
+            self.text_hashes = np.concatenate([self.text_hashes, hashes])
+        self.added_since_fit += len(ids) - len(known)
+        self._touch()
+        return len(ids)
+
+    def remove(self, listing_ids: Iterable[int]) -> int:
+        """Drop the rows of `listing_ids` (e.g. listings that became inactive)."""
+        drop = {int(i) for i in listing_ids if int(i) in self._rows}
+        if not drop:
+            return 0
+        keep = ~np.isin(self.listing_ids, np.fromiter(drop, dtype=np.int64))
+        self.matrix = self.matrix[keep]
+        if self.field_matrix is not None:
+            self.field_matrix = self.field_matrix[keep]
+        if self.text_hashes is not None:
+            self.text_hashes = self.text_hashes[keep]
+        self.listing_ids = self.listing_ids[keep]
+        self._touch()
+        return len(drop)
+
+    def rows_for(self, listing_ids: Sequence[int]) -> np.ndarray:
+        """Matrix row of each listing ID, -1 for IDs not in the store."""
+        rows = self._rows
+        return np.fromiter((rows.get(int(i), -1) for i in listing_ids), dtype=np.int64, count=len(listing_ids))
+
+    def transform_query(self, text: str) -> sp.csr_matrix:
+        return self.vectorizer.transform([text]).astype(np.float32)
+
+    def transform_fields(self, listings: Sequence[dict]) -> sp.csr_matrix:
+        """Per-field vectors of `listings` with the fitted vocabulary, laid out like `field_matrix`."""
+        return sp.hstack(
+            [self.vectorizer.transform(field_texts(listings, field)) for field, _ in FIELD_WEIGHT_COLUMNS],
+            format="csr",
+        ).astype(np.float32)
+
+    def score(self, text: str, listing_ids: Optional[Sequence[int]] = None, weights: Optional[np.ndarray] = None,
+              rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity between `text` and each listing.
+
+        Rows are L2-normalised, so this is a single sparse dot product; with
+        `weights` (see field_weights) it is the weighted sum of the four
+        per-field cosines, still computed as one product. Scores follow the
+        order of `listing_ids` (0 for unknown IDs), or of `rows` when the
+        caller already resolved them with rows_for(), and only those rows are
+        multiplied; the whole store when neither is given.
+        """
+        query = self.transform_query(text)
+        matrix = self.matrix
+        if weights is not None and self.field_matrix is not None:
+            query, matrix = weighted_queries(query, weights), self.field_matrix
+        # Dense query: a sparse matrix-vector product, much cheaper than sparse x sparse
+        query = query.toarray().ravel()
+        if rows is None:
+            if listing_ids is None:
+                return matrix @ query
+            rows = self.rows_for(listing_ids)
+        out = np.zeros(len(rows), dtype=np.float32)
+        found = rows >= 0
+        out[found] = _rows_product(matrix, rows[found], query)
+        return out
+
+    def top_k(self, text: str, k: int, weights: Optional[np.ndarray] = None):
+        """(listing_ids, scores) of the `k` listings closest to `text`, best first (zero scores excluded)."""
+        scores = self.score(text, weights=weights)
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[scores[top] > 0]
+        return self.listing_ids[top], scores[top]
+
+    def save(self, path: str = LISTING_VECTORS_PATH) -> None:
+        tmp_path = f"{path}.tmp"
+        joblib.dump(self, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = LISTING_VECTORS_PATH) -> "ListingVectorStore":
+        store = joblib.load(path)
+        if not isinstance(store, cls):
+            raise TypeError(f"{path} does not contain a {cls.__name__}")
+        return store
+
+
+# --- Process-wide store ---
+
+_store: Optional[ListingVectorStore] = None
+_refresh_lock = asyncio.Lock()
+
+
+def get_listing_store() -> Optional[ListingVectorStore]:
+    """The loaded store, or None if it has not been initialised."""
+    return _store
+
+
+def _synced_store(current: Optional[ListingVectorStore], listings: List[dict]) -> ListingVectorStore:
+    """
+    Store matching `listings` exactly: incremental when possible, full refit otherwise.
+
+    New listings and listings whose text changed under the same ID are
+    (re)vectorised; the version only moves when something changed.
+    """
+    if current is None or current.needs_refit():
+        store = ListingVectorStore.build(listings)
+        # Keep the version monotonic across refits: caches keyed on it must not see it go back
+        store.version = current.version + 1 if current is not None else 0
+        return store
+    store = current.clone()
+    active_ids = {int(l["id"]) for l in listings}
+    store.remove([i for i in store.listing_ids if int(i) not in active_ids])
+    rows = store._rows
+    store.add([
+        l for l in listings
+        if int(l["id"]) not in rows or store.text_hashes[rows[int(l["id"])]] != listing_text_hash(l)
+    ])
+    return store
+
+
+async def refresh_listing_store(listings: Optional[List[dict]] = None, path: str = LISTING_VECTORS_PATH) -> Optional[ListingVectorStore]:
+    """
+    Bring the store in line with the active catalog and persist it.
+
+    Call after the scraper inserted listings (and after refresh_listing_catalog,
+    which it reads the listings from once loaded). The work runs in a thread on
+    a copy of the store, which is swapped in once complete.
+    """
+    global _store
+    async with _refresh_lock:
+        if listings is None:
+            # The in-memory catalog holds every active listing; Postgres until it is loaded
+            catalog = get_listing_catalog()
+            if catalog is not None:
+                listings = await asyncio.to_thread(catalog.records, catalog.rows())
+            else:
+                listings = await get_active_internship_listings(limit=None)
+        if not listings:
+            logger.warning("No active listings: listing vector store left unchanged.")
+            return _store
+        store = await asyncio.to_thread(_synced_store, _store, listings)
+        if _store is not None and store.version == _store.version:
+            # Nothing added, edited or removed: keep the current store and the file on disk
+            return _store
+        await asyncio.to_thread(store.save, path)
+        _store = store
+        logger.info(f"Listing vector store refreshed: {len(store)} listings, version {store.version}")
+        return _store
+
+
+async def init_listing_store(path: str = LISTING_VECTORS_PATH) -> Optional[ListingVectorStore]:
+    """Load the store saved on disk (if any), then sync it with the database (startup)."""
+    global _store
+    if _store is None and os.path.exists(path):
+        try:
+            _store = await asyncio.to_thread(ListingVectorStore.load, path)
+            logger.info(f"Loaded listing vector store from {path} ({len(_store)} listings)")
+        except Exception as e:
+            logger.error(f"Could not load listing vector store from {path}: {e}")
+    try:
+        return await refresh_listing_store(path=path)
+    except Exception as e:
+        logger.error(f"Could not refresh listing vector store: {e}")
+        return _store
@@ -3,7 +3,7 @@ import io
 import json
 import logging
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional, Union
 from sentence_transformers import SentenceTransformer
 import faiss
@@ -12,20 +12,38 @@ import re
 import difflib
 import unicodedata
 from fastapi import BackgroundTasks   
-from recommendation import generate_hybrid_recommendations
+from recommendation import generate_hybrid_recommendations, get_recommendation_cache_stats
+from listing_catalog import (
+    refresh_listing_catalog, run_listing_catalog_refresh_loop, get_catalog_stats, LISTING_CATALOG_REFRESH_SECONDS,
+)
+from listing_vectors import init_listing_store, get_listing_store
+from listing_embeddings import set_embedding_encoder, init_embedding_store, refresh_embedding_store
+from listing_ann import refresh_ann_index
+from scoring_pool import get_scoring_stats, shutdown_scoring_pool
+from stage_timings import get_stage_stats
+from item_similarity import run_item_neighbor_refresh_loop, ITEM_NEIGHBORS_REFRESH_SECONDS
+from batch_recommendations import run_batch_recommendations_loop, BATCH_RECOMMENDATIONS_INTERVAL_SECONDS
 import asyncio
 from database_schema import get_db_connection
+from db import init_db_pool, close_db_pool, get_pool_stats, register_prepared_statement
+from password_hashing import (
+    verify_password,
+    get_password_hash,
+    get_hashing_stats,
+    shutdown_hashing_pool,
+    HashingBusyError,
+)
 import asyncpg
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import (
     FastAPI, Depends, HTTPException, status,
-    BackgroundTasks, File, UploadFile
+    BackgroundTasks, File, UploadFile, Request
 )
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
 
 import pdfplumber
@@ -39,6 +57,11 @@ from database_schema import (
     get_internship_listing,
     save_user_preferences,
     get_user_preferences,
+    get_cv_analysis,
+    upsert_cv_keywords,
+    get_user_cache_stats,
+    get_user_recommendations,
+    get_recommendation_state,
   
     mark_recommendation_viewed,
   
@@ -67,16 +90,62 @@ logger = logging.getLogger("internship_api")
 SECRET_KEY = os.getenv("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # ---------------------
 # FastAPI app and middleware
 # ---------------------
+async def init_semantic_index():
+    """Embed the catalog (incrementally) and build the ANN candidate index over it."""
+    await init_embedding_store()
+    try:
+        await refresh_ann_index()
+    except Exception as e:
+        logger.error(f"Could not build the listing ANN index: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared asyncpg pool for the whole process
+    await init_db_pool()
+    logger.info(f"Database pool ready: {get_pool_stats()}")
+    # Active listings kept in memory as arrays, shared by every scoring path; the stores
+    # below are synced from it. Postgres is read directly until it loads.
+    try:
+        await refresh_listing_catalog()
+    except Exception as e:
+        logger.error(f"Could not load the listing catalog: {e}")
+    catalog_task = None
+    if LISTING_CATALOG_REFRESH_SECONDS > 0:
+        catalog_task = asyncio.create_task(run_listing_catalog_refresh_loop())
+    # Fitted TF-IDF vocabulary + listing vectors, reloaded from disk and synced with the catalog
+    await init_listing_store()
+    # Listing embeddings for semantic matching (computed with the chatbot's multilingual model)
+    # and the ANN index used for candidate retrieval. Embedding a new catalog can take a
+    # while, so it does not delay startup.
+    set_embedding_encoder(embedding_model)
+    embeddings_task = asyncio.create_task(init_semantic_index())
+    # Periodic offline rebuild of the item-item neighbour table (item-based CF)
+    item_neighbors_task = None
+    if ITEM_NEIGHBORS_REFRESH_SECONDS > 0:
+        item_neighbors_task = asyncio.create_task(run_item_neighbor_refresh_loop())
+    # Scheduled recomputation of every user's recommendations in one vectorised pass
+    batch_task = None
+    if BATCH_RECOMMENDATIONS_INTERVAL_SECONDS > 0:
+        batch_task = asyncio.create_task(run_batch_recommendations_loop())
+    yield
+    for task in (catalog_task, embeddings_task, item_neighbors_task, batch_task):
+        if task:
+            task.cancel()
+    await close_db_pool()
+    shutdown_hashing_pool()
+    shutdown_scoring_pool()
+    logger.info("Database pool closed")
+
 app = FastAPI(
     title="Internship Recommendation API",
     description="API for internship recommendation system",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -246,11 +315,13 @@ class Stats(BaseModel):
 # ---------------------
 # Helper functions
 # ---------------------
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# bcrypt runs on a bounded thread pool (password_hashing.py): await verify_password/get_password_hash
+def hashing_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication service is busy, please retry",
+        headers={"Retry-After": "1"},
+    )
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -287,8 +358,13 @@ async def get_current_active_user(current_user: dict = Depends(get_current_user)
 # ---------------------
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await get_user_by_username(form_data.username)
-    if not user or not verify_password(form_data.password, user["password_hash"]):
+    # The password hash is never cached: read it from the database
+    user = await get_user_by_username(form_data.username, use_cache=False)
+    try:
+        password_ok = bool(user) and await verify_password(form_data.password, user["password_hash"])
+    except HashingBusyError:
+        raise hashing_busy_exception()
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -301,7 +377,10 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 @app.post("/users", response_model=User)
 async def register_user(user: UserCreate):
-    hashed_password = get_password_hash(user.password)
+    try:
+        hashed_password = await get_password_hash(user.password)
+    except HashingBusyError:
+        raise hashing_busy_exception()
     user_id = await create_user(user.username, user.email, hashed_password)
     if not user_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username or email already exists")
@@ -426,40 +505,6 @@ async def upload_cv(file: UploadFile = File(...), current_user: dict = Depends(g
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement du CV: {str(e)}")
 
-import psycopg2
-import json
- 
-def save_keywords_to_db(user_id: int, domain: str, keywords: list):
-    try:
-        conn = psycopg2.connect(
-            dbname="postgres",
-            user="postgres",
-            password="Oumaima123",
-            host="localhost",
-            port=5432
-        )
-        cur = conn.cursor()
-
-        query = """
-        INSERT INTO cv_analysis (user_id, domain, keywords, created_at, updated_at)
-        VALUES (%s, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-        ON CONFLICT (user_id)
-        DO UPDATE SET
-            domain = EXCLUDED.domain,
-            keywords = EXCLUDED.keywords,
-            updated_at = CURRENT_TIMESTAMP;
-        """
-
-        cur.execute(query, (user_id, domain, json.dumps(keywords)))
-        conn.commit()
-        logger.info(f"Keywords for user_id {user_id} saved successfully.")
-    except Exception as e:
-        logger.error(f"Error saving keywords to DB: {str(e)}")
-        raise
-    finally:
-        cur.close()
-        conn.close()
-
 class SaveAnalysisRequest(BaseModel):
     domain: str
     keywords: List[str]
@@ -472,7 +517,10 @@ async def save_analysis(
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        save_keywords_to_db(current_user["id"], data.domain, data.keywords)
+        cv_id = await upsert_cv_keywords(current_user["id"], data.domain, data.keywords)
+        if cv_id is None:
+            raise HTTPException(status_code=500, detail="Failed to save CV analysis")
+        logger.info(f"Keywords for user_id {current_user['id']} saved successfully.")
 
         background_tasks.add_task(
             asyncio.create_task,
@@ -483,55 +531,19 @@ async def save_analysis(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
         
-from fastapi import Depends, HTTPException, status
-from typing import List
-import psycopg2
-import traceback
-from fastapi import HTTPException
-
 @app.get("/get_saved_analysis", response_model=List[CVAnalysis])
 async def get_saved_analysis(current_user: dict = Depends(get_current_active_user)):
-    
-    print("current_user =", current_user)
-    conn = None
-    cursor = None
-    try:
-        conn = psycopg2.connect(
-            dbname="postgres",
-            user="postgres",
-            password="Oumaima123",
-            host="localhost",
-            port=5432
-        )
+    analysis = await get_cv_analysis(current_user["id"])
 
-        with conn:
-            with conn.cursor() as cursor:
-                query = """
-                    SELECT user_id, domain, keywords
-                    FROM cv_analysis
-                    WHERE user_id = %s;
-                """
-                cursor.execute(query, (current_user["id"],))
-                rows = cursor.fetchall()
-
-        result = []
-        for _, domain, keywords in rows:
-          keywords_list = keywords if isinstance(keywords, list) else keywords.split(',') if keywords else []
-          some_message = "CV analysé avec succès"
-          some_filename = ""  # Remplacez par le nom de fichier réel si disponible
-          result.append(CVAnalysis(domain=domain, keywords=keywords_list, message=some_message, filename=some_filename))
-          print(f"[DEBUG] Résultat de l'analyse : {result}")
-        return result
-
-    except Exception as e:
-        traceback.print_exc()  
-        raise HTTPException(status_code=500, detail=str(e))
+    result = []
+    if analysis:
+        keywords = analysis["keywords"]
+        keywords_list = keywords if isinstance(keywords, list) else keywords.split(',') if keywords else []
+        some_message = "CV analysé avec succès"
+        some_filename = ""  # Remplacez par le nom de fichier réel si disponible
+        result.append(CVAnalysis(domain=analysis["domain"] or "", keywords=keywords_list, message=some_message, filename=some_filename))
+    return result
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 # ---------------------
 # Internship Scrapping Endpoint
 # ---------------------
@@ -586,6 +598,10 @@ async def enhanced_scrape_for_user_background(
             await scraper.scrape_for_user(user_id)
         
         logger.info(f"Enhanced scraping completed for user {user_id}")
+        # The scraper's save step already refreshed the catalog and listing vectors
+        # and scored the new listings; the embeddings need this process's encoder
+        await refresh_embedding_store()
+        await refresh_ann_index()
         
     except Exception as e:
         logger.error(f"Error in enhanced scraping for user {user_id}: {e}")
@@ -620,11 +636,96 @@ async def user_profile(email: str):
 # Recommendations Endpoints
 # ---------------------
 
+# Stored recommendations older than this are recomputed in the background
+RECOMMENDATIONS_TTL_SECONDS = float(os.getenv("RECOMMENDATIONS_TTL_SECONDS", "21600"))
+RECOMMENDATIONS_TOP_N = 20
+
+# Users whose recommendations are being recomputed (one background run per user at a time)
+_recomputing_users = set()
+
+def recommendations_stale_reason(state: dict) -> Optional[str]:
+    """Why the stored recommendations must be recomputed, or None if they are fresh."""
+    computed_at = state.get("computed_at")
+    if computed_at is None:
+        return "never computed"
+    if (datetime.now(timezone.utc) - computed_at).total_seconds() > RECOMMENDATIONS_TTL_SECONDS:
+        return "ttl expired"
+    for field, reason in (("cv_updated_at", "cv changed"), ("preferences_updated_at", "preferences changed")):
+        if state.get(field) and state[field] > computed_at:
+            return reason
+    store = get_listing_store()
+    if store is not None and store.updated_at > computed_at.timestamp():
+        return "catalog changed"
+    return None
+
+async def recompute_recommendations_background(user_id: int):
+    """Regenerate and store a user's recommendations, at most one run per user at a time."""
+    if user_id in _recomputing_users:
+        return
+    _recomputing_users.add(user_id)
+    try:
+        # Bypass the result cache: the stored rows (and their computedAt) must be rewritten
+        await generate_hybrid_recommendations(user_id, alpha=0.6, top_n=RECOMMENDATIONS_TOP_N, use_cache=False)
+    except Exception as e:
+        logger.error(f"Background recommendation refresh failed for user {user_id}: {e}")
+    finally:
+        _recomputing_users.discard(user_id)
+
 @app.get("/recommendations")
-async def get_recommendations(user_id: dict = Depends(get_current_active_user)): # Assuming you have auth/user_id extraction
-    logger.info(f"Frontend requested recommendations for user {user_id["id"]}. Triggering recalculation.")
-    calculated_recommendations = await generate_hybrid_recommendations(user_id["id"], alpha=0.6, top_n=20)
-    return {"recommendations": calculated_recommendations, "hasRecommendations": len(calculated_recommendations) > 0}
+async def get_recommendations(
+    background_tasks: BackgroundTasks,
+    content_mode: Optional[str] = None,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Stored recommendations of the user, served immediately (stale-while-revalidate).
+
+    A recomputation is scheduled in the background when the stored set is
+    older than RECOMMENDATIONS_TTL_SECONDS or predates the user's CV
+    analysis, preferences or the last catalog change. Only a user without
+    any stored recommendation waits for the computation.
+
+    Passing `content_mode` ("tfidf" or "semantic") ranks with that content
+    matching for this request instead of serving the stored set.
+    """
+    user_id = current_user["id"]
+
+    if content_mode is not None:
+        if content_mode not in ("tfidf", "semantic"):
+            raise HTTPException(status_code=400, detail="content_mode must be 'tfidf' or 'semantic'")
+        recommendations = await generate_hybrid_recommendations(
+            user_id, alpha=0.6, top_n=RECOMMENDATIONS_TOP_N, content_mode=content_mode
+        )
+        return {
+            "recommendations": recommendations,
+            "hasRecommendations": len(recommendations) > 0,
+            "computedAt": recommendations[0]["recommended_at"] if recommendations else None,
+            "isStale": False,
+        }
+    state = await get_recommendation_state(user_id)
+    stale_reason = recommendations_stale_reason(state)
+
+    if state.get("computed_at") is None:
+        logger.info(f"No stored recommendations for user {user_id}, computing them now.")
+        recommendations = await generate_hybrid_recommendations(user_id, alpha=0.6, top_n=RECOMMENDATIONS_TOP_N)
+        computed_at = recommendations[0]["recommended_at"] if recommendations else None
+        return {
+            "recommendations": recommendations,
+            "hasRecommendations": len(recommendations) > 0,
+            "computedAt": computed_at,
+            "isStale": False,
+        }
+
+    recommendations = await get_user_recommendations(user_id, limit=RECOMMENDATIONS_TOP_N, scored_only=True)
+    if stale_reason:
+        logger.info(f"Recommendations of user {user_id} are stale ({stale_reason}), refreshing in background.")
+        background_tasks.add_task(recompute_recommendations_background, user_id)
+    return {
+        "recommendations": recommendations,
+        "hasRecommendations": len(recommendations) > 0,
+        "computedAt": state["computed_at"],
+        "isStale": stale_reason is not None,
+    }
 
 
 # Pydantic models
@@ -638,19 +739,39 @@ class RecommendationResponse(BaseModel):
     is_saved: Optional[bool] = None
     is_viewed: Optional[bool] = None
 
+register_prepared_statement("mark_recommendation_viewed", """
+    INSERT INTO user_recommendations (user_id, internship_id, is_viewed, viewed_at)
+    VALUES ($1, $2, TRUE, NOW())
+    ON CONFLICT (user_id, internship_id) DO UPDATE
+    SET is_viewed = TRUE, viewed_at = NOW()
+""")
+
+register_prepared_statement("mark_recommendation_saved", """
+    INSERT INTO user_recommendations (user_id, internship_id, is_saved, saved_at)
+    VALUES ($1, $2, $3, CASE WHEN $3 = TRUE THEN NOW() ELSE NULL END)
+    ON CONFLICT (user_id, internship_id) DO UPDATE
+    SET is_saved = $3, saved_at = CASE WHEN $3 = TRUE THEN NOW() ELSE NULL END
+""")
+
+register_prepared_statement("update_recommendation_status", """
+    INSERT INTO user_recommendations (user_id, internship_id, is_saved, is_viewed, saved_at, viewed_at)
+    VALUES ($1, $2, COALESCE($3::boolean, FALSE), COALESCE($4::boolean, FALSE),
+            CASE WHEN $3::boolean THEN NOW() END, CASE WHEN $4::boolean THEN NOW() END)
+    ON CONFLICT (user_id, internship_id) DO UPDATE SET
+        is_saved = COALESCE($3::boolean, user_recommendations.is_saved),
+        saved_at = CASE WHEN $3::boolean IS NULL THEN user_recommendations.saved_at
+                        WHEN $3::boolean THEN NOW() ELSE NULL END,
+        is_viewed = COALESCE($4::boolean, user_recommendations.is_viewed),
+        viewed_at = CASE WHEN $4::boolean IS NULL THEN user_recommendations.viewed_at
+                         WHEN $4::boolean THEN NOW() ELSE NULL END
+    RETURNING is_saved, is_viewed
+""")
+
 async def mark_recommendation_viewed(user_id: int, listing_id: int, conn: asyncpg.Connection) -> bool:
     """Mark a recommendation as viewed in the database."""
     try:
-        await conn.execute(
-            """
-            INSERT INTO user_recommendations (user_id, internship_id, is_viewed, viewed_at)
-            VALUES ($1, $2, TRUE, NOW())
-            ON CONFLICT (user_id, internship_id) DO UPDATE
-            SET is_viewed = TRUE, viewed_at = NOW()
-            """,
-            user_id,
-            listing_id,
-        )
+        stmt = await conn.prepared("mark_recommendation_viewed")
+        await stmt.fetch(user_id, listing_id)
         return True
     except Exception as e:
         print(f"Error marking recommendation as viewed: {e}")
@@ -660,145 +781,25 @@ async def mark_recommendation_saved(user_id: int, listing_id: int, is_saved: boo
     """Mark a recommendation as saved/unsaved in the database."""
     try:
         # Use ON CONFLICT to handle both insert and update scenarios
-        await conn.execute(
-            """
-            INSERT INTO user_recommendations (user_id, internship_id, is_saved, saved_at)
-            VALUES ($1, $2, $3, CASE WHEN $3 = TRUE THEN NOW() ELSE NULL END)
-            ON CONFLICT (user_id, internship_id) DO UPDATE
-            SET is_saved = $3, saved_at = CASE WHEN $3 = TRUE THEN NOW() ELSE NULL END
-            """,
-            user_id,
-            listing_id,
-            is_saved,
-        )
+        stmt = await conn.prepared("mark_recommendation_saved")
+        await stmt.fetch(user_id, listing_id, is_saved)
         return True
     except Exception as e:
         print(f"Error updating recommendation saved status: {e}")
         return False
 
-async def update_recommendation_status(user_id: int, listing_id: int, conn: asyncpg.Connection, is_saved: Optional[bool] = None, is_viewed: Optional[bool] = None) -> bool:
-    """Update both saved and viewed status of a recommendation."""
-    updates = []
-    params = []
-    param_count = 1
-
-    if is_saved is not None:
-        updates.append(f"is_saved = ${param_count}")
-        params.append(is_saved)
-        param_count += 1
-        updates.append(f"saved_at = CASE WHEN ${param_count-1} = TRUE THEN NOW() ELSE NULL END")
-
-    if is_viewed is not None:
-        updates.append(f"is_viewed = ${param_count}")
-        params.append(is_viewed)
-        param_count += 1
-        updates.append(f"viewed_at = CASE WHEN ${param_count-1} = TRUE THEN NOW() ELSE NULL END")
-
-    if not updates:
-        return True  # Nothing to update
-
-    query = f"""
-    INSERT INTO user_recommendations (user_id, internship_id, {', '.join([u.split(' = ')[0] for u in updates if 'NOW()' not in u])}, viewed_at, saved_at)
-    VALUES ($1, $2, {', '.join([f'${i+3}' for i in range(len(params))])}, NOW(), 
-            CASE WHEN $4 = TRUE THEN NOW() ELSE NULL END, 
-            CASE WHEN $3 = TRUE THEN NOW() ELSE NULL END)
-    ON CONFLICT (user_id, internship_id) DO UPDATE
-    SET {', '.join(updates)}
-    """
+async def update_recommendation_status(user_id: int, listing_id: int, conn: asyncpg.Connection, is_saved: Optional[bool] = None, is_viewed: Optional[bool] = None) -> Optional[dict]:
+    """Update saved and/or viewed status of a recommendation in a single upsert.
 
-    set_clauses = []
-    current_param_idx = 3 # user_id and internship_id are $1, $2
-    if is_saved is not None:
-        set_clauses.append(f"is_saved = ${current_param_idx}")
-        set_clauses.append(f"saved_at = CASE WHEN ${current_param_idx} = TRUE THEN NOW() ELSE NULL END")
-        current_param_idx += 1
-    if is_viewed is not None:
-        set_clauses.append(f"is_viewed = ${current_param_idx}")
-        set_clauses.append(f"viewed_at = CASE WHEN ${current_param_idx} = TRUE THEN NOW() ELSE NULL END")
-        current_param_idx += 1
-
-    query = f"""
-    INSERT INTO user_recommendations (user_id, internship_id, is_saved, is_viewed, saved_at, viewed_at)
-    VALUES ($1, $2, $3, $4, CASE WHEN $3 = TRUE THEN NOW() ELSE NULL END, CASE WHEN $4 = TRUE THEN NOW() ELSE NULL END)
-    ON CONFLICT (user_id, internship_id) DO UPDATE
-    SET {', '.join(set_clauses)}
+    Fields left to None keep their current value. Returns the resulting
+    status, or None on error.
     """
     try:
-        update_params = []
-        update_set_clauses = []
-        update_param_idx = 1
-
-        if is_saved is not None:
-            update_set_clauses.append(f"is_saved = ${update_param_idx}")
-            update_params.append(is_saved)
-            update_param_idx += 1
-            update_set_clauses.append(f"saved_at = CASE WHEN ${update_param_idx-1} = TRUE THEN NOW() ELSE NULL END")
-
-        if is_viewed is not None:
-            update_set_clauses.append(f"is_viewed = ${update_param_idx}")
-            update_params.append(is_viewed)
-            update_param_idx += 1
-            update_set_clauses.append(f"viewed_at = CASE WHEN ${update_param_idx-1} = TRUE THEN NOW() ELSE NULL END")
-        
-
-        if update_set_clauses:
-            update_query = f"""
-            UPDATE user_recommendations
-            SET {', '.join(update_set_clauses)}
-            WHERE user_id = ${update_param_idx} AND internship_id = ${update_param_idx + 1}
-            """
-            result = await conn.execute(update_query, *update_params, user_id, listing_id)
-            if conn.row_count > 0:
-                return True
-
-        # If no row was updated (meaning it didn't exist), then insert
-        # Ensure we have values for both is_saved and is_viewed for INSERT
-        final_is_saved = is_saved if is_saved is not None else False
-        final_is_viewed = is_viewed if is_viewed is not None else False
-
-        insert_query = """
-        INSERT INTO user_recommendations (user_id, internship_id, is_saved, is_viewed, saved_at, viewed_at)
-        VALUES ($1, $2, $3, $4, CASE WHEN $3 = TRUE THEN NOW() ELSE NULL END, CASE WHEN $4 = TRUE THEN NOW() ELSE NULL END)
-        """
-        await conn.execute(insert_query, user_id, listing_id, final_is_saved, final_is_viewed)
-        return True
-
+        stmt = await conn.prepared("update_recommendation_status")
+        row = await stmt.fetchrow(user_id, listing_id, is_saved, is_viewed)
+        return {"is_saved": row["is_saved"], "is_viewed": row["is_viewed"]}
     except Exception as e:
         print(f"Error updating recommendation status: {e}")
-        return False
-
-async def get_recommendation_status(user_id: int, listing_id: int, conn: asyncpg.Connection) -> Optional[dict]:
-    """Get current status of a recommendation."""
-    try:
-        row = await conn.fetchrow(
-            """
-            SELECT is_saved, is_viewed, saved_at, viewed_at
-            FROM user_recommendations
-            WHERE user_id = $1 AND internship_id = $2
-            """,
-            user_id,
-            listing_id,
-        )
-        if row:
-            return {
-                "is_saved": row["is_saved"],
-                "is_viewed": row["is_viewed"],
-                "listing_id": listing_id,
-                "user_id": user_id,
-                "saved_at": row["saved_at"].isoformat() if row["saved_at"] else None,
-                "viewed_at": row["viewed_at"].isoformat() if row["viewed_at"] else None,
-            }
-        else:
-            return {
-                "is_saved": False,
-                "is_viewed": False,
-                "listing_id": listing_id,
-                "user_id": user_id,
-                "saved_at": None,
-                "viewed_at": None,
-            }
-    except Exception as e:
-        print(f"Error getting recommendation status: {e}")
         return None
 
 # API Endpoints
@@ -854,29 +855,26 @@ async def update_recommendation(
     conn: asyncpg.Connection = Depends(get_db_connection)
 ):
     """Update recommendation status (saved and/or viewed)."""
-    success = await update_recommendation_status(
+    latest_status = await update_recommendation_status(
         current_user["id"], 
         listing_id, 
-        update_data.is_saved, 
-        update_data.is_viewed,
-        conn
+        conn,
+        is_saved=update_data.is_saved, 
+        is_viewed=update_data.is_viewed
     )
     
-    if not success:
+    if latest_status is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update recommendation status"
         )
     
-    # Fetch the latest status to return accurate response
-    latest_status = await get_recommendation_status(current_user["id"], listing_id, conn)
-    if not latest_status:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Recommendation not found after update"
-        )
-    
-    return {"message": f"Recommendation {'saved' if is_saved else 'unsaved'}"}
+    return RecommendationResponse(
+        message="Recommendation status updated",
+        recommendation_id=listing_id,
+        is_saved=latest_status["is_saved"],
+        is_viewed=latest_status["is_viewed"]
+    )
 
 @app.delete("/recommendations/{listing_id}/save")
 async def unsave_recommendation(
@@ -1317,6 +1315,39 @@ async def chat(req: ChatRequest):
 async def health():
     return {"status": "healthy", "data_sources": len(data_sources)}
 
+# The /health/* endpoints expose internal counters: only hosts listed here may read them
+HEALTH_ALLOWED_HOSTS = {h.strip() for h in os.getenv("HEALTH_ALLOWED_HOSTS", "127.0.0.1,::1").split(",") if h.strip()}
+
+def require_internal_client(request: Request):
+    if request.client is None or request.client.host not in HEALTH_ALLOWED_HOSTS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Internal endpoint")
+
+@app.get("/health/db", dependencies=[Depends(require_internal_client)])
+async def health_db():
+    return {"pool": get_pool_stats()}
+
+@app.get("/health/cache", dependencies=[Depends(require_internal_client)])
+async def health_cache():
+    return {"users": get_user_cache_stats(), "recommendations": get_recommendation_cache_stats()}
+
+@app.get("/health/auth", dependencies=[Depends(require_internal_client)])
+async def health_auth():
+    return {"password_hashing": get_hashing_stats()}
+
+@app.get("/health/scoring", dependencies=[Depends(require_internal_client)])
+async def health_scoring():
+    return {"scoring": get_scoring_stats()}
+
+@app.get("/health/catalog", dependencies=[Depends(require_internal_client)])
+async def health_catalog():
+    """Size, watermark and memory footprint (bytes per column) of the in-memory listing catalog."""
+    return {"catalog": get_catalog_stats()}
+
+@app.get("/health/recommendations", dependencies=[Depends(require_internal_client)])
+async def health_recommendations():
+    """Per-stage latency and row-count histograms of generate_hybrid_recommendations."""
+    return {"recommendations": get_stage_stats()}
+
 
 # ---------------------
 # Root
@@ -0,0 +1,89 @@
+"""
+bcrypt hashing and verification off the event loop.
+
+bcrypt is deliberately CPU-expensive (100-300 ms per call at the default
+cost). Running it inline in async handlers blocks every other request, so
+calls are executed on a small dedicated thread pool (the bcrypt C extension
+releases the GIL) with a bound on the number of pending calls.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from passlib.context import CryptContext
+
+# bcrypt cost factor (log2 rounds) used for new hashes; existing hashes keep their own cost
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads dedicated to hashing: bounds the CPU auth traffic can take from the API
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+# Calls allowed to wait or run at once; beyond that requests are rejected (HTTP 503)
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_stats_lock = threading.Lock()
+_stats = {
+    "queued": 0,      # submitted, waiting for a worker
+    "running": 0,     # currently hashing
+    "completed": 0,
+    "rejected": 0,    # refused because BCRYPT_MAX_PENDING was reached
+    "max_queued": 0,  # high-water mark of the queue depth
+}
+
+
+class HashingBusyError(Exception):
+    """Raised when too many hashing calls are already pending."""
+
+
+def _tracked(fn: Callable[..., Any], *args) -> Any:
+    with _stats_lock:
+        _stats["queued"] -= 1
+        _stats["running"] += 1
+    try:
+        return fn(*args)
+    finally:
+        with _stats_lock:
+            _stats["running"] -= 1
+            _stats["completed"] += 1
+
+
+async def _run(fn: Callable[..., Any], *args) -> Any:
+    with _stats_lock:
+        if _stats["queued"] + _stats["running"] >= BCRYPT_MAX_PENDING:
+            _stats["rejected"] += 1
+            raise HashingBusyError("Too many pending password hashing operations")
+        _stats["queued"] += 1
+        _stats["max_queued"] = max(_stats["max_queued"], _stats["queued"])
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _tracked, fn, *args)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Check a password against its bcrypt hash on the hashing pool."""
+    return await _run(pwd_context.verify, plain_password, hashed_password)
+
+
+async def get_password_hash(password: str) -> str:
+    """Hash a password with bcrypt on the hashing pool."""
+    return await _run(pwd_context.hash, password)
+
+
+def get_hashing_stats() -> Dict[str, Any]:
+    """Queue depth and throughput counters of the hashing pool."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "workers": BCRYPT_WORKERS,
+        "max_pending": BCRYPT_MAX_PENDING,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+    })
+    return stats
+
+
+def shutdown_hashing_pool() -> None:
+    """Stop the hashing threads (application shutdown)."""
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -1,24 +1,80 @@
 import asyncio
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.neighbors import NearestNeighbors
+import scipy.sparse as sp
 import logging
 import json
 import datetime 
+import functools
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
 
 from database_schema import (
     get_db_pool,
     get_cv_analysis,
-    get_active_internship_listings,
     get_user_preferences,
     get_user_recommendations, 
+    get_internship_listings_by_ids,
+    get_scoring_listings,
+    upsert_recommendations,
+    SCORING_TEXT_COLUMNS,
 )
 
+from cache import TTLCache
+from listing_vectors import (
+    get_listing_store,
+    listing_texts,
+    field_weights,
+    TEXT_FIELDS,
+    weighted_queries,
+    ListingVectorStore,
+    LISTING_VECTORS_PATH,
+)
+from item_similarity import get_item_neighbor_index, ItemNeighborIndex, ITEM_NEIGHBORS_PATH
+from listing_embeddings import (
+    get_embedding_store, get_embedding_encoder, encode_texts,
+    ListingEmbeddingStore, LISTING_EMBEDDINGS_PATH,
+)
+from scoring_pool import run_scoring, uses_scoring_processes, ScoringBusyError, ScoringTimeoutError
+from listing_ann import get_ann_index
+from listing_catalog import get_listing_catalog
+from stage_timings import StageTimer
+
 logger = logging.getLogger("recommendation_engine")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
+# Collaborative filtering flavour: "user" (neighbour users at request time) or
+# "item" (lookup in the precomputed item neighbour table, see item_similarity.py)
+CF_MODE = os.getenv("CF_MODE", "user")
+# Content matching: "tfidf" (keyword vectors) or "semantic" (multilingual sentence
+# embeddings, see listing_embeddings.py)
+CONTENT_MODE = os.getenv("CONTENT_MODE", "tfidf")
+# Listing fields returned with each recommendation
+DISPLAY_FIELDS = ("title", "company", "location", "country", "platform", "description", "skills", "domain", "link")
+# Content candidates retrieved per request before blending (0 scores the whole catalog)
+RECOMMENDATION_CANDIDATES = int(os.getenv("RECOMMENDATION_CANDIDATES", "500"))
+
+# Ranked results per user, reused while the fingerprint of their inputs is unchanged
+_results_cache = TTLCache(
+    maxsize=int(os.getenv("RECOMMENDATION_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "3600")),
+    name="recommendations",
+)
+def get_recommendation_cache_stats():
+    """Hit/miss counters of the recommendation result cache."""
+    return _results_cache.stats()
+
+def recommendation_fingerprint(keywords, user_prefs, alpha, top_n, cf_mode, catalog_version, model_version=None, content_mode=None, domain=None,
+                               interactions_version=None) -> str:
+    """Digest of every input of a recommendation run; equal digests give equal rankings."""
+    prefs = {k: v for k, v in (user_prefs or {}).items() if k not in ("id", "user_id", "created_at", "updated_at")}
+    payload = [sorted(str(k) for k in keywords), prefs, alpha, top_n, cf_mode,
+               catalog_version, model_version, content_mode, domain, interactions_version]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
 # --- Helper Functions ---
 
 def safe_get(data, key, default=""):
@@ -43,8 +99,97 @@ def normalize_scores(scores):
 
 # --- Content-Based Filtering ---
 
-async def calculate_content_scores(user_id: int, user_profile: dict, all_listings_df: pd.DataFrame, user_prefs: dict):
-    """Calculates content-based scores for all active listings for a given user."""
+def semantic_query_text(user_profile: dict) -> str:
+    """Text embedded for semantic matching: the CV keywords followed by the CV domain."""
+    keywords = (user_profile or {}).get("keywords")
+    keywords_str = " ".join(str(k) for k in keywords) if isinstance(keywords, list) else ""
+    return " ".join(filter(None, [keywords_str, (user_profile or {}).get("domain")]))
+
+async def retrieve_candidate_ids(user_id: int, user_profile: dict, content_mode: str, n_candidates: int,
+                                 saved_item_ids=None, all_interactions=None, item_index=None, weights=None):
+    """
+    Listings worth scoring for a user, instead of the whole catalog.
+
+    The top `n_candidates` content matches (ANN search over the listing
+    embeddings in semantic mode, sparse TF-IDF top-k with the user's field
+    `weights` otherwise), plus every listing that can get a collaborative
+    score: neighbours of the user's saved listings (item CF) or listings
+    saved by the users who co-saved one of theirs (user CF).
+    Returns (candidate_ids, query_embedding, content_hits), content_hits being
+    the (ids, scores, store version) of the TF-IDF top-k, reused by scoring;
+    (None, None, None) when no index is available and the whole catalog must be scored.
+    """
+    keywords = (user_profile or {}).get("keywords")
+    if n_candidates <= 0 or not isinstance(keywords, list) or not keywords:
+        return None, None, None
+
+    query_embedding = None
+    store_version = None
+    if content_mode == "semantic":
+        ann = get_ann_index()
+        if ann is None:
+            return None, None, None
+        query_embedding = (await asyncio.to_thread(encode_texts, [semantic_query_text(user_profile)]))[0]
+        search = functools.partial(ann.search, query_embedding, n_candidates)
+    else:
+        store = get_listing_store()
+        if store is None:
+            return None, None, None
+        store_version = store.version
+        search = functools.partial(store.top_k, " ".join(str(k) for k in keywords), n_candidates, weights)
+    # The search scans the whole catalog: run it, and the merge, off the event loop
+    candidate_ids, content_ids, content_scores = await asyncio.to_thread(
+        _merge_candidates, search, user_id, saved_item_ids, all_interactions, item_index,
+    )
+    content_hits = (content_ids, content_scores, store_version) if store_version is not None else None
+    return candidate_ids, query_embedding, content_hits
+
+def _merge_candidates(search, user_id, saved_item_ids, all_interactions, item_index):
+    """
+    (sorted candidate IDs, content IDs, content scores): the content matches
+    returned by `search()` plus the listings that can get a collaborative score.
+    """
+    content_ids, content_scores = search()
+    candidates = {int(i) for i in content_ids}
+    if item_index is not None and saved_item_ids:
+        saved = np.asarray(saved_item_ids, dtype=np.int64)
+        rows = np.searchsorted(item_index.item_ids, saved[np.isin(saved, item_index.item_ids)])
+        candidates.update(int(i) for i in item_index.neighbor_ids[rows].ravel() if i >= 0)
+    if all_interactions:
+        # User CF only scores listings saved by users sharing a save with this user (the
+        # others have similarity 0); their whole rows keep the neighbour similarities exact
+        pairs = np.asarray(all_interactions, dtype=np.int64).reshape(-1, 2)
+        own_items = pairs[pairs[:, 0] == user_id, 1]
+        co_savers = np.unique(pairs[np.isin(pairs[:, 1], own_items), 0])
+        candidates.update(pairs[np.isin(pairs[:, 0], co_savers), 1].tolist())
+    return sorted(candidates), content_ids, content_scores
+
+def _text_records(listings_df: pd.DataFrame) -> list:
+    """ID and text fields of every row as dicts, NULLs as "" (country/platform may be categorical, so left out)."""
+    return listings_df.reindex(columns=list(TEXT_FIELDS)).fillna("").reset_index().to_dict("records")
+
+def _category_multipliers(column: pd.Series, weights: dict) -> np.ndarray:
+    """Weight of each listing's country or platform (1.0 when unset); categorical columns are looked up by code."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        lookup = np.array([weights.get(c, 1.0) for c in column.cat.categories] + [1.0], dtype=np.float64)
+        return lookup[column.cat.codes.to_numpy()]
+    return column.map(lambda v: weights.get(v, 1.0)).fillna(1.0).values
+
+def compute_content_scores(user_id: int, user_profile: dict, all_listings_df: pd.DataFrame, user_prefs: dict,
+                           content_mode: str = None, query_embedding: np.ndarray = None,
+                           listing_store=None, embedding_store=None, listing_rows: np.ndarray = None,
+                           known_scores: tuple = None):
+    """Calculates content-based scores for all active listings for a given user.
+
+    Pure and synchronous (safe to run on a scoring worker): the listing vectors
+    and embeddings are passed in and never modified.
+    `all_listings_df` is read only, so callers can pass the shared DataFrame without copying it.
+    `content_mode` selects TF-IDF ("tfidf") or embedding ("semantic") matching; semantic
+    matching needs `embedding_store` and the user's `query_embedding`, and falls back
+    to TF-IDF without them. `listing_rows` (rows of the listings in `listing_store`,
+    from the listing catalog) saves looking each ID up; `known_scores` (ids, scores)
+    are TF-IDF scores already computed by candidate retrieval, not computed again.
+    """
     logger.info(f"Calculating content scores for user {user_id}")
 
     if all_listings_df.empty:
@@ -86,20 +231,44 @@ async def calculate_content_scores(user_id: int, user_profile: dict, all_listing
     # --- Proceed with keyword processing and scoring --- 
     user_keywords_str = " ".join(keywords_list)
 
-    # Prepare listing texts
-    all_listings_df["combined_text"] = all_listings_df.apply(
-        lambda row: f"{safe_get(row, 'title')} {safe_get(row, 'description')} {safe_get(row, 'skills')} {safe_get(row, 'domain')}",
-        axis=1
-    )
-    # Handle potential NaN values in combined_text
-    all_listings_df["combined_text"] = all_listings_df["combined_text"].fillna("")
-
-
-    # Vectorize using TF-IDF
-    vectorizer = TfidfVectorizer(stop_words='english')
-    listing_vectors = vectorizer.fit_transform(all_listings_df["combined_text"])
-    user_vector = vectorizer.transform([user_keywords_str])
-    content_similarity = cosine_similarity(user_vector, listing_vectors).flatten()
+    content_mode = content_mode or CONTENT_MODE
+    store = listing_store
+    if content_mode == "semantic" and embedding_store is not None and query_embedding is not None:
+        # One embedding of the CV keywords and domain, then a single matrix-vector product
+        content_similarity = np.maximum(embedding_store.score_vector(query_embedding, all_listings_df.index.values), 0.0)
+    elif store is not None:
+        # Weighted sum of the title/skills/domain/description cosines, with the stored weights
+        weights = field_weights(user_prefs) if store.field_matrix is not None else None
+        if listing_rows is None:
+            listing_rows = store.rows_for(all_listings_df.index.values)
+        content_similarity = np.zeros(len(listing_rows), dtype=np.float32)
+        todo = np.ones(len(listing_rows), dtype=bool)
+        if known_scores is not None:
+            known_ids, known_values = known_scores
+            positions = all_listings_df.index.get_indexer(known_ids)
+            hit = positions >= 0
+            content_similarity[positions[hit]] = known_values[hit]
+            todo[positions[hit]] = False
+        # Only the rows without a known score are multiplied
+        if todo.any():
+            content_similarity[todo] = store.score(user_keywords_str, weights=weights, rows=listing_rows[todo])
+        # Listings inserted since the last refresh are vectorised here with the fitted
+        # vocabulary; the shared store is left untouched (the next refresh adds them)
+        missing = listing_rows < 0
+        if missing.any():
+            missing_df = all_listings_df[missing]
+            query = store.transform_query(user_keywords_str)
+            if weights is None:
+                vectors = store.vectorizer.transform(listing_texts(missing_df)).astype(np.float32)
+            else:
+                vectors = store.transform_fields(_text_records(missing_df))
+                query = weighted_queries(query, weights)
+            content_similarity[missing] = (vectors @ query.T).toarray().ravel()
+    else:
+        # No persisted vectors yet: fit TF-IDF on the fly, on a local store (the caller's DataFrame is not modified)
+        logger.warning("Listing vector store not initialised, fitting TF-IDF for this request.")
+        local_store = ListingVectorStore.build(_text_records(all_listings_df))
+        content_similarity = local_store.score(user_keywords_str, weights=field_weights(user_prefs))
     scores = content_similarity
     if user_prefs:
         country_weights = user_prefs.get("country_weights", {})
@@ -114,8 +283,8 @@ async def calculate_content_scores(user_id: int, user_profile: dict, all_listing
             except json.JSONDecodeError: platform_weights = {}
 
         # Default weight is 1.0 if not specified in prefs
-        country_multipliers = all_listings_df["country"].map(lambda c: country_weights.get(c, 1.0)).fillna(1.0).values
-        platform_multipliers = all_listings_df["platform"].map(lambda p: platform_weights.get(p, 1.0)).fillna(1.0).values
+        country_multipliers = _category_multipliers(all_listings_df["country"], country_weights)
+        platform_multipliers = _category_multipliers(all_listings_df["platform"], platform_weights)
 
         # Apply multipliers (ensure scores don't exceed 1 if similarity is already 1)
         scores = np.minimum(scores * country_multipliers * platform_multipliers, 1.0)
@@ -124,6 +293,18 @@ async def calculate_content_scores(user_id: int, user_profile: dict, all_listing
     logger.info(f"Finished calculating content scores for user {user_id}")
     return content_scores_series
 
+async def calculate_content_scores(user_id: int, user_profile: dict, all_listings_df: pd.DataFrame, user_prefs: dict, content_mode: str = None, query_embedding: np.ndarray = None):
+    """compute_content_scores with the process-wide listing vectors and embeddings.
+
+    The user's embedding is computed off the event loop when semantic matching needs it.
+    """
+    content_mode = content_mode or CONTENT_MODE
+    embedding_store = get_embedding_store() if content_mode == "semantic" else None
+    if embedding_store is not None and query_embedding is None and get_embedding_encoder() is not None:
+        query_embedding = (await asyncio.to_thread(encode_texts, [semantic_query_text(user_profile)]))[0]
+    return compute_content_scores(user_id, user_profile, all_listings_df, user_prefs, content_mode,
+                                  query_embedding, get_listing_store(), embedding_store)
+
 # --- Collaborative Filtering (User-Based) ---
 
 async def get_all_user_interactions():
@@ -145,8 +326,94 @@ async def get_all_user_interactions():
         if conn: await pool.release(conn)
     return interactions
 
-async def calculate_collaborative_scores(user_id: int, all_listings_df: pd.DataFrame, all_interactions: list, n_neighbors=10):
-    """Calculates user-based collaborative filtering scores."""
+async def get_interactions_version(user_id: int = None):
+    """
+    (count, latest saved_at) of the saved internships, of one user or of everyone.
+
+    Changes with every save and unsave, whichever process recorded it, so
+    cached rankings are keyed on it. None when it could not be read.
+    """
+    pool = await get_db_pool()
+    try:
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT COUNT(*) AS saves, MAX(saved_at) AS last_saved_at
+                FROM user_recommendations
+                WHERE is_saved = TRUE AND ($1::int IS NULL OR user_id = $1)
+            """, user_id)
+        return (row["saves"], row["last_saved_at"])
+    except Exception as e:
+        logger.error(f"Error fetching the interactions version: {e}")
+        return None
+
+async def get_user_saved_items(user_id: int):
+    """IDs of the internships saved by one user."""
+    pool = await get_db_pool()
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT internship_id
+                FROM user_recommendations
+                WHERE user_id = $1 AND is_saved = TRUE
+            """, user_id)
+        return [row["internship_id"] for row in rows]
+    except Exception as e:
+        logger.error(f"Error fetching saved items for user {user_id}: {e}")
+        return []
+
+def build_interaction_matrix(all_interactions, valid_item_ids=None):
+    """
+    Binary user x item matrix of saves as a scipy CSR matrix.
+
+    Returns (matrix, user_ids, item_ids) where row r is user user_ids[r] and
+    column c is listing item_ids[c]. Interactions on listings outside
+    `valid_item_ids` are dropped; duplicates count once.
+    """
+    pairs = np.asarray(all_interactions, dtype=np.int64).reshape(-1, 2)
+    if valid_item_ids is not None and len(pairs):
+        pairs = pairs[np.isin(pairs[:, 1], np.asarray(valid_item_ids, dtype=np.int64))]
+    user_ids, user_idx = np.unique(pairs[:, 0], return_inverse=True)
+    item_ids, item_idx = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sp.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (user_idx, item_idx)),
+        shape=(len(user_ids), len(item_ids)),
+    )
+    matrix.data[:] = 1.0  # duplicates were summed by the constructor
+    return matrix, user_ids, item_ids
+
+def find_similar_users(matrix: sp.csr_matrix, user_row: int, n_neighbors: int = 10):
+    """
+    Top-n users by cosine similarity to `user_row` on a binary CSR matrix.
+
+    Only users sharing at least one item with the target are considered
+    (everyone else has similarity 0), found through the CSC columns of the
+    target's items, so the cost depends on those items' popularity rather
+    than on the number of users. Returns (rows, similarities), best first.
+    """
+    target_items = matrix.indices[matrix.indptr[user_row]:matrix.indptr[user_row + 1]]
+    if len(target_items) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    by_item = matrix.tocsc()
+    co_users = np.concatenate([by_item.indices[by_item.indptr[j]:by_item.indptr[j + 1]] for j in target_items])
+    candidates, overlap = np.unique(co_users, return_counts=True)
+    keep = candidates != user_row
+    candidates, overlap = candidates[keep], overlap[keep]
+    if len(candidates) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    row_sizes = np.diff(matrix.indptr)
+    similarities = (overlap / np.sqrt(row_sizes[candidates] * len(target_items))).astype(np.float32)
+    if len(candidates) > n_neighbors:
+        top = np.argpartition(-similarities, n_neighbors - 1)[:n_neighbors]
+        candidates, similarities = candidates[top], similarities[top]
+    order = np.argsort(-similarities)
+    return candidates[order], similarities[order]
+
+def compute_collaborative_scores(user_id: int, all_listings_df: pd.DataFrame, all_interactions: list, n_neighbors=10):
+    """Calculates user-based collaborative filtering scores (pure; `all_listings_df` is read only).
+
+    The interaction matrix is kept sparse (CSR) end to end: neither the
+    user x item matrix nor the neighbour predictions are densified.
+    """
     logger.info(f"Calculating collaborative scores for user {user_id}")
 
     if all_listings_df.empty:
@@ -157,95 +424,326 @@ async def calculate_collaborative_scores(user_id: int, all_listings_df: pd.DataF
         logger.warning("No interaction data available. Skipping collaborative filtering.")
         return pd.Series(0.0, index=all_listings_df.index)
 
-    # Create user-item interaction matrix (implicit feedback: 1 if saved, 0 otherwise)
-    interactions_df = pd.DataFrame(all_interactions, columns=["user_id", "internship_id"])
-    interactions_df["saved"] = 1
-    # Ensure internship_id is present in all_listings_df index for pivoting
-    valid_interactions = interactions_df[interactions_df['internship_id'].isin(all_listings_df.index)]
-    if valid_interactions.empty:
+    # Create user-item interaction matrix (implicit feedback: 1 if saved, 0 otherwise),
+    # restricted to listings currently being scored
+    user_item_matrix, user_ids, item_ids = build_interaction_matrix(all_interactions, all_listings_df.index.values)
+    if user_item_matrix.nnz == 0:
         logger.warning("No valid interactions found matching current listings. Skipping collaborative filtering.")
         return pd.Series(0.0, index=all_listings_df.index)
-    try:
-        user_item_matrix = valid_interactions.pivot_table(index="user_id", columns="internship_id", values="saved", fill_value=0)
-    except Exception as e:
-        logger.error(f"Error creating user-item matrix: {e}. Check for duplicate interactions.")
-        # Handle duplicates: group by user/item and take max (or first)
-        valid_interactions = valid_interactions.groupby(['user_id', 'internship_id']).max().reset_index()
-        user_item_matrix = valid_interactions.pivot_table(index="user_id", columns="internship_id", values="saved", fill_value=0)
-
 
-    if user_id not in user_item_matrix.index:
+    user_row = np.searchsorted(user_ids, user_id)
+    if user_row >= len(user_ids) or user_ids[user_row] != user_id:
         logger.warning(f"User {user_id} has no interactions with current listings. Skipping collaborative filtering.")
         return pd.Series(0.0, index=all_listings_df.index)
 
-    # Fit k-NN model (cosine similarity on user vectors)
-    effective_n_neighbors = min(n_neighbors + 1, user_item_matrix.shape[0])
-    if effective_n_neighbors <= 1:
-         logger.warning(f"Not enough users ({user_item_matrix.shape[0]}) for collaborative filtering with k={n_neighbors}. Skipping.")
-         return pd.Series(0.0, index=all_listings_df.index)
+    # Find neighbors for the target user (cosine similarity on user vectors)
+    neighbor_rows, neighbor_similarities = find_similar_users(user_item_matrix, user_row, n_neighbors)
+    if len(neighbor_rows) == 0:
+        logger.warning(f"User {user_id} has no similar neighbors found. Skipping collaborative filtering.")
+        return pd.Series(0.0, index=all_listings_df.index)
 
-    knn_model = NearestNeighbors(metric='cosine', algorithm='brute', n_neighbors=effective_n_neighbors)
-    knn_model.fit(user_item_matrix)
+    # Predict scores as the similarity-weighted average of the neighbors' saves
+    weighted = sp.csr_matrix(neighbor_similarities.reshape(1, -1)) @ user_item_matrix[neighbor_rows]
+    weighted = weighted.tocoo()
+    weighted_scores = pd.Series(weighted.data / neighbor_similarities.sum(), index=item_ids[weighted.col])
 
-    # Find neighbors for the target user
-    try:
-        user_index = user_item_matrix.index.get_loc(user_id)
-        distances, indices = knn_model.kneighbors(user_item_matrix.iloc[user_index, :].values.reshape(1, -1))
+    collab_scores_series = weighted_scores.reindex(all_listings_df.index, fill_value=0.0)
+
+    logger.info(f"Finished calculating collaborative scores for user {user_id}")
+    return collab_scores_series
+
+async def calculate_collaborative_scores(user_id: int, all_listings_df: pd.DataFrame, all_interactions: list, n_neighbors=10):
+    return compute_collaborative_scores(user_id, all_listings_df, all_interactions, n_neighbors)
 
-        # Exclude self from neighbors
-        neighbor_indices = indices.flatten()[1:]
-        neighbor_distances = distances.flatten()[1:]
-        if len(neighbor_indices) == 0:
-            logger.warning(f"User {user_id} has no similar neighbors found. Skipping collaborative filtering.")
-            return pd.Series(0.0, index=all_listings_df.index)
 
-        neighbor_similarities = 1 - neighbor_distances # Convert distance to similarity
-        neighbor_user_ids = user_item_matrix.index[neighbor_indices]
+# --- Collaborative Filtering (Item-Based) ---
 
-    except Exception as e:
-        logger.error(f"Error finding neighbors for user {user_id}: {e}")
+def compute_item_collaborative_scores(user_id: int, all_listings_df: pd.DataFrame, saved_item_ids: list, index):
+    """Item-based CF scores: for each listing, the sum of its precomputed similarities
+    to the listings the user saved (`index`, an ItemNeighborIndex). No model is fitted
+    at request time.
+    """
+    logger.info(f"Calculating item-based collaborative scores for user {user_id}")
+
+    if all_listings_df.empty:
+        logger.warning(f"No listings provided for collaborative scoring for user {user_id}.")
+        return pd.Series(dtype=float)
+
+    if index is None or not saved_item_ids:
+        logger.warning(f"No item neighbour table or no saves for user {user_id}. Skipping collaborative filtering.")
         return pd.Series(0.0, index=all_listings_df.index)
 
-    # Predict scores based on neighbors' interactions
-    neighbor_interactions = user_item_matrix.loc[neighbor_user_ids]
-    sim_sum = np.sum(neighbor_similarities)
-    if sim_sum == 0:
-         weighted_scores = neighbor_interactions.mean(axis=0)
+    scores = index.score(saved_item_ids, all_listings_df.index.values)
+    logger.info(f"Finished calculating item-based collaborative scores for user {user_id}")
+    return pd.Series(scores, index=all_listings_df.index)
+
+async def calculate_item_collaborative_scores(user_id: int, all_listings_df: pd.DataFrame, saved_item_ids: list, index=None):
+    index = index if index is not None else get_item_neighbor_index()
+    return compute_item_collaborative_scores(user_id, all_listings_df, saved_item_ids, index)
+
+
+# --- Scoring core (runs on the scoring pool) ---
+
+def select_top_n(listing_ids: np.ndarray, scores: np.ndarray, top_n: int, excluded_ids=None):
+    """
+    The `top_n` best (listing_id, score) pairs, best first, as two arrays.
+
+    Excluded IDs, NaN and near-zero scores are dropped. Uses argpartition, so
+    only the selected N are sorted.
+    """
+    keep = scores > 1e-6  # also drops NaN
+    if excluded_ids:
+        keep &= ~np.isin(listing_ids, np.fromiter(excluded_ids, dtype=np.int64, count=len(excluded_ids)))
+    candidate_rows = np.flatnonzero(keep)
+    n = min(top_n, len(candidate_rows))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    candidate_scores = scores[candidate_rows]
+    top = np.argpartition(-candidate_scores, n - 1)[:n]
+    top = top[np.argsort(-candidate_scores[top], kind="stable")]
+    rows = candidate_rows[top]
+    return listing_ids[rows].astype(np.int64), scores[rows]
+
+@dataclass
+class ScoringTask:
+    """Everything the scoring core needs for one user, already fetched from the database."""
+    user_id: int
+    listings_df: pd.DataFrame
+    user_profile: dict
+    user_prefs: dict
+    alpha: float
+    top_n: int
+    content_mode: str = "tfidf"
+    query_embedding: Optional[np.ndarray] = None
+    cf_mode: str = "user"
+    all_interactions: list = field(default_factory=list)
+    saved_item_ids: list = field(default_factory=list)
+    excluded_ids: set = field(default_factory=set)
+    # Rows of the listings in the listing vector store of version `listing_rows_version`
+    # (from the listing catalog); ignored by a worker holding another version
+    listing_rows: Optional[np.ndarray] = None
+    listing_rows_version: Optional[int] = None
+    # (ids, scores, store version) of the TF-IDF candidate retrieval, reused for those listings
+    content_hits: Optional[tuple] = None
+    # Process-wide models; left None when the task is sent to a scoring process,
+    # which loads them from their files instead
+    listing_store: Any = None
+    embedding_store: Any = None
+    item_index: Any = None
+
+# Models loaded from disk by a scoring process, with the mtime of their file
+_disk_models = {}
+
+def _load_from_disk(name: str, path: str, loader):
+    """Model saved at `path`, reloaded when the file changed; None if it does not exist."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _disk_models.get(name)
+    if cached is None or cached[0] != mtime:
+        try:
+            cached = (mtime, loader(path))
+        except Exception as e:
+            logger.error(f"Scoring worker could not load {path}: {e}")
+            return cached[1] if cached else None
+        _disk_models[name] = cached
+    return cached[1]
+
+def _resolve_models(task: ScoringTask):
+    if not uses_scoring_processes():
+        return task.listing_store, task.embedding_store, task.item_index
+    listing_store = _load_from_disk("listing_vectors", LISTING_VECTORS_PATH, ListingVectorStore.load)
+    embedding_store = None
+    if task.content_mode == "semantic":
+        embedding_store = _load_from_disk("listing_embeddings", LISTING_EMBEDDINGS_PATH, ListingEmbeddingStore.load)
+    item_index = None
+    if task.cf_mode == "item":
+        item_index = _load_from_disk("item_neighbors", ITEM_NEIGHBORS_PATH, ItemNeighborIndex.load)
+    return listing_store, embedding_store, item_index
+
+def score_user(task: ScoringTask):
+    """
+    Pure, CPU-bound part of a recommendation run: content and collaborative
+    scores, normalisation, blending and ranking. Returns (top_ids, top_scores,
+    stages_ms), the last one holding the duration of each step in ms. No
+    database access and no event loop, so it can run on a thread or process pool.
+    """
+    user_id = task.user_id
+    all_listings_df = task.listings_df
+    stages_ms = {}
+    started = time.perf_counter()
+    listing_store, embedding_store, item_index = _resolve_models(task)
+    listing_rows = None
+    if listing_store is not None and listing_store.version == task.listing_rows_version:
+        listing_rows = task.listing_rows
+    known_scores = None
+    if listing_store is not None and task.content_hits is not None and listing_store.version == task.content_hits[2]:
+        known_scores = task.content_hits[:2]
+
+    # 2. Calculate Content-Based Scores
+    content_started = time.perf_counter()
+    content_scores = compute_content_scores(
+        user_id, task.user_profile, all_listings_df, task.user_prefs, task.content_mode,
+        task.query_embedding, listing_store, embedding_store, listing_rows, known_scores,
+    )
+    stages_ms["score_models"] = (content_started - started) * 1000
+
+    # 3. Calculate Collaborative Filtering Scores
+    collab_started = time.perf_counter()
+    stages_ms["score_content"] = (collab_started - content_started) * 1000
+    if task.cf_mode == "item":
+        collab_scores = compute_item_collaborative_scores(user_id, all_listings_df, task.saved_item_ids, item_index)
     else:
-      
-        weighted_scores = neighbor_interactions.multiply(neighbor_similarities, axis=0).sum(axis=0) / sim_sum
+        collab_scores = compute_collaborative_scores(user_id, all_listings_df, task.all_interactions)
+    rank_started = time.perf_counter()
+    stages_ms["score_collaborative"] = (rank_started - collab_started) * 1000
 
+    # From here on: parallel arrays of listing IDs and scores (both scorers align on all_listings_df.index)
+    listing_ids = all_listings_df.index.to_numpy()
+    content_values = content_scores.to_numpy(dtype=np.float64)
+    collab_values = collab_scores.to_numpy(dtype=np.float64)
 
-    collab_scores_series = pd.Series(0.0, index=all_listings_df.index)
-    valid_items = weighted_scores.index.intersection(collab_scores_series.index)
-    collab_scores_series.loc[valid_items] = weighted_scores[valid_items]
+    # 4. Normalize Scores (handle cases where one score type is all zeros)
+    norm_content_scores = normalize_scores(content_values) if np.any(content_values > 0) else content_values
+    norm_collab_scores = normalize_scores(collab_values) if np.any(collab_values > 0) else collab_values
 
-    logger.info(f"Finished calculating collaborative scores for user {user_id}")
-    return collab_scores_series
+    # 5. Combine Scores (Weighted Hybrid)
+    hybrid_scores = task.alpha * norm_content_scores + (1 - task.alpha) * norm_collab_scores
+
+    # 6. Filter out already interacted items and Rank
+    top_ids, top_scores = select_top_n(listing_ids, hybrid_scores, task.top_n, task.excluded_ids)
+    stages_ms["score_blend_rank"] = (time.perf_counter() - rank_started) * 1000
+    return top_ids, top_scores, stages_ms
 
 
 # --- Hybrid Recommendation Generation ---
 
-async def generate_hybrid_recommendations(user_id: int, alpha: float = 0.6, top_n: int = 10):
-    logger.info(f"Generating hybrid recommendations for user {user_id} with alpha={alpha}")
-
-    # 1. Fetch necessary data
-    pool = await get_db_pool() 
-    conn = None
+def _catalog_scoring_inputs(catalog, candidate_ids, limit, store):
+    """(catalog rows, scoring frame, listing vector rows) of the listings to score (blocking)."""
+    catalog_rows = catalog.rows(candidate_ids, limit=limit)
+    listings_df = catalog.scoring_frame(catalog_rows, with_text=store is None)
+    listing_rows = catalog.vector_rows(store)[catalog_rows] if store is not None else None
+    return catalog_rows, listings_df, listing_rows
+
+def _catalog_records(catalog, listing_ids):
+    """Display records of `listing_ids` from the catalog (blocking)."""
+    return catalog.records(catalog.rows(listing_ids))
+
+async def generate_hybrid_recommendations(user_id: int, alpha: float = 0.6, top_n: int = 10, cf_mode: str = None, use_cache: bool = True, content_mode: str = None):
+    """
+    Top-N hybrid recommendations of a user, saved to user_recommendations.
+
+    Every run is timed per stage (database fetches, candidate retrieval,
+    scoring steps, hydration, save) with its row counts; the timings are
+    logged as one line and aggregated in stage_timings.
+    """
+    timer = StageTimer("recommendations")
+    try:
+        return await _generate_hybrid_recommendations(user_id, alpha, top_n, cf_mode, use_cache, content_mode, timer)
+    except Exception:
+        timer.outcome = "error"
+        raise
+    finally:
+        timer.emit(logger, user_id=user_id)
+
+async def _generate_hybrid_recommendations(user_id: int, alpha: float, top_n: int, cf_mode: Optional[str],
+                                           use_cache: bool, content_mode: Optional[str], timer: StageTimer):
+    cf_mode = cf_mode or CF_MODE
+    item_index = get_item_neighbor_index() if cf_mode == "item" else None
+    if cf_mode == "item" and item_index is None:
+        logger.warning("Item neighbour table not built yet, falling back to user-based collaborative filtering.")
+        cf_mode = "user"
+    content_mode = content_mode or CONTENT_MODE
+    embedding_store = get_embedding_store() if content_mode == "semantic" else None
+    if content_mode == "semantic" and (embedding_store is None or get_embedding_encoder() is None):
+        logger.warning("Listing embeddings not available yet, falling back to TF-IDF content matching.")
+        content_mode = "tfidf"
+        embedding_store = None
+    logger.info(f"Generating hybrid recommendations for user {user_id} with alpha={alpha}, cf_mode={cf_mode}, content_mode={content_mode}")
+
+    # 1. Fetch necessary data (each helper borrows its own connection from the shared pool)
     user_profile = None 
     user_prefs = None
-    all_listings = []
+    all_listings_df = None
+    catalog = get_listing_catalog()
+    catalog_rows = None
     all_interactions = []
+    saved_item_ids = []
     user_existing_recs = []
     interacted_item_ids = set()
 
     try:
-        conn = await pool.acquire()
-        user_profile = await get_cv_analysis(user_id) # Assumes uses external pool or manages its own
-        user_prefs = await get_user_preferences(user_id)
-        all_listings = await get_active_internship_listings(limit=5000) # Consider pagination/chunking for very large sets
-        all_interactions = await get_all_user_interactions() # Fetches saved items
-        user_existing_recs = await get_user_recommendations(user_id) # Assumes this returns list of dicts {internship_id: X, ...}
+        with timer.stage("fetch_profile"):
+            user_profile = await get_cv_analysis(user_id) # Assumes uses external pool or manages its own
+            user_prefs = await get_user_preferences(user_id)
+    except Exception as e:
+        logger.error(f"Error fetching initial data for user {user_id}: {e}")
+        timer.outcome = "error"
+        return []
+
+    # Same inputs as a cached run: return it without scoring
+    cache_key = None
+    store = get_listing_store()
+    keywords = (user_profile or {}).get("keywords")
+    if store is not None and isinstance(keywords, list):
+        model_version = item_index.built_at if item_index is not None else None
+        catalog_version = (
+            store.version,
+            embedding_store.version if embedding_store is not None else None,
+            # Rows fetched and hydrated from the listing catalog change with its refreshes
+            catalog.version if catalog is not None else None,
+        )
+        with timer.stage("cache_lookup"):
+            # Item CF only reads this user's saves; user CF reads everyone's
+            interactions_version = await get_interactions_version(user_id if cf_mode == "item" else None)
+            if interactions_version is not None:
+                cache_key = (user_id, recommendation_fingerprint(
+                    keywords, user_prefs, alpha, top_n, cf_mode, catalog_version, model_version,
+                    content_mode, user_profile.get("domain"), interactions_version,
+                ))
+            cached = _results_cache.get(cache_key) if use_cache and cache_key is not None else None
+        if cached is not None:
+            logger.info(f"Serving cached recommendations for user {user_id}")
+            timer.outcome = "cached"
+            timer.count("recommendations", len(cached))
+            return [dict(rec) for rec in cached]
+
+    query_embedding = None
+    listing_rows = None
+    try:
+        with timer.stage("fetch_interactions"):
+            if cf_mode == "item":
+                saved_item_ids = await get_user_saved_items(user_id) # Only this user's saves are needed
+            else:
+                all_interactions = await get_all_user_interactions() # Fetches saved items
+        timer.count("interactions_loaded", len(saved_item_ids) if cf_mode == "item" else len(all_interactions))
+        # Score only the retrieved candidates; the whole (capped) catalog when no index is ready
+        with timer.stage("candidates"):
+            candidate_ids, query_embedding, content_hits = await retrieve_candidate_ids(
+                user_id, user_profile, content_mode, RECOMMENDATION_CANDIDATES,
+                saved_item_ids, all_interactions, item_index, field_weights(user_prefs),
+            )
+        if candidate_ids is not None:
+            timer.count("candidates", len(candidate_ids))
+        # Only the scoring columns are read; display fields are hydrated for the final N.
+        # Without listing vectors, texts are needed too and the catalog stays capped.
+        # The in-memory listing catalog serves them once loaded; Postgres until then.
+        with timer.stage("fetch_listings"):
+            limit = 5000 if candidate_ids is None and store is None else None
+            if catalog is not None:
+                # Row lookups and frame building are CPU work: keep them off the event loop
+                catalog_rows, all_listings_df, listing_rows = await asyncio.to_thread(
+                    _catalog_scoring_inputs, catalog, candidate_ids, limit, store,
+                )
+            else:
+                if candidate_ids is not None:
+                    all_listings = await get_scoring_listings(listing_ids=candidate_ids)
+                else:
+                    all_listings = await get_scoring_listings(limit=limit, with_text=store is None)
+                all_listings_df = pd.DataFrame(all_listings).set_index("id")
+        with timer.stage("fetch_existing"):
+            user_existing_recs = await get_user_recommendations(user_id) # Assumes this returns list of dicts {internship_id: X, ...}
         interacted_item_ids = {rec["internship_id"] for rec in user_existing_recs} if user_existing_recs else set()
 
         if not user_profile or not user_profile.get("keywords"):
@@ -259,135 +757,131 @@ async def generate_hybrid_recommendations(user_id: int, alpha: float = 0.6, top_
              
              if not temp_keywords_list or not isinstance(temp_keywords_list, list):
                  logger.warning(f"User {user_id} has no valid CV analysis (keywords). Cannot generate recommendations.")
+                 timer.outcome = "no_profile"
                  return [] 
 
     except Exception as e:
         logger.error(f"Error fetching initial data for user {user_id}: {e}")
-
-        if conn: await pool.release(conn) 
-        
+        timer.outcome = "error"
         return [] 
-    finally:
-        if conn: await pool.release(conn)
 
-    if not all_listings:
+    if len(all_listings_df) == 0:
         logger.warning("No active internship listings found.")
+        timer.outcome = "no_listings"
         return []
 
-    all_listings_df = pd.DataFrame(all_listings)
-    if "id" not in all_listings_df.columns:
-         logger.error("Column 'id' not found in listings dataframe.")
-         return []
-    if all_listings_df.index.name != "id":
-        all_listings_df.set_index("id", inplace=True, drop=False) # Keep id column
-    if all_listings_df.index.isnull().any():
-        logger.warning("Found null values in listing IDs, removing them.")
-        all_listings_df = all_listings_df[all_listings_df.index.notnull()]
-
-    if all_listings_df.empty:
-        logger.warning("No valid listings remain after cleaning.")
+    timer.count("listings_scored", len(all_listings_df))
+
+    if store is not None:
+        if catalog is None:
+            listing_rows = await asyncio.to_thread(store.rows_for, all_listings_df.index.values)
+        # Listings scraped since the last vector refresh are vectorised at scoring time: fetch their texts
+        missing = listing_rows < 0
+        if missing.any():
+            with timer.stage("fetch_texts"):
+                if catalog is not None:
+                    texts_df = await asyncio.to_thread(catalog.scoring_frame, catalog_rows[missing], True)
+                else:
+                    texts_df = pd.DataFrame(await get_scoring_listings(
+                        listing_ids=all_listings_df.index[missing].tolist(), with_text=True,
+                    )).set_index("id")
+            all_listings_df = all_listings_df.join(texts_df[list(SCORING_TEXT_COLUMNS)])
+            timer.count("texts_fetched", int(missing.sum()))
+
+    if embedding_store is not None and query_embedding is None:
+        # The encoder lives in this process: embed the user here, not on the scoring pool
+        with timer.stage("embed_query"):
+            query_embedding = (await asyncio.to_thread(encode_texts, [semantic_query_text(user_profile)]))[0]
+
+    # 2-6. Score, blend and rank on the scoring pool (CPU-bound, off the event loop)
+    task = ScoringTask(
+        user_id=user_id,
+        listings_df=all_listings_df,
+        user_profile=user_profile,
+        user_prefs=user_prefs,
+        alpha=alpha,
+        top_n=top_n,
+        content_mode=content_mode,
+        query_embedding=query_embedding,
+        cf_mode=cf_mode,
+        all_interactions=all_interactions,
+        saved_item_ids=saved_item_ids,
+        excluded_ids=interacted_item_ids,
+        listing_rows=listing_rows,
+        listing_rows_version=store.version if store is not None else None,
+        content_hits=content_hits,
+    )
+    if not uses_scoring_processes():
+        task.listing_store = store
+        task.embedding_store = embedding_store
+        task.item_index = item_index
+    try:
+        # Includes the wait for a free worker; the score_* stages are the scoring itself
+        with timer.stage("scoring"):
+            top_ids, top_scores, scoring_stages = await run_scoring(score_user, task)
+    except (ScoringBusyError, ScoringTimeoutError) as e:
+        logger.error(f"Scoring skipped for user {user_id}: {e}")
+        timer.outcome = "scoring_skipped"
         return []
-
-    # 2. Calculate Content-Based Scores
-    # Pass the already fetched user_profile and user_prefs
-    content_scores = await calculate_content_scores(user_id, user_profile, all_listings_df.copy(), user_prefs)
-
-    # 3. Calculate Collaborative Filtering Scores
-    # Pass the already fetched all_interactions
-    collab_scores = await calculate_collaborative_scores(user_id, all_listings_df.copy(), all_interactions)
-
-    # Ensure scores are aligned to the same index (all_listings_df.index)
-    content_scores = content_scores.reindex(all_listings_df.index, fill_value=0.0)
-    collab_scores = collab_scores.reindex(all_listings_df.index, fill_value=0.0)
-
-    # 4. Normalize Scores (handle cases where one score type is all zeros)
-    norm_content_scores = normalize_scores(content_scores.values) if np.any(content_scores.values > 0) else content_scores.values
-    norm_collab_scores = normalize_scores(collab_scores.values) if np.any(collab_scores.values > 0) else collab_scores.values
-
-    content_scores_norm_series = pd.Series(norm_content_scores, index=content_scores.index)
-    collab_scores_norm_series = pd.Series(norm_collab_scores, index=collab_scores.index)
-
-    # 5. Combine Scores (Weighted Hybrid)
-    hybrid_scores = alpha * content_scores_norm_series + (1 - alpha) * collab_scores_norm_series
-
-    # 6. Filter out already interacted items and Rank
-    # Ensure interacted_item_ids are valid listing IDs present in the index
-    valid_interacted_ids = interacted_item_ids.intersection(hybrid_scores.index)
-    hybrid_scores_filtered = hybrid_scores.drop(index=valid_interacted_ids, errors='ignore') # Use errors='ignore'
-    top_recommendations = hybrid_scores_filtered.nlargest(top_n)
-
-    # 7. Format and Save Results
+    timer.add_stages(scoring_stages)
+
+    # 7. Format and Save Results: display fields are hydrated for the final N rows only,
+    # from the catalog or in one `id = ANY($1)` query
+    recommended_at = datetime.datetime.now(datetime.timezone.utc)
+    with timer.stage("hydrate"):
+        if catalog is not None:
+            hydrated = {row["id"]: row for row in await asyncio.to_thread(_catalog_records, catalog, top_ids)}
+        else:
+            hydrated = {row["id"]: row for row in await get_internship_listings_by_ids(top_ids.tolist())}
+    format_started = time.perf_counter()
     recommendations_to_save = []
     final_recommendations = []
-    # Use the DataFrame directly for lookup
-
-    for listing_id, score in top_recommendations.items():
-        if pd.isna(score) or score <= 1e-6: # Skip NaN or near-zero scores
+    for listing_id, score in zip(top_ids.tolist(), top_scores.tolist()):
+        listing_info = hydrated.get(listing_id)
+        if listing_info is None:
+            logger.warning(f"Listing ID {listing_id} is no longer active, skipping it.")
             continue
-
-        # Use .loc for safe lookup
-        try:
-            # Ensure listing_id is of the correct type for indexing (usually int)
-            listing_info = all_listings_df.loc[int(listing_id)].to_dict()
-        except (KeyError, ValueError) as e:
-            logger.warning(f"Listing ID {listing_id} not found or invalid in DataFrame during formatting: {e}")
-            continue
-
-        if listing_info:
-            rec_data = {
-                "user_id": user_id,
-                "internship_id": int(listing_id), 
-                "similarity_score": float(score), 
-                "recommended_at": datetime.datetime.now(datetime.timezone.utc),
-                "is_viewed": False,
-                "is_saved": False
-            }
-            recommendations_to_save.append(rec_data)
-            api_rec = {
-                "id": int(listing_id),
-                "title": listing_info.get("title", ""),
-                "company": listing_info.get("company", ""),
-                "location": listing_info.get("location", ""),
-                "country": listing_info.get("country", ""),
-                "platform": listing_info.get("platform", ""),
-                "description": listing_info.get("description", ""),
-                "skills": listing_info.get("skills", ""),
-                "domain": listing_info.get("domain", ""),
-                "link": listing_info.get("link", ""),
-                "similarity_score": float(score),
-                "recommended_at": rec_data["recommended_at"],
-                "is_viewed": False,
-                "is_saved": False
-            }
-            final_recommendations.append(api_rec)
-
+        recommendations_to_save.append({
+            "user_id": user_id,
+            "internship_id": listing_id,
+            "similarity_score": score,
+            "recommended_at": recommended_at,
+            "is_viewed": False,
+            "is_saved": False
+        })
+        api_rec = {"id": listing_id}
+        for field_name in DISPLAY_FIELDS:
+            api_rec[field_name] = listing_info.get(field_name, "")
+        api_rec.update({
+            "similarity_score": score,
+            "recommended_at": recommended_at,
+            "is_viewed": False,
+            "is_saved": False
+        })
+        final_recommendations.append(api_rec)
+
+    timer.add_stages({"format": (time.perf_counter() - format_started) * 1000})
 
     # Save recommendations to database
     if recommendations_to_save:
-        pool = await get_db_pool()
-        conn = None
         try:
-            conn = await pool.acquire()
-            data_tuples = [
-                (r["user_id"], r["internship_id"], r["similarity_score"],
-                 r["recommended_at"], r["is_viewed"], r["is_saved"])
-                for r in recommendations_to_save
-            ]
-            await conn.executemany("""
-                INSERT INTO user_recommendations (user_id, internship_id, similarity_score, recommended_at, is_viewed, is_saved)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                ON CONFLICT (user_id, internship_id) DO UPDATE SET
-                    similarity_score = EXCLUDED.similarity_score,
-                    recommended_at = EXCLUDED.recommended_at,
-                    is_viewed = FALSE, -- Reset viewed/saved status on new recommendation
-                    is_saved = FALSE
-            """, data_tuples)
-            logger.info(f"Saved/Updated {len(recommendations_to_save)} recommendations for user {user_id}")
+            with timer.stage("save"):
+                saved = await upsert_recommendations([
+                    (r["user_id"], r["internship_id"], r["similarity_score"], r["recommended_at"])
+                    for r in recommendations_to_save
+                ])
+            timer.count("recommendations_written", saved)
+            logger.info(f"Saved/Updated {saved} recommendations for user {user_id}")
         except Exception as e:
             logger.error(f"Error saving recommendations for user {user_id}: {e}")
-        finally:
-            if conn: await pool.release(conn)
+            timer.outcome = "save_failed"
+
+    if cache_key is not None:
+        # Results computed from older inputs of this user can no longer be served: evict them
+        _results_cache.invalidate_where(lambda key, _: key[0] == user_id and key != cache_key)
+        _results_cache.set(cache_key, [dict(rec) for rec in final_recommendations])
 
+    timer.count("recommendations", len(final_recommendations))
     logger.info(f"Generated {len(final_recommendations)} recommendations for user {user_id}")
     return final_recommendations
 
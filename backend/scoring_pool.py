@@ -0,0 +1,102 @@
+"""
+Recommendation scoring off the event loop.
+
+The scoring core (recommendation.score_user) is pure CPU work: sparse
+products, NumPy and pandas. Running it inline in an async handler stalls
+every other request, so it is submitted to a dedicated executor with a bound
+on pending runs and a timeout. The default thread pool suits the mostly
+GIL-releasing NumPy/SciPy work and shares the in-memory models; a process
+pool (SCORING_EXECUTOR=process) isolates the CPU completely, its workers
+loading the models from their files.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# "thread" or "process"
+SCORING_EXECUTOR = os.getenv("SCORING_EXECUTOR", "thread")
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "2"))
+# Runs allowed to wait or run at once; beyond that scoring is refused
+SCORING_MAX_PENDING = int(os.getenv("SCORING_MAX_PENDING", "32"))
+# Seconds a caller waits for a scoring run before giving up
+SCORING_TIMEOUT_SECONDS = float(os.getenv("SCORING_TIMEOUT_SECONDS", "30"))
+
+_executor: Optional[Executor] = None
+_stats_lock = threading.Lock()
+_stats = {
+    "pending": 0,      # submitted and not finished (waiting or running)
+    "completed": 0,
+    "rejected": 0,     # refused because SCORING_MAX_PENDING was reached
+    "timeouts": 0,     # callers that stopped waiting (the run itself still finishes)
+    "max_pending": 0,  # high-water mark of pending runs
+}
+
+
+class ScoringBusyError(Exception):
+    """Raised when too many scoring runs are already pending."""
+
+
+class ScoringTimeoutError(Exception):
+    """Raised when a scoring run did not finish within SCORING_TIMEOUT_SECONDS."""
+
+
+def uses_scoring_processes() -> bool:
+    return SCORING_EXECUTOR == "process"
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if uses_scoring_processes():
+            _executor = ProcessPoolExecutor(max_workers=SCORING_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=SCORING_WORKERS, thread_name_prefix="scoring")
+    return _executor
+
+
+def _finished(_future) -> None:
+    with _stats_lock:
+        _stats["pending"] -= 1
+        _stats["completed"] += 1
+
+
+async def run_scoring(fn: Callable[..., Any], *args, timeout: float = SCORING_TIMEOUT_SECONDS) -> Any:
+    """Run `fn(*args)` on the scoring pool; `fn` and its arguments must be picklable in process mode."""
+    with _stats_lock:
+        if _stats["pending"] >= SCORING_MAX_PENDING:
+            _stats["rejected"] += 1
+            raise ScoringBusyError("Too many pending recommendation scoring runs")
+        _stats["pending"] += 1
+        _stats["max_pending"] = max(_stats["max_pending"], _stats["pending"])
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_get_executor(), fn, *args)
+    future.add_done_callback(_finished)
+    try:
+        # shield: a timed-out run keeps its slot until it really finishes
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        with _stats_lock:
+            _stats["timeouts"] += 1
+        raise ScoringTimeoutError(f"Recommendation scoring took more than {timeout}s")
+
+
+def get_scoring_stats() -> Dict[str, Any]:
+    """Queue depth and throughput counters of the scoring pool."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "executor": SCORING_EXECUTOR,
+        "workers": SCORING_WORKERS,
+        "max_pending_allowed": SCORING_MAX_PENDING,
+        "timeout_seconds": SCORING_TIMEOUT_SECONDS,
+    })
+    return stats
+
+
+def shutdown_scoring_pool() -> None:
+    """Stop the scoring workers (application shutdown)."""
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,151 @@
+"""
+Per-stage timings and row counts of recommendation runs.
+
+A StageTimer measures the phases of one run (database fetches, scoring,
+hydration, save...) and the rows each one handled. At the end of the run it
+is logged as one line, with the values also passed as structured `extra`
+fields, and folded into process-wide histograms reported by
+get_stage_stats() (see the /health/recommendations endpoint).
+"""
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence
+
+# Upper bounds of the latency buckets, in milliseconds (a last bucket catches the rest)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Upper bounds of the row-count buckets
+COUNT_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+class Histogram:
+    """Per-bucket (non-cumulative) counts plus count/sum/max of the observed values."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (the max for the overflow bucket)."""
+        if self.count == 0:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.bounds, self.buckets):
+            seen += n
+            if seen >= rank:
+                return float(bound)
+        return self.max
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b:g}" for b in self.bounds] + ["inf"]
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class StageRegistry:
+    """Histograms of every stage and row count seen so far, plus run outcomes. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Histogram] = {}
+        self._counts: Dict[str, Histogram] = {}
+        self._outcomes: Dict[str, int] = {}
+
+    def record(self, stages_ms: Dict[str, float], counts: Dict[str, int], outcome: str) -> None:
+        with self._lock:
+            for name, ms in stages_ms.items():
+                self._stages.setdefault(name, Histogram(LATENCY_BUCKETS_MS)).observe(ms)
+            for name, n in counts.items():
+                self._counts.setdefault(name, Histogram(COUNT_BUCKETS)).observe(n)
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "outcomes": dict(self._outcomes),
+                "stages_ms": {name: h.snapshot() for name, h in self._stages.items()},
+                "counts": {name: h.snapshot() for name, h in self._counts.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._counts.clear()
+            self._outcomes.clear()
+
+
+class StageTimer:
+    """Stage durations (ms) and row counts of one run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages_ms: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.outcome = "ok"
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block; a stage entered twice accumulates."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages_ms[name] = self.stages_ms.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def add_stages(self, stages_ms: Dict[str, float]) -> None:
+        """Merge stages timed elsewhere (e.g. returned by a scoring worker)."""
+        for name, ms in stages_ms.items():
+            self.stages_ms[name] = self.stages_ms.get(name, 0.0) + ms
+
+    def count(self, name: str, n: int) -> None:
+        self.counts[name] = int(n)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def emit(self, logger: logging.Logger, registry: Optional[StageRegistry] = None, **fields) -> None:
+        """Log the run as one line (also as `extra` fields) and add it to the histograms."""
+        stages = dict(self.stages_ms, total=self.total_ms())
+        registry = registry if registry is not None else _registry
+        registry.record(stages, self.counts, self.outcome)
+        parts = [f"{k}={v}" for k, v in fields.items()]
+        parts.append(f"outcome={self.outcome}")
+        parts += [f"{k}_ms={v:.1f}" for k, v in stages.items()]
+        parts += [f"{k}={v}" for k, v in self.counts.items()]
+        logger.info(
+            f"{self.name} timings: " + " ".join(parts),
+            extra={"stages_ms": stages, "counts": dict(self.counts), "outcome": self.outcome, **fields},
+        )
+
+
+_registry = StageRegistry()
+
+
+def get_stage_stats() -> dict:
+    """Histograms of the recorded runs (stage latencies in ms, row counts, outcomes)."""
+    return _registry.snapshot()
+
+
+def reset_stage_stats() -> None:
+    _registry.reset()